@@ -1,113 +1,383 @@
+import os
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 import pandas as pd
 import numpy as np
 
+from engine import (
+    RelOp, REL_OPS, LogicOp, LOGIC_OPS, SimplePredicate, CompoundPredicate,
+    LogicEngine, JobCancelled, STAGE_LABELS, format_bytes, format_seconds, read_queries,
+)
+from jobs import JobRunner
+from loader import columns_to_load, dataset_columns, open_dataset, read_dataset
+
 # ----------------------------
-#   Estructuras de predicados
+#     Vista de matrices
 # ----------------------------
 
-class RelOp:
-    GT = ">"
-    LT = "<"
-    EQ = "="
-    NE = "!="
-    GE = ">="
-    LE = "<="
-    CONTAINS = "contains"
-    STARTS_WITH = "starts_with"
-    ENDS_WITH = "ends_with"
-
-REL_OPS = [
-    RelOp.EQ, RelOp.GT, RelOp.LT, RelOp.GE, RelOp.LE, RelOp.NE,
-    RelOp.CONTAINS, RelOp.STARTS_WITH, RelOp.ENDS_WITH
-]
-
-class LogicOp:
-    NOT = "NOT"
-    AND = "AND"
-    OR = "OR"
-    IMPLIES = "IMPLIES"
-    XOR = "XOR"
-    BICONDITIONAL = "BICONDITIONAL"
-
-LOGIC_OPS = [
-    LogicOp.NOT, LogicOp.AND, LogicOp.OR,
-    LogicOp.IMPLIES, LogicOp.XOR, LogicOp.BICONDITIONAL
-]
-
-class SimplePredicate:
-    """p(x,y) o p(x,const). Estructura serializable en dict."""
-    def __init__(self, name, attr, op, lhs_var, rhs):
-        self.type = "simple"
-        self.name = name          # "p" (minúsculas)
-        self.attr = attr          # columna del df
-        self.op = op              # RelOp
-        self.lhs_var = lhs_var    # "X"
-        self.rhs = rhs            # {"type":"var","var":"Y"} o {"type":"const","value":..}
-
-    def caption(self):
-        # Notación tipo libro: descripción en español de p(x,y) o p(x)
-        if self.rhs["type"] == "var":
-            return f'{self.name}(x,y): "{self._describe_comparison(self.attr, self.op)}"'
+INFO_TABLE_MAX_ROWS = 1000     # filas de las tablas de valores junto a la matriz
+TRUE_RGB = (144, 238, 144)     # lightgreen
+FALSE_RGB = (240, 128, 128)    # lightcoral
+NO_QUANTIFIER = "—"            # cuantificador Y vacío: consulta sólo sobre x
+RESULT_TREE_MAX_ROWS = 5000    # filas de la tabla de resultados (Exportar escribe todas)
+
+def _density_colors(density):
+    """Colores '#rrggbb' interpolando de F (rojo) a V (verde) según la fracción de V."""
+    t = np.clip(np.asarray(density, dtype=float), 0.0, 1.0)[..., None]
+    rgb = (np.array(FALSE_RGB) * (1 - t) + np.array(TRUE_RGB) * t).astype(int)
+    return np.char.add("#", np.char.mod("%06x", (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]))
+
+def _photo_from_colors(colors):
+    """tk.PhotoImage a partir de una matriz de colores '#rrggbb'."""
+    image = tk.PhotoImage(width=colors.shape[1], height=colors.shape[0])
+    if colors.size:
+        image.put(" ".join("{" + " ".join(row) + "}" for row in colors))
+    return image
+
+class MatrixCanvasView:
+    """
+    Vista virtualizada de una matriz de verdad sobre un único tk.Canvas: sólo
+    se dibujan las celdas visibles y se redibuja al desplazarse o hacer zoom.
+    Con celdas pequeñas se dibuja un raster, y la vista general muestra la
+    densidad de V de toda la matriz ajustada a la ventana.
+    """
+    HEADER_W = 110         # ancho de la columna de etiquetas x
+    HEADER_H = 24          # alto de la fila de etiquetas y
+    ZOOM_LEVELS = [1, 2, 3, 4, 6, 8, 12, 16, 22, 30, 40]
+    RECT_MIN_CELL = 12     # por debajo se dibuja como raster
+    TEXT_MIN_CELL = 22     # por debajo no se escribe V/F ni las etiquetas
+
+    def __init__(self, parent, matrix, row_labels, col_labels):
+        self.matrix = matrix
+        self.row_labels = row_labels
+        self.col_labels = col_labels
+        self.n_rows, self.n_cols = matrix.shape
+        self.zoom = self.ZOOM_LEVELS.index(30)
+        self.top = 0           # primera fila visible
+        self.left = 0          # primera columna visible
+        self.overview = self.n_rows * self.n_cols > 1000 * 1000
+        self._images = []      # referencias para que Tk no libere los PhotoImage
+        self._overview_cache = None
+
+        self.frame = ttk.Frame(parent)
+        toolbar = ttk.Frame(self.frame)
+        toolbar.grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 4))
+        ttk.Button(toolbar, text="Zoom +", command=lambda: self.set_zoom(self.zoom + 1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Zoom −", command=lambda: self.set_zoom(self.zoom - 1)).pack(side=tk.LEFT, padx=2)
+        self.overview_button = ttk.Button(toolbar, command=self.toggle_overview)
+        self.overview_button.pack(side=tk.LEFT, padx=2)
+        self.range_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.range_var, foreground="gray").pack(side=tk.LEFT, padx=8)
+
+        self.canvas = tk.Canvas(self.frame, background="white", highlightthickness=0)
+        self.ybar = ttk.Scrollbar(self.frame, orient="vertical", command=self._yview)
+        self.xbar = ttk.Scrollbar(self.frame, orient="horizontal", command=self._xview)
+        self.canvas.grid(row=1, column=0, sticky="nsew")
+        self.ybar.grid(row=1, column=1, sticky="ns")
+        self.xbar.grid(row=2, column=0, sticky="ew")
+        self.frame.grid_rowconfigure(1, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Shift-MouseWheel>", lambda e: self._on_wheel(e, horizontal=True))
+        self.canvas.bind("<Button-4>", lambda e: self._scroll_rows(-3))
+        self.canvas.bind("<Button-5>", lambda e: self._scroll_rows(3))
+        self.canvas.bind("<Button-1>", self._on_click)
+
+    # ---------- geometría ----------
+    @property
+    def cell(self):
+        return self.ZOOM_LEVELS[self.zoom]
+
+    def _header_sizes(self):
+        if self.cell >= self.TEXT_MIN_CELL:
+            return self.HEADER_W, self.HEADER_H
+        return 0, 0
+
+    def _visible_counts(self):
+        hw, hh = self._header_sizes()
+        width = max(1, self.canvas.winfo_width() - hw)
+        height = max(1, self.canvas.winfo_height() - hh)
+        return max(1, height // self.cell), max(1, width // self.cell)
+
+    def _clamp(self):
+        rows, cols = self._visible_counts()
+        self.top = max(0, min(self.top, self.n_rows - rows))
+        self.left = max(0, min(self.left, self.n_cols - cols))
+
+    # ---------- navegación ----------
+    def set_zoom(self, level):
+        level = max(0, min(level, len(self.ZOOM_LEVELS) - 1))
+        if level != self.zoom or self.overview:
+            self.zoom = level
+            self.overview = False
+            self.redraw()
+
+    def toggle_overview(self):
+        self.overview = not self.overview
+        self.redraw()
+
+    def _scroll_rows(self, delta):
+        self.top += delta
+        self.redraw()
+
+    def _scroll_cols(self, delta):
+        self.left += delta
+        self.redraw()
+
+    def _on_wheel(self, event, horizontal=False):
+        step = -3 if event.delta > 0 else 3
+        if horizontal:
+            self._scroll_cols(step)
         else:
-            return f'{self.name}(x): "{self._describe_const(self.attr, self.op, self.rhs["value"])}"'
-
-    def _describe_comparison(self, attr, op):
-        attr_text = attr
-        desc_map = {
-            RelOp.GT: f"tiene mayor {attr_text} que y",
-            RelOp.LT: f"tiene menor {attr_text} que y",
-            RelOp.GE: f"tiene {attr_text} mayor o igual que y",
-            RelOp.LE: f"tiene {attr_text} menor o igual que y",
-            RelOp.EQ: f"tiene el mismo {attr_text} que y",
-            RelOp.NE: f"tiene un {attr_text} diferente al de y",
-            RelOp.CONTAINS: f"{attr_text} de x contiene al de y",
-            RelOp.STARTS_WITH: f"{attr_text} de x comienza igual que el de y",
-            RelOp.ENDS_WITH: f"{attr_text} de x termina igual que el de y",
-        }
-        return f"x {desc_map.get(op, f'tiene {attr_text} {op} y.{attr_text}')}."
-
-    def _describe_const(self, attr, op, value):
-        attr_text = attr
-        desc_map = {
-            RelOp.GT: f"tiene {attr_text} mayor que {value}",
-            RelOp.LT: f"tiene {attr_text} menor que {value}",
-            RelOp.GE: f"tiene {attr_text} mayor o igual que {value}",
-            RelOp.LE: f"tiene {attr_text} menor o igual que {value}",
-            RelOp.EQ: f"tiene {attr_text} igual a {value}",
-            RelOp.NE: f"tiene {attr_text} diferente de {value}",
-            RelOp.CONTAINS: f"{attr_text} contiene '{value}'",
-            RelOp.STARTS_WITH: f"{attr_text} comienza con '{value}'",
-            RelOp.ENDS_WITH: f"{attr_text} termina con '{value}'",
-        }
-        return f"x {desc_map.get(op, f'tiene {attr_text} {op} {value}')}."
-
-class CompoundPredicate:
-    """P(x,y) = NOT p(x,y)  |  p(x,y) AND q(x,y)  |  p(x,y) OR q(x,y) ..."""
-    def __init__(self, name, op, args):
-        self.type = "compound"
-        self.name = name          # "P" (mayúsculas)
-        self.op = op              # LogicOp
-        self.args = args          # lista de nombres de predicados
-
-    def caption(self):
-        # Notación tipo libro: P(x,y): p(x,y) AND q(x,y)
-        if self.op == LogicOp.NOT:
-            return f"{self.name}(x,y): NOT({self.args[0]}(x,y))"
-        if self.op == LogicOp.IMPLIES:
-            if len(self.args) == 1:
-                return f"{self.name}(x,y): {self.args[0]}(x,y) IMPLIES {self.args[0]}(x,y)"
-            return f"{self.name}(x,y): {self.args[0]}(x,y) IMPLIES {self.args[1]}(x,y)"
-        if self.op == LogicOp.XOR and len(self.args) == 2:
-            return f"{self.name}(x,y): {self.args[0]}(x,y) XOR {self.args[1]}(x,y)"
-        if self.op == LogicOp.BICONDITIONAL and len(self.args) == 2:
-            return f"{self.name}(x,y): {self.args[0]}(x,y) BICONDITIONAL {self.args[1]}(x,y)"
-        if len(self.args) == 2:
-            return f"{self.name}(x,y): {self.args[0]}(x,y) {self.op} {self.args[1]}(x,y)"
-        elif len(self.args) == 1:
-            return f"{self.name}(x,y): {self.op}({self.args[0]}(x,y))"
-        return f"{self.name}: {self.op}({', '.join(self.args)})"
+            self._scroll_rows(step)
+
+    def _view_command(self, args, visible, total, current):
+        if not args:
+            return current
+        if args[0] == "moveto":
+            return int(float(args[1]) * total)
+        if args[0] == "scroll":
+            amount = int(args[1])
+            return current + (amount * visible if args[2] == "pages" else amount)
+        return current
+
+    def _yview(self, *args):
+        rows, _ = self._visible_counts()
+        self.top = self._view_command(args, rows, self.n_rows, self.top)
+        self.redraw()
+
+    def _xview(self, *args):
+        _, cols = self._visible_counts()
+        self.left = self._view_command(args, cols, self.n_cols, self.left)
+        self.redraw()
+
+    def _on_click(self, event):
+        """En la vista general, un clic centra la vista detallada en ese punto."""
+        if not self.overview:
+            return
+        width = max(1, self.canvas.winfo_width())
+        height = max(1, self.canvas.winfo_height())
+        rows, cols = self._visible_counts()
+        self.overview = False
+        self.top = int(event.y / height * self.n_rows) - rows // 2
+        self.left = int(event.x / width * self.n_cols) - cols // 2
+        self.redraw()
+
+    # ---------- dibujo ----------
+    def redraw(self):
+        self.canvas.delete("all")
+        self._images = []
+        self.overview_button.configure(text="Vista detallada" if self.overview else "Vista general")
+        if self.n_rows == 0 or self.n_cols == 0:
+            return
+        if self.overview:
+            self._draw_overview()
+            return
+
+        self._clamp()
+        rows, cols = self._visible_counts()
+        r0, c0 = self.top, self.left
+        r1, c1 = min(self.n_rows, r0 + rows + 1), min(self.n_cols, c0 + cols + 1)
+        block = np.asarray(self.matrix[r0:r1, c0:c1], dtype=bool)
+        hw, hh = self._header_sizes()
+        cell = self.cell
+
+        if cell >= self.RECT_MIN_CELL:
+            for i in range(block.shape[0]):
+                y = hh + i * cell
+                for j in range(block.shape[1]):
+                    x = hw + j * cell
+                    value = block[i, j]
+                    self.canvas.create_rectangle(x, y, x + cell, y + cell, outline="white",
+                                                 fill="lightgreen" if value else "lightcoral")
+                    if cell >= self.TEXT_MIN_CELL:
+                        self.canvas.create_text(x + cell / 2, y + cell / 2, text="V" if value else "F")
+        else:
+            image = _photo_from_colors(_density_colors(block)).zoom(cell)
+            self._images.append(image)
+            self.canvas.create_image(hw, hh, image=image, anchor="nw")
+
+        if hw:
+            # Etiquetas de ejes (estilo libro): X a la izquierda, Y arriba
+            self.canvas.create_rectangle(0, 0, hw, hh, fill="lightgrey", outline="white")
+            self.canvas.create_text(hw / 2, hh / 2, text="x \\ y")
+            for j in range(block.shape[1]):
+                x = hw + j * cell
+                self.canvas.create_rectangle(x, 0, x + cell, hh, fill="lightblue", outline="white")
+                self.canvas.create_text(x + cell / 2, hh / 2, text=str(self.col_labels[c0 + j])[:max(1, cell // 7)])
+            for i in range(block.shape[0]):
+                y = hh + i * cell
+                self.canvas.create_rectangle(0, y, hw, y + cell, fill="lightblue", outline="white")
+                self.canvas.create_text(4, y + cell / 2, text=f"x={self.row_labels[r0 + i]}", anchor="w")
+
+        self.ybar.set(r0 / self.n_rows, min(1.0, (r0 + rows) / self.n_rows))
+        self.xbar.set(c0 / self.n_cols, min(1.0, (c0 + cols) / self.n_cols))
+        self.range_var.set(
+            f"x {r0 + 1}–{min(r1, r0 + rows)} de {self.n_rows}  ·  y {c0 + 1}–{min(c1, c0 + cols)} de {self.n_cols}"
+        )
+
+    def _overview_density(self, height, width):
+        """Fracción de V por píxel de la vista general, acumulada por bloques de filas."""
+        if self._overview_cache is not None and self._overview_cache[0] == (height, width):
+            return self._overview_cache[1]
+        height, width = min(height, self.n_rows), min(width, self.n_cols)
+        col_bin = np.arange(self.n_cols) * width // self.n_cols
+        col_edges = np.flatnonzero(np.r_[True, col_bin[1:] != col_bin[:-1]])
+        sums = np.zeros((height, width))
+        counts = np.zeros((height, 1))
+        if hasattr(self.matrix, "row_blocks"):
+            blocks = self.matrix.row_blocks()
+        else:
+            blocks = [(0, np.asarray(self.matrix, dtype=bool))]
+        for start, block in blocks:
+            row_bin = (start + np.arange(block.shape[0])) * height // self.n_rows
+            np.add.at(sums, row_bin, np.add.reduceat(block, col_edges, axis=1))
+            np.add.at(counts, row_bin, 1)
+        col_counts = np.diff(np.r_[col_edges, self.n_cols])
+        density = sums / np.maximum(counts * col_counts[None, :], 1)
+        self._overview_cache = ((height, width), density)
+        return density
+
+    def _draw_overview(self):
+        width = max(1, self.canvas.winfo_width())
+        height = max(1, self.canvas.winfo_height())
+        density = self._overview_density(height, width)
+        image = _photo_from_colors(_density_colors(density))
+        zoom = max(1, min(width // density.shape[1], height // density.shape[0]))
+        if zoom > 1:
+            image = image.zoom(zoom)
+        self._images.append(image)
+        self.canvas.create_image(0, 0, image=image, anchor="nw")
+        self.ybar.set(0, 1)
+        self.xbar.set(0, 1)
+        self.range_var.set(
+            f"Vista general {self.n_rows}x{self.n_cols}: verde = V, rojo = F (densidad por píxel). "
+            f"Clic para ver el detalle de una zona."
+        )
+
+# ----------------------------
+#     Vista del dataset
+# ----------------------------
+
+class DatasetTableView:
+    """
+    Tabla paginada del dataset: el Treeview sólo contiene la página actual,
+    así que cargar cientos de miles de filas no bloquea la interfaz. El iid de
+    cada fila es su posición en el dataset. Los resaltados se guardan como
+    conjuntos de posiciones y sólo se retocan las filas visibles que cambian.
+    """
+    PAGE_SIZE = 500
+
+    def __init__(self, parent, df, positions_of=None):
+        self.df = df
+        self.positions_of = positions_of or (lambda id_val: ())
+        self.page = 0
+        self.example_positions = set()
+        self.counter_positions = set()
+
+        self.frame = ttk.Frame(parent)
+        nav = ttk.Frame(self.frame)
+        nav.grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 4))
+        ttk.Button(nav, text="«", width=3, command=lambda: self.show_page(0)).pack(side=tk.LEFT)
+        ttk.Button(nav, text="‹", width=3, command=lambda: self.show_page(self.page - 1)).pack(side=tk.LEFT)
+        self.page_var = tk.StringVar()
+        ttk.Label(nav, textvariable=self.page_var).pack(side=tk.LEFT, padx=6)
+        ttk.Button(nav, text="›", width=3, command=lambda: self.show_page(self.page + 1)).pack(side=tk.LEFT)
+        ttk.Button(nav, text="»", width=3, command=lambda: self.show_page(self.n_pages - 1)).pack(side=tk.LEFT)
+        ttk.Label(nav, text="Ir a ID:").pack(side=tk.LEFT, padx=(12, 2))
+        self.goto_var = tk.StringVar()
+        goto_entry = ttk.Entry(nav, textvariable=self.goto_var, width=16)
+        goto_entry.pack(side=tk.LEFT)
+        goto_entry.bind("<Return>", lambda e: self.jump_to_id(self.goto_var.get()))
+        ttk.Button(nav, text="Ir", command=lambda: self.jump_to_id(self.goto_var.get())).pack(side=tk.LEFT, padx=2)
+
+        self.tree = ttk.Treeview(self.frame, show="headings")
+        self.tree.grid(row=1, column=0, sticky="nsew")
+        yscroll = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        xscroll = ttk.Scrollbar(self.frame, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(yscrollcommand=yscroll.set, xscrollcommand=xscroll.set)
+        yscroll.grid(row=1, column=1, sticky="ns")
+        xscroll.grid(row=2, column=0, sticky="ew")
+        self.frame.grid_rowconfigure(1, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+        cols = [str(c) for c in df.columns]
+        self.tree["columns"] = cols
+        for c in cols:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=120)
+        self.tree.tag_configure("example", background="lightgreen")
+        self.tree.tag_configure("counterexample", background="lightcoral")
+
+        self.show_page(0)
+
+    @property
+    def n_pages(self):
+        return max(1, -(-len(self.df) // self.PAGE_SIZE))
+
+    def _page_range(self):
+        start = self.page * self.PAGE_SIZE
+        return start, min(start + self.PAGE_SIZE, len(self.df))
+
+    def _tag_for(self, pos):
+        if pos in self.counter_positions:
+            return ("counterexample",)
+        if pos in self.example_positions:
+            return ("example",)
+        return ()
+
+    def show_page(self, page):
+        page = max(0, min(page, self.n_pages - 1))
+        self.page = page
+        self.tree.delete(*self.tree.get_children())
+        start, stop = self._page_range()
+        for pos, row in enumerate(self.df.iloc[start:stop].itertuples(index=False), start=start):
+            self.tree.insert("", "end", iid=str(pos), values=list(row), tags=self._tag_for(pos))
+        self.page_var.set(f"Filas {start + 1 if stop else 0}–{stop} de {len(self.df)}  (página {page + 1}/{self.n_pages})")
+
+    def show_position(self, pos):
+        """Cambia a la página que contiene la fila y la selecciona."""
+        if self.page != pos // self.PAGE_SIZE:
+            self.show_page(pos // self.PAGE_SIZE)
+        item = str(pos)
+        if self.tree.exists(item):
+            self.tree.selection_set(item)
+            self.tree.see(item)
+
+    def jump_to_id(self, raw):
+        raw = raw.strip()
+        if not raw:
+            return
+        positions = self.positions_of(raw)
+        if len(positions) == 0:
+            # El ID tecleado es texto; probamos con el valor tal como está en la columna
+            for candidate in (pd.to_numeric(raw, errors="coerce"), pd.to_datetime(raw, errors="coerce")):
+                if not pd.isna(candidate):
+                    positions = self.positions_of(candidate)
+                    if len(positions):
+                        break
+        if len(positions) == 0:
+            messagebox.showinfo("Información", f"No hay ninguna fila con ID '{raw}'.")
+            return
+        self.show_position(int(positions[0]))
+
+    def set_highlights(self, example_positions=(), counter_positions=()):
+        """Actualiza los resaltados retocando sólo las filas visibles que cambian."""
+        new_examples = set(example_positions)
+        new_counters = set(counter_positions)
+        changed = (self.example_positions ^ new_examples) | (self.counter_positions ^ new_counters)
+        self.example_positions = new_examples
+        self.counter_positions = new_counters
+        start, stop = self._page_range()
+        for pos in changed:
+            if start <= pos < stop:
+                self.tree.item(str(pos), tags=self._tag_for(pos))
+        first = min(new_counters or new_examples, default=None)
+        if first is not None and not (start <= first < stop):
+            self.show_position(first)
 
 # ----------------------------
 #       App principal
@@ -119,17 +389,37 @@ class LogicQueryApp:
         self.root.title("Sistema de Consultas Lógicas con Matrices")
         self.root.geometry("1400x900")
 
-        self.data = None
-        self.id_column = None       # columna que actúa como ID (p.ej. Fecha)
-        self.predicates = {}        # nombre -> SimplePredicate | CompoundPredicate
-        self.last_result_df = None  # para exportar
+        self.engine = LogicEngine()  # dataset, biblioteca de predicados y evaluación
+        self.last_result_df = None   # para exportar
+        self.last_query = None       # (fórmula, q1, q2, orden, firma) de la última consulta con testigos/contraejemplos
+        self.append_job = None       # mientras corre no se lanzan otros trabajos sobre el motor
 
         # referencias a la tabla del dataset para resaltar ejemplos/contraejemplos
-        self.data_tree = None
-        self.row_id_map = {}
+        self.data_table = None
+
+        # matrices y consultas largas corren fuera del hilo de Tk
+        self.jobs = JobRunner(self.root)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.setup_gui()
 
+    def on_close(self):
+        self.jobs.shutdown()
+        self.root.destroy()
+
+    # Atajos al estado del motor (la GUI sólo lo muestra y lo edita)
+    @property
+    def data(self):
+        return self.engine.data
+
+    @property
+    def id_column(self):
+        return self.engine.id_column
+
+    @property
+    def predicates(self):
+        return self.engine.predicates
+
     # ---------- GUI ----------
     def setup_gui(self):
         main = ttk.Frame(self.root, padding="10")
@@ -141,7 +431,11 @@ class LogicQueryApp:
         top = ttk.Frame(main)
         top.grid(row=0, column=0, columnspan=2, sticky="w", pady=5)
         ttk.Button(top, text="Cargar Dataset", command=self.load_dataset).grid(row=0, column=0, padx=5)
-        ttk.Button(top, text="Exportar Resultado", command=self.export_results).grid(row=0, column=1, padx=5)
+        ttk.Button(top, text="Agregar Filas", command=self.append_dataset_rows).grid(row=0, column=1, padx=5)
+        ttk.Button(top, text="Exportar Resultado", command=self.export_results).grid(row=0, column=2, padx=5)
+        ttk.Button(top, text="Abrir Biblioteca", command=self.open_library).grid(row=0, column=3, padx=5)
+        ttk.Button(top, text="Guardar Biblioteca", command=self.save_library).grid(row=0, column=4, padx=5)
+        ttk.Button(top, text="Estadísticas", command=self.show_stats_window).grid(row=0, column=5, padx=5)
 
         # --- tabla dataset ---
         self.table_frame = ttk.LabelFrame(main, text="Dataset")
@@ -157,7 +451,8 @@ class LogicQueryApp:
 
         self.attr_var = tk.StringVar()
         self.op_var = tk.StringVar(value=RelOp.GT)
-        self.rhs_mode = tk.StringVar(value="var")  # Siempre usar modo var (dos variables)
+        self.rhs_mode = tk.StringVar(value="var")  # "var": p(x,y) ; "const": p(x) contra un valor fijo
+        self.const_var = tk.StringVar()
         self.pred_name_var = tk.StringVar()
         self.preview_var = tk.StringVar(value="Vista previa...")
 
@@ -173,7 +468,7 @@ class LogicQueryApp:
 
         rowb += 1
         ttk.Label(builder, text="Comparar con:").grid(row=rowb, column=0, sticky="e", padx=4, pady=2)
-        ttk.Label(builder, text="Otra fila (y) - Siempre activo", foreground="gray").grid(row=rowb, column=1, sticky="w", pady=2)
+        self._rhs_selector(builder, self.rhs_mode, self.const_var).grid(row=rowb, column=1, sticky="w", pady=2)
 
         rowb += 1
         ttk.Label(builder, text="Nombre (FPS, minúsculas):").grid(row=rowb, column=0, sticky="e", padx=4, pady=2)
@@ -287,7 +582,8 @@ class LogicQueryApp:
 
         ttk.Label(runf, text="Cuantificador Y:").grid(row=2, column=0, sticky="e", padx=4)
         self.quant_y = tk.StringVar(value="∃")
-        ttk.Combobox(runf, textvariable=self.quant_y, values=["∀", "∃"], state="readonly", width=10).grid(row=2, column=1, sticky="w")
+        # "—": sólo se cuantifica x, para fórmulas unarias p(x)
+        ttk.Combobox(runf, textvariable=self.quant_y, values=["∀", "∃", NO_QUANTIFIER], state="readonly", width=10).grid(row=2, column=1, sticky="w")
 
         ttk.Label(runf, text="Orden cuantificadores:").grid(row=3, column=0, sticky="e", padx=4)
         self.quant_order = tk.StringVar(value="X→Y")
@@ -299,7 +595,8 @@ class LogicQueryApp:
             width=10
         ).grid(row=3, column=1, sticky="w")
 
-        ttk.Button(runf, text="Ejecutar", command=self.execute_quantified_query).grid(row=0, column=2, rowspan=4, padx=10)
+        ttk.Button(runf, text="Ejecutar", command=self.execute_quantified_query).grid(row=0, column=2, rowspan=2, padx=10)
+        ttk.Button(runf, text="Consultas en lote", command=self.execute_query_batch).grid(row=2, column=2, rowspan=2, padx=10)
 
         # --- resultados ---
         result_frame = ttk.LabelFrame(main, text="Resultados", padding=6)
@@ -319,7 +616,7 @@ class LogicQueryApp:
         ttk.Label(main, textvariable=self.status_var).grid(row=7, column=0, columnspan=2, sticky="w", pady=4)
 
         # eventos para vista previa
-        for var in (self.attr_var, self.op_var):
+        for var in (self.attr_var, self.op_var, self.rhs_mode, self.const_var):
             var.trace_add("write", lambda *args: self.update_preview())
 
         # pesos
@@ -336,179 +633,181 @@ class LogicQueryApp:
         )
         if not filename:
             return
-        try:
-            if filename.endswith('.csv'):
-                self.data = pd.read_csv(filename)
-            elif filename.endswith('.xlsx'):
-                self.data = pd.read_excel(filename)
-            else:
-                self.data = pd.read_csv(filename)
-
-            # Procesamiento mejorado de fechas
-            date_columns = [col for col in self.data.columns if 'date' in col.lower() or 'fecha' in col.lower()]
-            for col in date_columns:
-                try:
-                    self.data[col] = pd.to_datetime(self.data[col], errors='coerce')
-                except Exception:
-                    pass
-
-            cols = list(self.data.columns)
-            self.attr_combo["values"] = cols
-
-            # Elección inteligente de ID por defecto
-            if "Date" in cols:
-                self.id_column = "Date"
-            elif "Fecha" in cols:
-                self.id_column = "Fecha"
-            elif any(self.data[col].is_unique for col in cols):
-                for col in cols:
-                    if self.data[col].is_unique:
-                        self.id_column = col
-                        break
-                else:
-                    self.id_column = cols[0]
-            else:
-                self.id_column = cols[0]
 
+        # Con una biblioteca abierta basta leer sus columnas (más las candidatas a ID)
+        usecols = None
+        if self.engine.predicates:
+            try:
+                header = dataset_columns(filename)
+                columns = columns_to_load(filename, self.engine.library_columns())
+            except Exception as e:
+                messagebox.showerror("Error", f"Error al cargar el archivo: {str(e)}")
+                return
+            if len(columns) < len(header) and messagebox.askyesno(
+                    "Columnas",
+                    f"La biblioteca usa {len(columns)} de las {len(header)} columnas del archivo.\n"
+                    f"¿Cargar sólo esas? (Menos memoria y carga más rápida; las demás no estarán "
+                    f"disponibles para nuevos predicados.)"):
+                usecols = columns
+
+        # La lectura (por trozos) va en segundo plano; el motor se actualiza en el hilo de Tk
+        def work(job):
+            def on_progress(done, total):
+                if job.cancelled:
+                    raise JobCancelled()
+                job.report(done, total)
+            with self.engine.stats.stage("dataset_load", os.path.basename(filename)) as record:
+                data, id_column, from_snapshot = open_dataset(filename, usecols=usecols, on_progress=on_progress)
+                record.cells = data.size
+                record.bytes = int(data.memory_usage(deep=False).sum())
+            return data, id_column, from_snapshot
+
+        def loaded(result):
+            data, id_column, from_snapshot = result
+            try:
+                self.engine.set_data(data, id_column)
+                self.clear_results()
+                cols = list(self.data.columns)
+                self.attr_combo["values"] = cols
+
+                self.display_data(self.data)
+                self.update_preview()
+                memory_mb = self.data.memory_usage(deep=True).sum() / 2**20
+                source = " desde la instantánea binaria" if from_snapshot else ""
+                if usecols is not None:
+                    source += " (sólo las columnas de la biblioteca)"
+                info = (f"Dataset cargado{source}: {len(self.data)} filas, {len(cols)} columnas ({memory_mb:.1f} MB)"
+                        f"\nID automático: {self.id_column}")
+                if self.engine.duplicate_ids:
+                    info += (f"\nAviso: {self.engine.duplicate_ids} valores de ID se repiten; cada fila se evalúa "
+                             f"por su posición y un ID repetido resalta todas sus filas.")
+                self.status_var.set(f"Dataset cargado: {len(self.data)} filas.")
+                messagebox.showinfo("Éxito", info)
+            except Exception as e:
+                messagebox.showerror("Error", f"Error al cargar el archivo: {str(e)}")
+
+        self.start_job("Cargando dataset", work, loaded,
+                       error_prefix="Error al cargar el archivo: ", keep_if_reloaded=True)
+
+    def append_dataset_rows(self):
+        if self.data is None:
+            messagebox.showerror("Error", "Carga un dataset primero.")
+            return
+        if self.jobs.active:
+            # append_rows cambia datos, índice de IDs y caché que esos trabajos están leyendo
+            messagebox.showinfo("Información", "Espera a que terminen los trabajos en curso para agregar filas.")
+            return
+        filename = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        columns = list(self.data.columns)
+        outcome = {}
+
+        # Leer el archivo y extender cada matriz en caché (O(N·M) por predicado) va en segundo plano
+        def work(job):
+            def on_read(done, total):
+                if job.cancelled:
+                    raise JobCancelled()
+                job.report(done, total)
+            rows = read_dataset(filename, usecols=columns, on_progress=on_read)
+            # Desde aquí el motor ya cambia: se termina aunque se pida cancelar
+            outcome["updated"] = self.engine.append_rows(rows, on_progress=job.report)
+            outcome["rows"] = len(rows)
+            return outcome
+
+        def appended(_=None):
+            if "updated" not in outcome:    # cancelado antes de tocar el motor
+                return
+            self.clear_results()
             self.display_data(self.data)
-            self.update_preview()
-            messagebox.showinfo(
-                "Éxito",
-                f"Dataset cargado: {len(self.data)} filas, {len(cols)} columnas\nID automático: {self.id_column}"
-            )
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar el archivo: {str(e)}")
-
-    def display_data(self, df):
-        for w in self.table_frame.winfo_children():
-            w.destroy()
-        tree = ttk.Treeview(self.table_frame, show="headings")
-        tree.grid(row=0, column=0, sticky="nsew")
-        yscroll = ttk.Scrollbar(self.table_frame, orient="vertical", command=tree.yview)
-        xscroll = ttk.Scrollbar(self.table_frame, orient="horizontal", command=tree.xview)
-        tree.configure(yscrollcommand=yscroll.set, xscrollcommand=xscroll.set)
-        yscroll.grid(row=0, column=1, sticky="ns")
-        xscroll.grid(row=1, column=0, sticky="ew")
-        self.table_frame.grid_rowconfigure(0, weight=1)
-        self.table_frame.grid_columnconfigure(0, weight=1)
-
-        cols = list(df.columns)
-        tree["columns"] = cols
-        for c in cols:
-            tree.heading(c, text=c)
-            tree.column(c, width=120)
-
-        self.data_tree = tree
-        self.row_id_map = {}
+            self.status_var.set(f"Dataset: {len(self.data)} filas (+{outcome['rows']}).")
+            messagebox.showinfo("Éxito", f"Se agregaron {outcome['rows']} filas; {outcome['updated']} matrices "
+                                         f"en caché se actualizaron sin recalcularse.")
 
-        self.data_tree.tag_configure("example", background="lightgreen")
-        self.data_tree.tag_configure("counterexample", background="lightcoral")
+        self.append_job = self.start_job("Agregando filas", work, appended, on_cancel=appended,
+                                         error_prefix="No se pudieron agregar las filas: ",
+                                         keep_if_reloaded=True)   # cambia data_version a propósito
 
-        max_rows = min(len(df), 2000)
-        for _, row in df.iloc[:max_rows].iterrows():
-            values = list(row)
-            item_id = tree.insert("", "end", values=values)
-            if self.id_column in df.columns:
-                id_val = row[self.id_column]
-                self.row_id_map[id_val] = item_id
+    def display_data(self, df):
+        with self.engine.stats.stage("render", "tabla del dataset") as record:
+            for w in self.table_frame.winfo_children():
+                w.destroy()
+            self.data_table = DatasetTableView(self.table_frame, df, positions_of=self.engine.positions_of)
+            self.data_table.frame.grid(row=0, column=0, sticky="nsew")
+            self.table_frame.grid_rowconfigure(0, weight=1)
+            self.table_frame.grid_columnconfigure(0, weight=1)
+            record.cells = df.size
+
+    # ---------- biblioteca en archivo ----------
+    def open_library(self):
+        filename = filedialog.askopenfilename(filetypes=[("Biblioteca de predicados", "*.json"), ("All files", "*.*")])
+        if not filename:
+            return
+        try:
+            self.engine.load_library(filename)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"No se pudo abrir la biblioteca: {e}")
+            return
+        self._refresh_predicate_list()
+        info = f"Biblioteca cargada: {len(self.predicates)} predicados/fórmulas."
+        if self.engine.restored_matrices:
+            info += f"\nSe recuperaron {self.engine.restored_matrices} matrices ya calculadas."
+        elif self.engine.stored_matrices is not None:
+            info += "\nTrae matrices guardadas; se usarán al cargar el dataset con el que se calcularon."
+        messagebox.showinfo("Éxito", info)
+
+    def save_library(self):
+        if not self.predicates:
+            messagebox.showinfo("Información", "No hay predicados definidos")
+            return
+        filename = filedialog.asksaveasfilename(defaultextension=".json",
+                                                filetypes=[("Biblioteca de predicados", "*.json")])
+        if not filename:
+            return
+        include_matrices = len(self.engine.matrix_cache) > 0 and messagebox.askyesno(
+            "Guardar Biblioteca", "¿Guardar también las matrices ya calculadas para este dataset?")
+        try:
+            saved = self.engine.save_library(filename, include_matrices=include_matrices)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo guardar la biblioteca: {e}")
+            return
+        info = f"Biblioteca guardada en {filename}"
+        if saved:
+            info += f"\n({saved} matrices en {self.engine.matrices_path(filename)})"
+        messagebox.showinfo("Éxito", info)
 
     # ---------- utilidades ----------
     def update_preview(self):
         attr = self.attr_var.get() or "<atributo>"
         op  = self.op_var.get() or ">"
+        if self.rhs_mode.get() == "const":
+            self.preview_var.set(f"Vista previa: p(x): x.{attr} {op} {self.const_var.get() or '<valor>'}")
+            return
         rhs_txt = f"y.{attr}"
         self.preview_var.set(f"Vista previa: p(x,y): x.{attr} {op} {rhs_txt}")
 
-    def _parse_const_for_series(self, series, raw):
-        if raw is None or raw == "":
-            raise ValueError("Constante vacía.")
-        s = str(raw).strip()
-
-        low = s.lower()
-        if pd.api.types.is_bool_dtype(series):
-            if low in {"true","1","t","sí","si","y"}: return True
-            if low in {"false","0","f","no","n"}: return False
-            raise ValueError("El valor debe ser booleano (true/false)")
+    def _rhs_selector(self, parent, mode_var, const_var):
+        """Otra fila (y) o una constante: con constante el predicado es unario p(x) y se guarda como vector."""
+        frame = ttk.Frame(parent)
+        ttk.Radiobutton(frame, text="Otra fila (y)", value="var", variable=mode_var).pack(side=tk.LEFT)
+        ttk.Radiobutton(frame, text="Constante:", value="const", variable=mode_var).pack(side=tk.LEFT, padx=(8, 2))
+        ttk.Entry(frame, textvariable=const_var, width=14).pack(side=tk.LEFT)
+        return frame
 
-        if pd.api.types.is_integer_dtype(series):
-            return int(float(s))
-        if pd.api.types.is_float_dtype(series):
-            return float(s)
-
-        if pd.api.types.is_datetime64_any_dtype(series):
-            try:
-                return pd.to_datetime(s, dayfirst=True, errors="raise")
-            except Exception:
-                pass
-
-        return s
-
-    def _compare(self, a, b, op):
-        try:
-            if pd.isna(a) or pd.isna(b):
-                return False
-        except Exception:
-            pass
-        if op == RelOp.EQ: return a == b
-        if op == RelOp.NE: return a != b
-        if op == RelOp.GT: return a >  b
-        if op == RelOp.LT: return a <  b
-        if op == RelOp.GE: return a >= b
-        if op == RelOp.LE: return a <= b
-        if op == RelOp.CONTAINS:
-            return str(b).lower() in str(a).lower()
-        if op == RelOp.STARTS_WITH:
-            return str(a).lower().startswith(str(b).lower())
-        if op == RelOp.ENDS_WITH:
-            return str(a).lower().endswith(str(b).lower())
-        raise ValueError(f"Operador no válido: {op}")
-
-    def _get_attr_map(self, attr):
-        if self.data is None or self.id_column not in self.data.columns or attr not in self.data.columns:
-            return {}
-        return dict(zip(self.data[self.id_column], self.data[attr]))
-
-    def _resolve_predicate_name_input(self, name):
-        if not name:
-            return None
-        if name in self.predicates:
-            return name
-        low = name.lower()
-        up = name.upper()
-        if low in self.predicates:
-            return low
-        if up in self.predicates:
-            return up
-        return None
-
-    def _rename_predicate(self, old_name, new_name):
-        if old_name == new_name or old_name not in self.predicates:
-            return
-        pred = self.predicates.pop(old_name)
-        pred.name = new_name
-        self.predicates[new_name] = pred
-        for p in self.predicates.values():
-            if getattr(p, "type", None) == "compound":
-                p.args = [new_name if a == old_name else a for a in p.args]
+    def _build_rhs(self, attr, mode, raw):
+        """rhs del predicado simple; ValueError si la constante no encaja con la columna."""
+        if mode == "const":
+            return {"type": "const", "value": self.engine.parse_constant(attr, raw)}
+        return {"type": "var", "var": "Y"}
 
     def highlight_dataset_rows(self, example_ids=None, counterexample_ids=None):
-        if self.data_tree is None:
+        if self.data_table is None:
             return
-        example_ids = set(example_ids or [])
-        counterexample_ids = set(counterexample_ids or [])
-
-        for item in self.data_tree.get_children():
-            self.data_tree.item(item, tags=())
-
-        for id_val in example_ids:
-            item = self.row_id_map.get(id_val)
-            if item:
-                self.data_tree.item(item, tags=("example",))
-
-        for id_val in counterexample_ids:
-            item = self.row_id_map.get(id_val)
-            if item:
-                self.data_tree.item(item, tags=("counterexample",))
+        example_pos = [int(p) for id_val in set(example_ids or []) for p in self.engine.positions_of(id_val)]
+        counter_pos = [int(p) for id_val in set(counterexample_ids or []) for p in self.engine.positions_of(id_val)]
+        self.data_table.set_highlights(example_pos, counter_pos)
 
     # ---------- guardar predicados ----------
     def save_simple_predicate(self):
@@ -538,7 +837,11 @@ class LogicQueryApp:
             messagebox.showerror("Error", "Operador inválido.")
             return
 
-        rhs = {"type":"var","var": "Y"}
+        try:
+            rhs = self._build_rhs(attr, self.rhs_mode.get(), self.const_var.get())
+        except ValueError as e:
+            messagebox.showerror("Error", f"Constante inválida para {attr}: {e}")
+            return
 
         sp = SimplePredicate(name, attr, op, lhs, rhs)
         self.predicates[name] = sp
@@ -562,8 +865,8 @@ class LogicQueryApp:
         a1_raw = self.comp_arg1.get().strip()
         a2_raw = self.comp_arg2.get().strip()
 
-        a1 = self._resolve_predicate_name_input(a1_raw)
-        a2 = self._resolve_predicate_name_input(a2_raw) if a2_raw else None
+        a1 = self.engine.resolve_predicate_name(a1_raw)
+        a2 = self.engine.resolve_predicate_name(a2_raw) if a2_raw else None
 
         if op in [LogicOp.NOT, LogicOp.IMPLIES]:
             if not a1:
@@ -619,10 +922,15 @@ class LogicQueryApp:
                     f"Generar la matriz puede tomar tiempo. ¿Continuar?"
                 ):
                     return
-            matrix, ids = self.generate_truth_matrix(pred_name)
-            if matrix is not None:
-                self.display_matrix(matrix, ids, ids, f"Matriz de {pred_name}", predicate_name=pred_name)
-                matrix_window.destroy()
+
+            def show(results):
+                matrix, ids = results[0]
+                if matrix is not None:
+                    self.display_matrix(matrix, ids, ids, f"Matriz de {pred_name}", predicate_name=pred_name)
+                    if matrix_window.winfo_exists():
+                        matrix_window.destroy()
+
+            self.generate_truth_matrices([pred_name], show)
 
         ttk.Button(matrix_window, text="Ver Matriz", command=show_matrix).pack(pady=10)
 
@@ -730,7 +1038,9 @@ class LogicQueryApp:
         row += 1
 
         ttk.Label(parent, text="Comparar con:").grid(row=row, column=0, sticky="e", padx=5, pady=2)
-        ttk.Label(parent, text="Otra fila (y) - Siempre activo", foreground="gray").grid(row=row, column=1, sticky="w", pady=2)
+        mode_var = tk.StringVar(value=pred.rhs["type"])
+        const_var = tk.StringVar(value="" if pred.rhs["type"] == "var" else str(pred.rhs["value"]))
+        self._rhs_selector(parent, mode_var, const_var).grid(row=row, column=1, sticky="w", pady=2)
         row += 1
 
         def save_changes():
@@ -742,11 +1052,17 @@ class LogicQueryApp:
             if new_name != original_name and new_name in self.predicates:
                 messagebox.showerror("Error", f"Ya existe un predicado llamado '{new_name}'")
                 return
+            try:
+                rhs = self._build_rhs(attr_var.get(), mode_var.get(), const_var.get())
+            except ValueError as e:
+                messagebox.showerror("Error", f"Constante inválida para {attr_var.get()}: {e}")
+                return
+            self.engine.invalidate_predicate(original_name)
             pred.attr = attr_var.get()
             pred.op = op_var.get()
-            pred.rhs = {"type": "var", "var": "Y"}
+            pred.rhs = rhs
             if new_name != original_name:
-                self._rename_predicate(original_name, new_name)
+                self.engine.rename_predicate(original_name, new_name)
             self._refresh_predicate_list()
             parent.winfo_toplevel().destroy()
             messagebox.showinfo("Éxito", f"Predicado '{new_name}' actualizado")
@@ -799,8 +1115,8 @@ class LogicQueryApp:
                 return
 
             new_op = op_var.get()
-            a1 = self._resolve_predicate_name_input(arg1_var.get().strip())
-            a2 = self._resolve_predicate_name_input(arg2_var.get().strip()) if arg2_var.get().strip() else None
+            a1 = self.engine.resolve_predicate_name(arg1_var.get().strip())
+            a2 = self.engine.resolve_predicate_name(arg2_var.get().strip()) if arg2_var.get().strip() else None
 
             if new_op in [LogicOp.NOT, LogicOp.IMPLIES]:
                 if not a1:
@@ -818,10 +1134,11 @@ class LogicQueryApp:
                     return
                 new_args = [a1, a2]
 
+            self.engine.invalidate_predicate(original_name)
             pred.op = new_op
             pred.args = new_args
             if new_name != original_name:
-                self._rename_predicate(original_name, new_name)
+                self.engine.rename_predicate(original_name, new_name)
             self._refresh_predicate_list()
             parent.winfo_toplevel().destroy()
             messagebox.showinfo("Éxito", f"Fórmula '{new_name}' actualizada")
@@ -835,111 +1152,111 @@ class LogicQueryApp:
             self.pred_list.insert(tk.END, pred.caption())
         self.update_predicate_combos()
 
-    # ---------- evaluación ----------
-    def _eval_predicate(self, name, x=None, y=None):
-        pred = self.predicates[name]
-        if pred.type == "simple":
-            series = self.data[pred.attr]
-            if x is None:
-                return False
-            try:
-                lv = series.loc[self.data[self.id_column] == x].iloc[0]
-            except Exception:
-                return False
-
-            if pred.rhs["type"] == "var":
-                if y is None:
-                    return False
-                try:
-                    rv = series.loc[self.data[self.id_column] == y].iloc[0]
-                except Exception:
-                    return False
-            else:
-                rv = pred.rhs["value"]
-
-            try:
-                return self._compare(lv, rv, pred.op)
-            except Exception:
-                return False
-
-        if pred.type == "compound":
-            if pred.op == LogicOp.NOT:
-                return not self._eval_predicate(pred.args[0], x, y)
-            if pred.op == LogicOp.AND:
-                return self._eval_predicate(pred.args[0], x, y) and self._eval_predicate(pred.args[1], x, y)
-            if pred.op == LogicOp.OR:
-                return self._eval_predicate(pred.args[0], x, y) or self._eval_predicate(pred.args[1], x, y)
-            if pred.op == LogicOp.IMPLIES:
-                return (not self._eval_predicate(pred.args[0], x, y)) or \
-                    self._eval_predicate(pred.args[1] if len(pred.args) > 1 else pred.args[0], x, y)
-            if pred.op == LogicOp.XOR:
-                p_val = self._eval_predicate(pred.args[0], x, y)
-                q_val = self._eval_predicate(pred.args[1], x, y)
-                return (p_val or q_val) and not (p_val and q_val)
-            if pred.op == LogicOp.BICONDITIONAL:
-                p_val = self._eval_predicate(pred.args[0], x, y)
-                q_val = self._eval_predicate(pred.args[1], x, y)
-                return p_val == q_val
-            raise ValueError("Operador lógico no soportado.")
-        return False
-
-    def _domains(self):
-        if self.data is None or not self.id_column:
-            return [], []
-        ids = list(self.data[self.id_column])
-        return ids, ids
-
     # ---------- MATRICES NxN ----------
-    def generate_truth_matrix(self, predicate_name):
-        if self.data is None or predicate_name not in self.predicates:
-            return None, []
-
-        ids = self._get_domain_ids()
-        n_original = len(ids)
-        n = n_original
-
-        max_size = 100
-        if n > max_size:
-            ids = ids[:max_size]
-            n = max_size
-            messagebox.showwarning(
-                "Advertencia",
-                f"Dataset muy grande. Mostrando matriz {max_size}x{max_size} en lugar de {n_original}x{n_original}"
-            )
-
-        matrix = np.zeros((n, n), dtype=bool)
-
-        progress_window = None
-        progress_var = None
-        if n > 20:
-            progress_window = tk.Toplevel(self.root)
-            progress_window.title("Generando Matriz")
-            progress_window.geometry("300x100")
-            ttk.Label(progress_window, text="Generando matriz, por favor espere...").pack(pady=10)
-            progress_var = tk.DoubleVar()
-            ttk.Progressbar(progress_window, variable=progress_var, maximum=n).pack(pady=10, padx=20, fill=tk.X)
-            progress_window.update()
-
-        pred = self.predicates[predicate_name]
-        for i, x in enumerate(ids):
-            for j, y in enumerate(ids):
-                matrix[i][j] = self._eval_predicate(predicate_name, x, y)
-            if progress_window is not None:
-                progress_var.set(i + 1)
-                progress_window.update()
-
-        if progress_window is not None:
-            progress_window.destroy()
-
-        return matrix, ids
-
-    def _get_domain_ids(self):
-        if self.data is None or not self.id_column:
-            return []
-        return list(self.data[self.id_column])
+    # ---------- trabajos en segundo plano ----------
+    def start_job(self, title, fn, on_done, error_prefix="", keep_if_reloaded=False, on_cancel=None):
+        """
+        Ejecuta fn(job) en segundo plano con una ventana de progreso cancelable.
+        on_done(resultado) llega en el hilo de Tk; si mientras tanto se cargó otro
+        dataset, el resultado se descarta (salvo keep_if_reloaded). Los errores se
+        muestran con messagebox y on_cancel() se llama si se canceló. Al terminar,
+        el status muestra el tiempo por etapa. Mientras se agregan filas no se
+        lanza ningún trabajo (devuelve None).
+        """
+        if self.append_job is not None and self.append_job in self.jobs.active:
+            messagebox.showinfo("Información", "Espera a que terminen de agregarse las filas.")
+            return None
+        version = self.engine.data_version
+        progress = {}
+        timing = {}     # etapa "job" del trabajo (la llena su hilo)
+
+        def run(job):
+            with self.engine.stats.stage("job", title) as record:
+                timing["record"] = record
+                return fn(job)
+
+        def close_window():
+            if progress and progress["window"].winfo_exists():
+                progress["window"].destroy()
+            self.update_jobs_status()
+
+        def on_progress(done, total):
+            if total <= 1:
+                return
+            if not progress:
+                window = tk.Toplevel(self.root)
+                window.title(title)
+                window.geometry("320x130")
+                ttk.Label(window, text=f"{title}, por favor espere...").pack(pady=10)
+                progress["var"] = tk.DoubleVar()
+                progress["bar"] = ttk.Progressbar(window, variable=progress["var"], maximum=total)
+                progress["bar"].pack(pady=5, padx=20, fill=tk.X)
+                ttk.Button(window, text="Cancelar", command=job.cancel).pack(pady=5)
+                window.protocol("WM_DELETE_WINDOW", job.cancel)
+                progress["window"] = window
+            progress["bar"].configure(maximum=total)
+            progress["var"].set(done)
+
+        def on_finished(result):
+            close_window()
+            if self.engine.data_version != version and not keep_if_reloaded:
+                self.status_var.set(f"{title}: resultado descartado (se cargó otro dataset).")
+                return
+            mark = self.engine.stats.mark()
+            on_done(result)
+            self.show_stage_timing(timing.get("record"), mark)
+
+        def on_error(error):
+            close_window()
+            messagebox.showerror("Error", f"{error_prefix}{error}")
+
+        def on_cancelled():
+            close_window()
+            self.status_var.set(f"{title}: cancelado.")
+            if on_cancel is not None:
+                on_cancel()
+
+        job = self.jobs.submit(title, run, on_finished, on_error, on_progress, on_cancelled)
+        self.update_jobs_status()
+        return job
+
+    def show_stage_timing(self, record, mark):
+        """Agrega al status el tiempo del trabajo por etapa y el de dibujar su resultado (etapas desde mark)."""
+        if record is None:
+            return
+        render = sum(r.seconds for r in self.engine.stats.since(mark)
+                     if r.stage == "render" and r.thread == threading.get_ident())
+        text = f"{record.detail}: {record.breakdown()}"
+        if render:
+            text += f", {STAGE_LABELS['render']} {format_seconds(render)}"
+        self.status_var.set(f"{self.status_var.get()}  [{text}]")
+
+    def update_jobs_status(self):
+        running = len(self.jobs.active)
+        if running:
+            self.status_var.set(f"{running} trabajo(s) en curso...")
+
+    def generate_truth_matrices(self, predicate_names, on_done):
+        """Genera en segundo plano las matrices de los predicados y llama on_done([(matriz, ids), ...])."""
+        names = list(predicate_names)
+
+        def work(job):
+            results = []
+            for k, name in enumerate(names):
+                def on_progress(done, total, k=k):
+                    job.report(k + done / total, len(names))
+                results.append(self.engine.generate_truth_matrix(name, on_progress, lambda: job.cancelled))
+            return results
+
+        return self.start_job("Generando matriz", work, on_done)
 
     def display_matrix(self, matrix, row_labels, col_labels, title, predicate_name=None):
         """X a la izquierda (filas) y Y arriba (columnas)."""
+        with self.engine.stats.stage("render", f"matriz {title}") as record:
+            self._open_matrix_window(matrix, row_labels, col_labels, title, predicate_name)
+            record.cells = matrix.shape[0] * matrix.shape[1]
+
+    def _open_matrix_window(self, matrix, row_labels, col_labels, title, predicate_name):
         matrix_window = tk.Toplevel(self.root)
         matrix_window.title(f"Matriz: {title}")
         matrix_window.geometry("1000x650")
@@ -956,19 +1273,18 @@ class LogicQueryApp:
             header_lines.append(pred.caption())  # solo la consulta
         if self.id_column:
             header_lines.append(f"Columna ID: {self.id_column}")
-        ttk.Label(main_frame, text="\n".join(header_lines), font=("TkDefaultFont", 10, "bold")).grid(row=0, column=0, sticky="w", pady=(0, 10))
 
         # X = filas ; Y = columnas  (sin transponer)
         display_rows = list(row_labels)  # X
         display_cols = list(col_labels)  # Y
-        matrix_to_render = matrix
+        ttk.Label(main_frame, text="\n".join(header_lines), font=("TkDefaultFont", 10, "bold")).grid(row=0, column=0, sticky="w", pady=(0, 10))
 
         current_row = 1
 
         # Tablas de apoyo con valores del atributo (para FPS)
         if pred is not None and getattr(pred, "type", None) == "simple" and pred.rhs["type"] == "var":
             attr = pred.attr
-            attr_map = self._get_attr_map(attr)
+            attr_values = self.engine.attr_values(attr)
 
             info_frame = ttk.Frame(main_frame)
             info_frame.grid(row=current_row, column=0, sticky="ew", pady=(0,10))
@@ -998,82 +1314,22 @@ class LogicQueryApp:
             y_tree.column("val", width=180)
             y_tree.grid(row=1, column=1, sticky="ew", padx=5, pady=5)
 
-            for xid in display_rows:
-                x_tree.insert("", "end", values=("x", xid, attr_map.get(xid, "")))
-            for yid in display_cols:
-                y_tree.insert("", "end", values=("y", yid, attr_map.get(yid, "")))
+            # Las tablas de apoyo se limitan a las primeras filas; la matriz muestra todo
+            for i, xid in enumerate(display_rows[:INFO_TABLE_MAX_ROWS]):
+                x_tree.insert("", "end", values=("x", xid, attr_values[i] if i < len(attr_values) else ""))
+            for j, yid in enumerate(display_cols[:INFO_TABLE_MAX_ROWS]):
+                y_tree.insert("", "end", values=("y", yid, attr_values[j] if j < len(attr_values) else ""))
 
             current_row += 1
 
-        # Canvas con scroll para la matriz
-        canvas = tk.Canvas(main_frame)
-        scrollbar_y = ttk.Scrollbar(main_frame, orient="vertical", command=canvas.yview)
-        scrollbar_x = ttk.Scrollbar(main_frame, orient="horizontal", command=canvas.xview)
-
-        scrollable_frame = ttk.Frame(canvas)
-        scrollable_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
-
-        n_rows, n_cols = matrix_to_render.shape
-
-        # Etiquetas de ejes (estilo libro)
-        tl = tk.Label(scrollable_frame, text="y", bg="lightgrey", width=4, relief="raised", borderwidth=1)
-        tl.grid(row=0, column=0, padx=1, pady=1)
-
-        # Encabezados de columnas: IDs de Y
-        for j, col_label in enumerate(display_cols):
-            label = tk.Label(scrollable_frame, text=f"y={col_label}", bg="lightblue", width=12, relief="raised")
-            label.grid(row=0, column=j+1, padx=1, pady=1)
-
-        # Filas con datos: IDs de X
-        for i in range(n_rows):
-            row_label = tk.Label(scrollable_frame, text=f"x={display_rows[i]}", bg="lightblue", width=12, relief="raised")
-            row_label.grid(row=i+1, column=0, padx=1, pady=1)
-
-            for j in range(n_cols):
-                value = matrix_to_render[i][j]
-                bg_color = "lightgreen" if value else "lightcoral"
-                text = "V" if value else "F"
-                cell = tk.Label(scrollable_frame, text=text, bg=bg_color, width=4, height=1, relief="raised", borderwidth=1)
-                cell.grid(row=i+1, column=j+1, padx=1, pady=1)
-
-        canvas.grid(row=current_row, column=0, sticky="nsew")
-        scrollbar_y.grid(row=current_row, column=1, sticky="ns")
-        scrollbar_x.grid(row=current_row+1, column=0, sticky="ew")
+        # Canvas virtualizado: sólo se dibuja la parte visible de la matriz
+        view = MatrixCanvasView(main_frame, matrix, display_rows, display_cols)
+        view.frame.grid(row=current_row, column=0, sticky="nsew")
 
         main_frame.grid_rowconfigure(current_row, weight=1)
         main_frame.grid_columnconfigure(0, weight=1)
 
     # ---------- OPERADORES MATRICIALES ----------
-    def matrix_AND(self, matrix1, matrix2):
-        if matrix1.shape != matrix2.shape:
-            raise ValueError("Las matrices deben tener la misma dimensión")
-        return np.logical_and(matrix1, matrix2)
-
-    def matrix_OR(self, matrix1, matrix2):
-        if matrix1.shape != matrix2.shape:
-            raise ValueError("Las matrices deben tener la misma dimensión")
-        return np.logical_or(matrix1, matrix2)
-
-    def matrix_NOT(self, matrix):
-        return np.logical_not(matrix)
-
-    def matrix_XOR(self, matrix1, matrix2):
-        if matrix1.shape != matrix2.shape:
-            raise ValueError("Las matrices deben tener la misma dimensión")
-        return np.logical_xor(matrix1, matrix2)
-
-    def matrix_IMPLIES(self, matrix1, matrix2):
-        if matrix1.shape != matrix2.shape:
-            raise ValueError("Las matrices deben tener la misma dimensión")
-        return np.logical_or(np.logical_not(matrix1), matrix2)
-
-    def matrix_BICONDITIONAL(self, matrix1, matrix2):
-        if matrix1.shape != matrix2.shape:
-            raise ValueError("Las matrices deben tener la misma dimensión")
-        return np.logical_and(self.matrix_IMPLIES(matrix1, matrix2), self.matrix_IMPLIES(matrix2, matrix1))
-
     def update_predicate_combos(self):
         pred_names = list(self.predicates.keys())
         self.matrix_pred1['values'] = pred_names
@@ -1092,9 +1348,12 @@ class LogicQueryApp:
                                        f"Generar la matriz puede tomar tiempo. ¿Continuar?"):
                 return
 
-        matrix, ids = self.generate_truth_matrix(pred_name)
-        if matrix is not None:
-            self.display_matrix(matrix, ids, ids, f"Matriz de {pred_name}", predicate_name=pred_name)
+        def show(results):
+            matrix, ids = results[0]
+            if matrix is not None:
+                self.display_matrix(matrix, ids, ids, f"Matriz de {pred_name}", predicate_name=pred_name)
+
+        self.generate_truth_matrices([pred_name], show)
 
     def apply_matrix_operator(self):
         pred1 = self.matrix_pred1.get()
@@ -1122,45 +1381,52 @@ class LogicQueryApp:
             messagebox.showerror("Error", f"Ya existe un predicado llamado '{result_name}'")
             return
 
-        matrix1, ids1 = self.generate_truth_matrix(pred1)
-        matrix2, ids2 = self.generate_truth_matrix(pred2)
+        def combine(results):
+            (matrix1, ids1), (matrix2, ids2) = results
+            if matrix1 is None or matrix2 is None:
+                messagebox.showerror("Error", "No se pudieron generar las matrices")
+                return
+            if result_name in self.predicates:
+                messagebox.showerror("Error", f"Ya existe un predicado llamado '{result_name}'")
+                return
 
-        if matrix1 is None or matrix2 is None:
-            messagebox.showerror("Error", "No se pudieron generar las matrices")
-            return
+            try:
+                with self.engine.stats.stage("logic_op", f"{pred1} {op} {pred2}") as record:
+                    if op == "AND":
+                        result = self.engine.matrix_AND(matrix1, matrix2)
+                        logic_op = LogicOp.AND
+                    elif op == "OR":
+                        result = self.engine.matrix_OR(matrix1, matrix2)
+                        logic_op = LogicOp.OR
+                    elif op == "XOR":
+                        result = self.engine.matrix_XOR(matrix1, matrix2)
+                        logic_op = LogicOp.XOR
+                    elif op == "IMPLIES":
+                        result = self.engine.matrix_IMPLIES(matrix1, matrix2)
+                        logic_op = LogicOp.IMPLIES
+                    elif op == "BICONDITIONAL":
+                        result = self.engine.matrix_BICONDITIONAL(matrix1, matrix2)
+                        logic_op = LogicOp.BICONDITIONAL
+                    else:
+                        messagebox.showerror("Error", "Operador no válido")
+                        return
+                    record.cells = result.shape[0] * result.shape[1]
+                    record.bytes = result.nbytes
 
-        try:
-            if op == "AND":
-                result = self.matrix_AND(matrix1, matrix2)
-                logic_op = LogicOp.AND
-            elif op == "OR":
-                result = self.matrix_OR(matrix1, matrix2)
-                logic_op = LogicOp.OR
-            elif op == "XOR":
-                result = self.matrix_XOR(matrix1, matrix2)
-                logic_op = LogicOp.XOR
-            elif op == "IMPLIES":
-                result = self.matrix_IMPLIES(matrix1, matrix2)
-                logic_op = LogicOp.IMPLIES
-            elif op == "BICONDITIONAL":
-                result = self.matrix_BICONDITIONAL(matrix1, matrix2)
-                logic_op = LogicOp.BICONDITIONAL
-            else:
-                messagebox.showerror("Error", "Operador no válido")
-                return
+                comp_pred = CompoundPredicate(result_name, logic_op, [pred1, pred2])
+                self.predicates[result_name] = comp_pred
 
-            comp_pred = CompoundPredicate(result_name, logic_op, [pred1, pred2])
-            self.predicates[result_name] = comp_pred
+                # Mostrar sólo la consulta
+                self.pred_list.insert(tk.END, comp_pred.caption())
+                self.update_predicate_combos()
 
-            # Mostrar sólo la consulta
-            self.pred_list.insert(tk.END, comp_pred.caption())
-            self.update_predicate_combos()
+                self.display_matrix(result, ids1, ids2, f"{result_name} ({pred1} {op} {pred2})", predicate_name=result_name)
+                messagebox.showinfo("Éxito", f"Operación guardada como: {result_name}")
 
-            self.display_matrix(result, ids1, ids2, f"{result_name} ({pred1} {op} {pred2})", predicate_name=result_name)
-            messagebox.showinfo("Éxito", f"Operación guardada como: {result_name}")
+            except Exception as e:
+                messagebox.showerror("Error", f"Error aplicando operador: {e}")
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Error aplicando operador: {e}")
+        self.generate_truth_matrices([pred1, pred2], combine)
 
     def apply_matrix_not(self):
         pred_name = self.not_pred.get()
@@ -1185,9 +1451,17 @@ class LogicQueryApp:
             messagebox.showerror("Error", f"Ya existe un predicado llamado '{result_name}'")
             return
 
-        matrix, ids = self.generate_truth_matrix(pred_name)
-        if matrix is not None:
-            result = self.matrix_NOT(matrix)
+        def negate(results):
+            matrix, ids = results[0]
+            if matrix is None:
+                return
+            if result_name in self.predicates:
+                messagebox.showerror("Error", f"Ya existe un predicado llamado '{result_name}'")
+                return
+            with self.engine.stats.stage("logic_op", f"NOT {pred_name}") as record:
+                result = self.engine.matrix_NOT(matrix)
+                record.cells = result.shape[0] * result.shape[1]
+                record.bytes = result.nbytes
 
             comp_pred = CompoundPredicate(result_name, LogicOp.NOT, [pred_name])
             self.predicates[result_name] = comp_pred
@@ -1198,161 +1472,7 @@ class LogicQueryApp:
             self.display_matrix(result, ids, ids, f"{result_name} (NOT {pred_name})", predicate_name=result_name)
             messagebox.showinfo("Éxito", f"Operación guardada como: {result_name}")
 
-    # ---------- APLICAR CUANTIFICADORES ANIDADOS ----------
-    def _quantified_notation(self, q1, q2, order, formula_name):
-        """Devuelve la consulta en notación de libro."""
-        if order == "X→Y":
-            return f"{q1}x {q2}y {formula_name}(x,y)"
-        else:
-            return f"{q1}y {q2}x {formula_name}(x,y)"
-
-    def _apply_nested_quantifiers(self, matrix, ids, q1, q2, order, formula_name):
-        """
-        Implementa los 6 casos sobre la matriz T (ids está en el mismo orden para X y Y).
-        Devuelve: (mensaje_resumen, df_resultado, example_ids, counter_ids)
-        """
-        example_ids = set()
-        counter_ids = set()
-        df = None
-        qstr = self._quantified_notation(q1, q2, order, formula_name)
-
-        # Orden X→Y (barrido por filas)
-        if order == "X→Y":
-            if q1 == "∃" and q2 == "∃":
-                if np.any(matrix):
-                    i, j = np.argwhere(matrix)[0]
-                    x_id, y_id = ids[i], ids[j]
-                    msg = f"✅ {qstr} es VERDADERA. Testigo (x,y)=({x_id}, {y_id})."
-                    example_ids.update([x_id, y_id])
-                    df = pd.DataFrame({"x":[x_id], "y":[y_id]})
-                else:
-                    msg = f"❌ {qstr} es FALSA. (Toda la matriz es F). Contraejemplo: no existe ningún par (x,y) verdadero."
-                    df = pd.DataFrame(columns=["x","y"])
-                return msg, df, example_ids, counter_ids
-
-            if q1 == "∀" and q2 == "∀":
-                if np.all(matrix):
-                    msg = f"✅ {qstr} es VERDADERA (toda la matriz es V)."
-                    example_ids.update(ids)
-                    df = None
-                else:
-                    bad_coords = np.argwhere(~matrix)
-                    i, j = bad_coords[0]
-                    x_id, y_id = ids[int(i)], ids[int(j)]
-                    msg = f"❌ {qstr} es FALSA. Contraejemplo: (x={x_id}, y={y_id}) con valor F."
-                    rows = [ids[i] for i, _ in bad_coords[:200]]
-                    cols = [ids[j] for _, j in bad_coords[:200]]
-                    df = pd.DataFrame({"x": rows, "y": cols})
-                    counter_ids.update(rows + cols)
-                return msg, df, example_ids, counter_ids
-
-            if q1 == "∃" and q2 == "∀":
-                row_all = matrix.all(axis=1)
-                idxs = np.where(row_all)[0]
-                if len(idxs) > 0:
-                    i = int(idxs[0])
-                    x_id = ids[i]
-                    msg = f"✅ {qstr} es VERDADERA. Testigo x={x_id} (fila completa V)."
-                    example_ids.add(x_id); example_ids.update(ids)
-                    df = pd.DataFrame({"x_testigo":[x_id]})
-                else:
-                    # contraejemplo: cualquier fila; elegimos la primera fila con algún F y señalamos un y concreto
-                    i = int(np.where(~row_all)[0][0])
-                    j = int(np.where(~matrix[i])[0][0])
-                    x_id, y_id = ids[i], ids[j]
-                    msg = f"❌ {qstr} es FALSA. Contraejemplo: para x={x_id} existe y={y_id} con F (de hecho, toda la fila es F)."
-                    df = pd.DataFrame({"x_sin_todo_V": [x_id]})
-                    counter_ids.add(x_id); counter_ids.add(y_id)
-                return msg, df, example_ids, counter_ids
-
-            if q1 == "∀" and q2 == "∃":
-                row_any = matrix.any(axis=1)
-                bad_idxs = np.where(~row_any)[0]
-                if len(bad_idxs) == 0:
-                    msg = f"✅ {qstr} es VERDADERA. Cada fila tiene al menos un V."
-                    example_ids.update(ids)
-                    df = None
-                else:
-                    i = int(bad_idxs[0])
-                    # toda la fila i es F; tomamos el primer y de esa fila
-                    j = int(np.where(~matrix[i])[0][0])
-                    x_id, y_id = ids[i], ids[j]
-                    msg = f"❌ {qstr} es FALSA. Contraejemplo: x={x_id} no tiene ningún y con V (por ejemplo y={y_id})."
-                    bad_ids = [ids[int(k)] for k in bad_idxs]
-                    df = pd.DataFrame({"x_sin_testigo_y": bad_ids})
-                    counter_ids.update(bad_ids + [y_id])
-                return msg, df, example_ids, counter_ids
-
-            raise ValueError("Combinación no soportada para orden X→Y.")
-
-        # Orden Y→X (barrido por columnas)
-        if order == "Y→X":
-            if q1 == "∃" and q2 == "∃":
-                if np.any(matrix):
-                    i, j = np.argwhere(matrix)[0]
-                    x_id, y_id = ids[i], ids[j]
-                    msg = f"✅ {qstr} es VERDADERA. Testigo (y,x)=({y_id}, {x_id})."
-                    example_ids.update([x_id, y_id])
-                    df = pd.DataFrame({"y":[y_id], "x":[x_id]})
-                else:
-                    msg = f"❌ {qstr} es FALSA. (Toda la matriz es F)."
-                    df = pd.DataFrame(columns=["y","x"])
-                return msg, df, example_ids, counter_ids
-
-            if q1 == "∀" and q2 == "∀":
-                if np.all(matrix):
-                    msg = f"✅ {qstr} es VERDADERA (toda la matriz es V)."
-                    example_ids.update(ids)
-                    df = None
-                else:
-                    bad_coords = np.argwhere(~matrix)
-                    i, j = bad_coords[0]
-                    x_id, y_id = ids[int(i)], ids[int(j)]
-                    msg = f"❌ {qstr} es FALSA. Contraejemplo: (y={y_id}, x={x_id}) con F."
-                    rows = [ids[i] for i, _ in bad_coords[:200]]
-                    cols = [ids[j] for _, j in bad_coords[:200]]
-                    df = pd.DataFrame({"y": cols, "x": rows})
-                    counter_ids.update(rows + cols)
-                return msg, df, example_ids, counter_ids
-
-            if q1 == "∃" and q2 == "∀":
-                col_all = matrix.all(axis=0)
-                idxs = np.where(col_all)[0]
-                if len(idxs) > 0:
-                    j = int(idxs[0])
-                    y_id = ids[j]
-                    msg = f"✅ {qstr} es VERDADERA. Testigo y={y_id} (columna completa V)."
-                    example_ids.add(y_id); example_ids.update(ids)
-                    df = pd.DataFrame({"y_testigo":[y_id]})
-                else:
-                    j = int(np.where(~col_all)[0][0])
-                    i = int(np.where(~matrix[:, j])[0][0])
-                    y_id, x_id = ids[j], ids[i]
-                    msg = f"❌ {qstr} es FALSA. Contraejemplo: para y={y_id} existe x={x_id} con F (de hecho, ninguna columna es toda V)."
-                    df = pd.DataFrame({"y_sin_todo_V":[y_id]})
-                    counter_ids.update([y_id, x_id])
-                return msg, df, example_ids, counter_ids
-
-            if q1 == "∀" and q2 == "∃":
-                col_any = matrix.any(axis=0)
-                bad_idxs = np.where(~col_any)[0]
-                if len(bad_idxs) == 0:
-                    msg = f"✅ {qstr} es VERDADERA. Cada columna tiene al menos un V."
-                    example_ids.update(ids)
-                    df = None
-                else:
-                    j = int(bad_idxs[0])
-                    i = int(np.where(~matrix[:, j])[0][0])
-                    y_id, x_id = ids[j], ids[i]
-                    msg = f"❌ {qstr} es FALSA. Contraejemplo: y={y_id} no tiene ningún x con V (por ejemplo x={x_id})."
-                    bad_ids = [ids[int(k)] for k in bad_idxs]
-                    df = pd.DataFrame({"y_sin_testigo_x": bad_ids})
-                    counter_ids.update(bad_ids + [x_id])
-                return msg, df, example_ids, counter_ids
-
-            raise ValueError("Combinación no soportada para orden Y→X.")
-
-        raise ValueError("Orden de cuantificadores no reconocido.")
+        self.generate_truth_matrices([pred_name], negate)
 
     # ---------- CONSULTAS CUANTIFICADAS ----------
     def execute_quantified_query(self):
@@ -1361,63 +1481,182 @@ class LogicQueryApp:
             return
 
         formula_raw = self.run_formula_name.get().strip()
-        formula_name = self._resolve_predicate_name_input(formula_raw)
+        formula_name = self.engine.resolve_predicate_name(formula_raw)
         if not formula_name:
             messagebox.showerror("Error", f"Predicado/Fórmula '{formula_raw}' no encontrado.")
             return
 
         qx = self.quant_x.get()
-        qy = self.quant_y.get()
+        qy = None if self.quant_y.get() == NO_QUANTIFIER else self.quant_y.get()
         order = self.quant_order.get()
 
-        ids_x, ids_y = self._domains()
-        if not ids_x or not ids_y:
+        if not self.engine.domain_ids():
             messagebox.showerror("Error", "No hay dominio para X/Y (revisa la columna ID).")
             return
 
-        try:
-            matrix, ids = self.generate_truth_matrix(formula_name)
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo generar la matriz de verdad: {e}")
-            return
+        # Cada consulta es un trabajo independiente; pueden correr varias a la vez
+        key = self.engine.result_key(formula_name)
 
-        if matrix is None or len(ids) == 0:
-            messagebox.showerror("Error", "Matriz de verdad vacía o no válida.")
-            return
+        def work(job):
+            return self.engine.run_query(formula_name, qx, qy, order,
+                                         on_progress=job.report, should_cancel=lambda: job.cancelled)
+
+        def show(result):
+            self.populate_results(result.table, result.message)
+            # Sin filas en la tabla (∀∃ verdadera, ∃∃ falsa...) no hay testigos que exportar: queda el resumen
+            has_evidence = result.table is not None and len(result.table) > 0
+            self.last_query = (formula_name, qx, qy, order, key) if has_evidence else None
+            self.highlight_dataset_rows(result.example_ids, result.counter_ids)
 
+        notation = self.engine.quantified_notation(qx, qy, order, formula_name)
+        self.start_job(f"Evaluando {notation}", work, show, error_prefix="Fallo en evaluación de la consulta: ")
+
+    def execute_query_batch(self):
+        if self.data is None:
+            messagebox.showerror("Error", "Carga un dataset primero.")
+            return
+        filename = filedialog.askopenfilename(
+            filetypes=[("Consultas (una por línea)", "*.txt"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
         try:
-            msg, df, example_ids, counter_ids = self._apply_nested_quantifiers(matrix, ids, qx, qy, order, formula_name)
-        except Exception as e:
-            messagebox.showerror("Error", f"Fallo en evaluación de cuantificadores: {e}")
+            queries = read_queries(filename)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo leer el archivo de consultas: {e}")
+            return
+        if not queries:
+            messagebox.showinfo("Información", "El archivo no tiene consultas.")
             return
 
-        self.populate_results(df, msg)
-        self.highlight_dataset_rows(example_ids, counter_ids)
-
-    def populate_results(self, df, message):
+        # Todas en un solo trabajo: cada predicado se evalúa y se reduce una vez
+        def work(job):
+            return self.engine.run_batch(queries, on_progress=job.report, should_cancel=lambda: job.cancelled)
+
+        def show(table):
+            n_true = int(table["verdadera"].eq(True).sum())
+            n_error = int(table["verdadera"].isna().sum())
+            message = f"Lote de {len(table)} consultas: {n_true} verdaderas, {len(table) - n_true - n_error} falsas"
+            if n_error:
+                message += f", {n_error} con error"
+            self.populate_results(table, message + ".")
+            self.last_query = None
+            self.highlight_dataset_rows()
+
+        self.start_job(f"Evaluando {len(queries)} consultas", work, show,
+                       error_prefix="Fallo en evaluación del lote: ")
+
+    def clear_results(self):
+        """Vacía la tabla de resultados: los de otros datos ya no se pueden exportar."""
         for item in self.result_tree.get_children():
             self.result_tree.delete(item)
+        self.last_result_df = None
+        self.last_query = None
 
-        if df is None or len(getattr(df, "columns", [])) == 0:
-            self.result_tree["columns"] = ["Resultado"]
-            self.result_tree.heading("Resultado", text="Resultado")
-            self.result_tree.column("Resultado", width=800)
-            self.result_tree.insert("", "end", values=[message])
-            self.last_result_df = pd.DataFrame({"Resultado":[message]})
-        else:
-            cols = list(df.columns)
-            self.result_tree["columns"] = cols
-            for c in cols:
-                self.result_tree.heading(c, text=c)
-                self.result_tree.column(c, width=200)
-            max_rows = min(len(df), 5000)
-            for _, row in df.iloc[:max_rows].iterrows():
-                self.result_tree.insert("", "end", values=list(row))
-            self.last_result_df = df.copy()
+    def populate_results(self, df, message):
+        with self.engine.stats.stage("render", "resultados") as record:
+            for item in self.result_tree.get_children():
+                self.result_tree.delete(item)
+
+            if df is None or len(getattr(df, "columns", [])) == 0:
+                self.result_tree["columns"] = ["Resultado"]
+                self.result_tree.heading("Resultado", text="Resultado")
+                self.result_tree.column("Resultado", width=800)
+                self.result_tree.insert("", "end", values=[message])
+                self.last_result_df = pd.DataFrame({"Resultado":[message]})
+            else:
+                cols = list(df.columns)
+                self.result_tree["columns"] = cols
+                for c in cols:
+                    self.result_tree.heading(c, text=c)
+                    self.result_tree.column(c, width=200)
+                max_rows = min(len(df), RESULT_TREE_MAX_ROWS)
+                for row in df.iloc[:max_rows].itertuples(index=False):
+                    self.result_tree.insert("", "end", values=list(row))
+                self.last_result_df = df.copy()
+                record.cells = max_rows * len(cols)
+                if max_rows < len(df):
+                    message += f" (se muestran {max_rows:,} de {len(df):,} filas; Exportar Resultado escribe todas)"
 
         self.status_var.set(message)
 
+    # ---------- estadísticas ----------
+    def show_stats_window(self):
+        """Totales por etapa y las últimas etapas con su desglose (ver EngineStats)."""
+        window = tk.Toplevel(self.root)
+        window.title("Estadísticas de rendimiento")
+        window.geometry("900x560")
+        frame = ttk.Frame(window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = (("veces", "Veces", 60), ("tiempo", "Tiempo", 90), ("celdas", "Celdas", 130),
+                   ("bytes", "Memoria", 90), ("cache", "Caché (aciertos/consultas)", 170))
+
+        def make_tree(title, height):
+            ttk.Label(frame, text=title, font=("TkDefaultFont", 10, "bold")).pack(anchor="w")
+            tree = ttk.Treeview(frame, columns=[c[0] for c in columns], show="tree headings", height=height)
+            tree.heading("#0", text="Etapa")
+            tree.column("#0", width=300)
+            for col, text, width in columns:
+                tree.heading(col, text=text)
+                tree.column(col, width=width, anchor="e")
+            return tree
+
+        def values(count, seconds, cells, nbytes, hits, misses):
+            return (count, format_seconds(seconds), f"{cells:,}" if cells else "",
+                    format_bytes(nbytes) if nbytes else "", f"{hits}/{hits + misses}" if hits or misses else "")
+
+        totals = make_tree("Totales por etapa", 8)
+        totals.pack(fill=tk.X, pady=(0, 10))
+        recent = make_tree("Últimas etapas (la más reciente arriba)", 12)
+        recent.pack(fill=tk.BOTH, expand=True)
+
+        def refresh():
+            totals.delete(*totals.get_children())
+            recent.delete(*recent.get_children())
+            for stage, t in self.engine.stats.summary().items():
+                totals.insert("", "end", text=STAGE_LABELS.get(stage, stage),
+                              values=values(t["count"], t["seconds"], t["cells"], t["bytes"],
+                                            t["cache_hits"], t["cache_misses"]))
+
+            def add(parent, record):
+                item = recent.insert(parent, "end", text=f"{record.label} {record.detail}".rstrip(),
+                                     values=values("", record.seconds, record.cells, record.bytes,
+                                                   record.cache_hits, record.cache_misses))
+                for child in record.children:
+                    add(item, child)
+
+            for record in reversed(self.engine.stats.since(0)):
+                add("", record)
+
+        def clear():
+            self.engine.stats.clear()
+            refresh()
+
+        buttons = ttk.Frame(frame)
+        buttons.pack(pady=(10, 0))
+        ttk.Button(buttons, text="Actualizar", command=refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Limpiar", command=clear).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Cerrar", command=window.destroy).pack(side=tk.LEFT, padx=5)
+        refresh()
+
     def export_results(self):
+        # Si desde la consulta cambiaron los datos o la fórmula, los testigos ya no
+        # coincidirían con lo mostrado: queda la tabla
+        if self.last_query is not None:
+            key = self.engine.result_key(self.last_query[0])
+            if key is None or key != self.last_query[-1]:
+                self.last_query = None
+        if self.last_query is not None and self.data is not None:
+            full = messagebox.askyesnocancel(
+                "Exportar Resultado",
+                "¿Exportar todos los testigos/contraejemplos de la consulta?\n"
+                "Sí: el conjunto completo (CSV, CSV comprimido o NumPy).\nNo: sólo la tabla mostrada.")
+            if full is None:
+                return
+            if full:
+                self.export_evidence()
+                return
         if self.last_result_df is None or len(self.last_result_df) == 0:
             messagebox.showerror("Error", "No hay resultados para exportar.")
             return
@@ -1430,6 +1669,27 @@ class LogicQueryApp:
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar: {e}")
 
+    def export_evidence(self):
+        """Todos los testigos/contraejemplos de la última consulta, no sólo los de la tabla."""
+        fname = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("CSV comprimido", "*.csv.gz"), ("Posiciones (NumPy)", "*.npy")]
+        )
+        if not fname:
+            return
+        formula_name, qx, qy, order, _ = self.last_query
+
+        def work(job):
+            return self.engine.export_evidence(fname, formula_name, qx, qy, order,
+                                               on_progress=job.report, should_cancel=lambda: job.cancelled)
+
+        def done(rows):
+            self.status_var.set(f"Exportadas {rows:,} filas a {os.path.basename(fname)}.")
+            messagebox.showinfo("Éxito", f"Resultados exportados: {rows:,} filas.")
+
+        self.start_job("Exportando resultados", work, done, error_prefix="No se pudo exportar: ",
+                       keep_if_reloaded=True)   # el archivo ya está escrito
+
 # ----------------------------
 #           Main
 # ----------------------------
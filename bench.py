@@ -0,0 +1,442 @@
+"""
+Banco de pruebas de rendimiento de la evaluación, con datasets sintéticos
+de tamaño creciente y resultados en JSON para comparar versiones.
+
+    python bench.py --output bench_base.json
+    python bench.py --sizes 100 1000 10000 100000 --output bench_nuevo.json --compare bench_base.json
+
+Los datasets tienen la forma de country_wise_latest.csv, day_wise.csv y
+logic_query_test_dataset.csv (columnas numéricas, de fecha, categóricas y de
+texto) y se generan con una semilla fija, así que dos corridas con los mismos
+argumentos miden exactamente los mismos datos. Para cada dataset y cada N se
+mide:
+
+    load_dataset              read_dataset y open_dataset (con y sin instantánea) de un CSV
+    generate_truth_matrix     la matriz completa de cada RelOp sobre cada tipo de columna
+    logic_op                  cada LogicOp sobre dos matrices ya en caché
+    apply_nested_quantifiers  los 8 casos de cuantificadores sobre una matriz ya calculada
+    run_query                 consulta perezosa de extremo a extremo, sin caché
+    display_data / display_matrix   las vistas de la GUI (sólo si hay display)
+
+Cada caso se repite --repeat veces (se guardan el mínimo y la mediana) y se
+corre una vez más con tracemalloc para el pico de memoria; la memoria de los
+procesos del pool paralelo (N >= PARALLEL_MIN_SIZE) no entra en ese pico.
+Las etapas que construyen la matriz NxN completa se omiten con N mayor que
+--max-matrix-n y quedan en el JSON como omitidas.
+
+Con --compare se imprime la razón nuevo/base de cada caso; si alguna supera
+--budget el programa termina con código 1, para usarlo como presupuesto.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from engine import (CompoundPredicate, LOGIC_OPS, LogicEngine, LogicOp, PARALLEL_WORKERS,
+                    RelOp, SimplePredicate)
+from loader import open_dataset, read_dataset
+
+BENCH_FORMAT_VERSION = 1
+DEFAULT_SIZES = [100, 1000, 10_000, 100_000]
+DEFAULT_REPEAT = 3
+DEFAULT_SEED = 20240101
+MAX_MATRIX_N = 10_000         # por encima no se construyen matrices NxN completas
+DEFAULT_BUDGET = 1.25         # razón nuevo/base tolerada con --compare
+BUDGET_MIN_SECONDS = 0.02     # casos más rápidos que esto son ruido y no cuentan para el presupuesto
+
+ORDER_OPS = [RelOp.GT, RelOp.LT, RelOp.GE, RelOp.LE, RelOp.EQ, RelOp.NE]
+# Operadores que se miden según el tipo de columna
+KIND_OPS = {
+    "numeric": ORDER_OPS,
+    "float": ORDER_OPS,
+    "datetime": ORDER_OPS,
+    "categorical": [RelOp.EQ, RelOp.NE],
+    "unique": [RelOp.EQ, RelOp.NE],
+    "text": [RelOp.EQ, RelOp.CONTAINS, RelOp.STARTS_WITH, RelOp.ENDS_WITH],
+}
+QUANTIFIER_CASES = [(q1, q2, order) for order in ("X→Y", "Y→X") for q1 in ("∀", "∃") for q2 in ("∀", "∃")]
+
+WHO_REGIONS = ["Africa", "Americas", "Eastern Mediterranean", "Europe", "South-East Asia", "Western Pacific"]
+REGIONS = ["North", "South", "East", "West", "Central"]
+WORD_STEMS = ["alpha", "beta", "gamma", "delta", "epsilon", "omega",
+              "sigma", "omicron", "kappa", "lambda", "theta", "zeta"]
+WORD_SUFFIXES = ["", "bet", "numeric", "s", "ic", "-2"]
+
+# ---------- datasets sintéticos ----------
+def _dates(n, start, days=1):
+    """n fechas cada days días; si se saldrían del rango de pandas (año 2262), cada hora."""
+    return pd.date_range(start, periods=n, freq=f"{days}D" if n * days <= 80_000 else "h")
+
+def make_country_wise(n, rng):
+    """Como country_wise_latest.csv: un país único por fila, acumulados, tasas y región OMS."""
+    confirmed = rng.lognormal(8, 2.5, n).astype(np.int64)
+    deaths = (confirmed * rng.uniform(0, 0.08, n)).astype(np.int64)
+    recovered = (confirmed * rng.uniform(0.2, 0.95, n)).astype(np.int64)
+    new_cases = rng.poisson(100, n)
+    last_week = np.maximum(confirmed - rng.poisson(700, n), 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({
+            "Country/Region": [f"Country {i:06d}" for i in range(n)],
+            "Confirmed": confirmed,
+            "Deaths": deaths,
+            "Recovered": recovered,
+            "Active": confirmed - deaths - recovered,
+            "New cases": new_cases,
+            "New deaths": rng.poisson(5, n),
+            "New recovered": rng.poisson(60, n),
+            "Deaths / 100 Cases": np.round(100 * deaths / np.maximum(confirmed, 1), 2),
+            "Recovered / 100 Cases": np.round(100 * recovered / np.maximum(confirmed, 1), 2),
+            "Deaths / 100 Recovered": np.round(np.where(recovered > 0, 100 * deaths / np.maximum(recovered, 1), np.inf), 2),
+            "Confirmed last week": last_week,
+            "1 week change": confirmed - last_week,
+            "1 week % increase": np.round(100 * (confirmed - last_week) / np.maximum(last_week, 1), 2),
+            "WHO Region": rng.choice(WHO_REGIONS, n),
+        })
+
+def make_day_wise(n, rng):
+    """Como day_wise.csv: una fecha por fila con acumulados crecientes."""
+    new_cases = rng.poisson(50_000, n)
+    new_deaths = rng.poisson(1_500, n)
+    new_recovered = rng.poisson(30_000, n)
+    confirmed = np.cumsum(new_cases) + 555
+    deaths = np.cumsum(new_deaths) + 17
+    recovered = np.cumsum(new_recovered) + 28
+    return pd.DataFrame({
+        "Date": _dates(n, "2020-01-22"),
+        "Confirmed": confirmed,
+        "Deaths": deaths,
+        "Recovered": recovered,
+        "Active": confirmed - deaths - recovered,
+        "New cases": new_cases,
+        "New deaths": new_deaths,
+        "New recovered": new_recovered,
+        "Deaths / 100 Cases": np.round(100 * deaths / confirmed, 2),
+        "Recovered / 100 Cases": np.round(100 * recovered / confirmed, 2),
+        "Deaths / 100 Recovered": np.round(100 * deaths / recovered, 2),
+        "No. of countries": np.minimum(6 + np.arange(n) // 2, 187),
+    })
+
+def make_logic_test(n, rng):
+    """Como logic_query_test_dataset.csv: ID, fecha semanal, enteros pequeños, región y texto corto."""
+    words = np.array([stem + suffix for stem in WORD_STEMS for suffix in WORD_SUFFIXES])
+    return pd.DataFrame({
+        "ID": [f"R{i + 1:06d}" for i in range(n)],
+        "Date": _dates(n, "2024-01-01", days=7),
+        "Deaths": rng.integers(0, 30, n),
+        "Recovered": rng.integers(0, 30, n),
+        "Region": rng.choice(REGIONS, n),
+        "Description": rng.choice(words, n),
+    })
+
+# nombre -> (generador, columna ID, tipo de columna -> columna)
+DATASETS = {
+    "country_wise": (make_country_wise, "Country/Region", {
+        "numeric": "Confirmed", "float": "Deaths / 100 Cases",
+        "categorical": "WHO Region", "unique": "Country/Region"}),
+    "day_wise": (make_day_wise, "Date", {
+        "numeric": "Deaths", "float": "Recovered / 100 Cases", "datetime": "Date"}),
+    "logic_test": (make_logic_test, "ID", {
+        "numeric": "Deaths", "datetime": "Date", "categorical": "Region", "text": "Description"}),
+}
+
+def make_dataset(name, n, seed):
+    """El dataset sintético name con n filas; la misma semilla da siempre los mismos datos."""
+    generator = DATASETS[name][0]
+    return generator(n, np.random.default_rng([seed, n, list(DATASETS).index(name)]))
+
+# ---------- medición ----------
+def measure(fn, setup=None, teardown=None, repeat=DEFAULT_REPEAT):
+    """
+    Tiempos de fn() en repeat corridas (setup/teardown fuera del tiempo) y
+    pico de memoria de una corrida extra con tracemalloc.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if teardown is not None:
+            teardown()
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        if teardown is not None:
+            teardown()
+    return {"seconds": min(times), "median": statistics.median(times), "repeat": repeat, "peak_bytes": peak}
+
+class BenchRun:
+    """Acumula los resultados de una corrida y los imprime a medida que salen."""
+    def __init__(self, repeat, max_matrix_n, verbose=True):
+        self.repeat = repeat
+        self.max_matrix_n = max_matrix_n
+        self.verbose = verbose
+        self.results = []
+
+    def record(self, dataset, n, stage, case, fn, setup=None, teardown=None):
+        entry = {"dataset": dataset, "n": n, "stage": stage, "case": case}
+        try:
+            entry.update(measure(fn, setup, teardown, self.repeat))
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        self._add(entry)
+
+    def skip(self, dataset, n, stage, case, reason):
+        self._add({"dataset": dataset, "n": n, "stage": stage, "case": case, "skipped": reason})
+
+    def _add(self, entry):
+        self.results.append(entry)
+        if self.verbose:
+            print(format_entry(entry), flush=True)
+
+def _label(entry):
+    return f"{entry['dataset']:<13} N={entry['n']:<7} {entry['stage']:<25} {entry['case']:<42}"
+
+def format_entry(entry):
+    label = _label(entry)
+    if "skipped" in entry:
+        return f"{label}  (omitido: {entry['skipped']})"
+    if "error" in entry:
+        return f"{label}  ERROR {entry['error']}"
+    return f"{label}  {entry['seconds'] * 1000:10.2f} ms  pico {entry['peak_bytes'] / 2**20:8.1f} MiB"
+
+# ---------- etapas ----------
+def bench_load(run, name, n, df, folder):
+    """read_dataset y open_dataset sobre el CSV del dataset sintético."""
+    path = os.path.join(folder, f"{name}-{n}.csv")
+    df.to_csv(path, index=False)
+    run.record(name, n, "load_dataset", "read_dataset", lambda: read_dataset(path))
+    run.record(name, n, "load_dataset", "open_dataset (sin instantánea)",
+               lambda: open_dataset(path, use_snapshot=False))
+    # La primera llamada guarda la instantánea; las medidas la leen
+    open_dataset(path)
+    run.record(name, n, "load_dataset", "open_dataset (instantánea)", lambda: open_dataset(path))
+
+def _var_predicate(name, attr, op):
+    return SimplePredicate(name, attr, op, "X", {"type": "var", "var": "Y"})
+
+def bench_engine(run, name, n, df):
+    """Matrices por RelOp y LogicOp, cuantificadores y consultas perezosas."""
+    id_column, kinds = DATASETS[name][1], DATASETS[name][2]
+    engine = LogicEngine()
+    engine.set_data(df, id_column)
+    reset = lambda: engine.set_data(df, id_column)
+    full = n <= run.max_matrix_n
+    too_big = f"N > --max-matrix-n ({run.max_matrix_n})"
+
+    leaves = []
+    for kind, attr in kinds.items():
+        for op in KIND_OPS[kind]:
+            pred = engine.add_predicate(_var_predicate(f"p{len(engine.predicates)}", attr, op))
+            case = f"{attr} {op} ({kind})"
+            if full:
+                run.record(name, n, "generate_truth_matrix", case,
+                           lambda p=pred.name: engine.generate_truth_matrix(p), setup=reset)
+            else:
+                run.skip(name, n, "generate_truth_matrix", case, too_big)
+            # Hojas de las fórmulas: el primer > y el primer = de otra columna
+            if (op == RelOp.GT and not leaves) or (op == RelOp.EQ and len(leaves) == 1
+                                                     and engine.predicates[leaves[0]].attr != attr):
+                leaves.append(pred.name)
+
+    # Cada LogicOp sobre dos matrices que ya están en la caché
+    def warm_leaves():
+        reset()
+        for leaf in leaves:
+            engine.generate_truth_matrix(leaf)
+
+    for op in LOGIC_OPS:
+        args = leaves[:1] if op == LogicOp.NOT else leaves[:2]
+        pred = engine.add_predicate(CompoundPredicate(f"P_{op}", op, list(args)))
+        case = f"{op}({', '.join(engine.predicates[a].attr for a in args)})"
+        if full:
+            run.record(name, n, "logic_op", case,
+                       lambda p=pred.name: engine.generate_truth_matrix(p), setup=warm_leaves)
+        else:
+            run.skip(name, n, "logic_op", case, too_big)
+
+    # Los 8 casos sobre la matriz ya calculada (incluye la pasada de any/all)
+    formula = f"P_{LogicOp.AND}"
+    if full:
+        reset()
+        matrix, ids = engine.generate_truth_matrix(formula)
+        for q1, q2, order in QUANTIFIER_CASES:
+            run.record(name, n, "apply_nested_quantifiers", f"{q1}{q2} {order}",
+                       lambda q1=q1, q2=q2, order=order: engine.apply_nested_quantifiers(
+                           matrix, ids, q1, q2, order, formula))
+    else:
+        for q1, q2, order in QUANTIFIER_CASES:
+            run.skip(name, n, "apply_nested_quantifiers", f"{q1}{q2} {order}", too_big)
+
+    # De extremo a extremo y sin caché: la ruta que usa la GUI con N grande
+    for leaf in leaves:
+        pred = engine.predicates[leaf]
+        run.record(name, n, "run_query", f"∀x ∃y {pred.attr} {pred.op}",
+                   lambda p=leaf: engine.run_query(p, "∀", "∃"), setup=reset)
+    return engine
+
+def bench_gui(run, name, n, df, engine, root):
+    """DatasetTableView y MatrixCanvasView como los crean display_data y display_matrix."""
+    if root is None:
+        run.skip(name, n, "display_data", "DatasetTableView", "sin display")
+        run.skip(name, n, "display_matrix", "MatrixCanvasView", "sin display")
+        return
+    from tkinter import ttk
+    from app import DatasetTableView, MatrixCanvasView
+
+    holder = {}
+
+    def teardown():
+        holder.pop("frame").destroy()
+
+    def show_data():
+        holder["frame"] = frame = ttk.Frame(root)
+        view = DatasetTableView(frame, df, positions_of=engine.positions_of)
+        view.frame.grid(row=0, column=0, sticky="nsew")
+        frame.pack(fill="both", expand=True)
+        root.update()
+
+    run.record(name, n, "display_data", "DatasetTableView", show_data, teardown=teardown)
+    if n > run.max_matrix_n:
+        run.skip(name, n, "display_matrix", "MatrixCanvasView", f"N > --max-matrix-n ({run.max_matrix_n})")
+        return
+    matrix, ids = engine.generate_truth_matrix(f"P_{LogicOp.AND}")
+
+    def show_matrix():
+        holder["frame"] = frame = ttk.Frame(root)
+        view = MatrixCanvasView(frame, matrix, list(ids), list(ids))
+        view.frame.grid(row=0, column=0, sticky="nsew")
+        frame.pack(fill="both", expand=True)
+        root.update()
+
+    run.record(name, n, "display_matrix", "MatrixCanvasView", show_matrix, teardown=teardown)
+
+def gui_root():
+    """Ventana raíz de Tk para medir las vistas, o None si no hay display."""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:
+        return None
+    root.geometry("1000x650")
+    return root
+
+# ---------- resultados ----------
+def environment():
+    """Versiones y máquina, para saber qué se está comparando."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parallel_workers": PARALLEL_WORKERS,
+    }
+
+def case_key(entry):
+    return entry["dataset"], entry["n"], entry["stage"], entry["case"]
+
+def compare(results, baseline, budget):
+    """
+    Imprime la razón nuevo/base de cada caso medido en ambas corridas y
+    devuelve los casos que superan el presupuesto.
+    """
+    base = {case_key(e): e for e in baseline if "seconds" in e}
+    over = []
+    for entry in results:
+        old = base.get(case_key(entry))
+        if old is None or "seconds" not in entry:
+            continue
+        ratio = entry["seconds"] / old["seconds"] if old["seconds"] > 0 else float("inf")
+        counted = max(entry["seconds"], old["seconds"]) >= BUDGET_MIN_SECONDS
+        flag = "  <-- fuera de presupuesto" if counted and ratio > budget else ""
+        print(f"{_label(entry)} {old['seconds'] * 1000:10.2f} -> "
+              f"{entry['seconds'] * 1000:10.2f} ms  x{ratio:5.2f}{flag}")
+        if flag:
+            over.append(entry)
+    return over
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento con datasets sintéticos.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="valores de N")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="corridas por caso (se guarda el mínimo)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--max-matrix-n", type=int, default=MAX_MATRIX_N,
+                        help="N máximo para las etapas que construyen la matriz NxN completa")
+    parser.add_argument("--no-gui", action="store_true", help="no medir las vistas de la GUI")
+    parser.add_argument("--output", help="JSON con los resultados")
+    parser.add_argument("--compare", help="JSON de una corrida anterior con el que comparar")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="razón nuevo/base máxima tolerada con --compare")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("version") != BENCH_FORMAT_VERSION:
+            print(f"Error: {args.compare} no es un resultado de bench.py (versión {BENCH_FORMAT_VERSION}).",
+                  file=sys.stderr)
+            return 2
+
+    run = BenchRun(args.repeat, args.max_matrix_n)
+    root = None if args.no_gui else gui_root()
+    started = datetime.now().isoformat(timespec="seconds")
+    with tempfile.TemporaryDirectory(prefix="bench-") as folder:
+        for n in sorted(args.sizes):
+            for name in args.datasets:
+                df = make_dataset(name, n, args.seed)
+                bench_load(run, name, n, df, folder)
+                engine = bench_engine(run, name, n, df)
+                bench_gui(run, name, n, df, engine, root)
+    if root is not None:
+        root.destroy()
+
+    payload = {
+        "version": BENCH_FORMAT_VERSION,
+        "started": started,
+        "seed": args.seed,
+        "sizes": sorted(args.sizes),
+        "repeat": args.repeat,
+        "max_matrix_n": args.max_matrix_n,
+        "environment": environment(),
+        "results": run.results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+
+    failed = any("error" in e for e in run.results)
+    if baseline is not None:
+        over = compare(run.results, baseline["results"], args.budget)
+        if over:
+            print(f"{len(over)} caso(s) más lentos que x{args.budget} respecto de {args.compare}.", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
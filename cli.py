@@ -0,0 +1,120 @@
+"""
+Consultas cuantificadas desde la línea de comandos, sin interfaz gráfica.
+
+    python cli.py datos.csv --library predicados.json --query "∀x ∃y P(x,y)"
+    python cli.py datos.csv --library predicados.json --queries consultas.txt --output resultados.csv
+
+Las consultas se ejecutan en lote (LogicEngine.run_batch): la matriz de cada
+predicado se calcula una vez aunque aparezca en muchas consultas, y la salida
+es una sola tabla con una fila por consulta.
+
+Las consultas usan la notación de la aplicación: "∀x ∃y P(x,y)" es el orden
+X→Y y "∃y ∀x P(x,y)" el orden Y→X. También se aceptan "forall"/"A" y
+"exists"/"E" en lugar de ∀ y ∃. Las fórmulas unarias (sólo predicados con
+constante, p.ej. "Deaths > 1000") admiten además "∀x P(x)" y "∃x P(x)".
+
+Del dataset sólo se leen las columnas que usa la biblioteca, la columna ID y,
+si no se indica --id-column, las candidatas habituales a ID (Date/Fecha y la
+primera columna). Con --all-columns se lee todo.
+
+Con --append se agregan al final las filas de otro archivo; las matrices que
+la biblioteca trae guardadas para el dataset base se extienden sin recalcularse:
+
+    python cli.py historico.csv --library predicados.json --append hoy.csv --queries consultas.txt
+
+Con --stats se imprime al final (en stderr) el tiempo, las celdas, la memoria
+y los aciertos de caché por etapa; con --stats-log cada etapa se escribe como
+una línea JSON a medida que termina.
+
+Con --evidence se escriben todos los testigos o contraejemplos de una única
+consulta (no sólo los primeros que muestra el mensaje), en streaming: .csv o
+.csv.gz con los ids, .npy con las posiciones de fila:
+
+    python cli.py datos.csv --library predicados.json --query "∀x ∃y P(x,y)" --evidence contraejemplos.csv.gz
+"""
+import argparse
+import json
+import sys
+
+from engine import EXPORT_FORMATS, STAGE_LABELS, LogicEngine, format_bytes, format_seconds, parse_query, read_queries
+from loader import columns_to_load, read_dataset
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas lógicas cuantificadas sobre un dataset (sin GUI).")
+    parser.add_argument("dataset", help="archivo CSV o Excel")
+    parser.add_argument("--library", required=True, help="biblioteca de predicados (JSON)")
+    parser.add_argument("--query", action="append", default=[], help="consulta, p.ej. '∀x ∃y P(x,y)' (repetible)")
+    parser.add_argument("--queries", help="archivo con una consulta por línea")
+    parser.add_argument("--id-column", help="columna ID (por defecto, la elección automática)")
+    parser.add_argument("--output", help="CSV con una fila por consulta (consulta, verdadera, mensaje)")
+    parser.add_argument("--all-columns", action="store_true", help="leer todas las columnas del dataset")
+    parser.add_argument("--append", action="append", default=[], help="archivo con filas nuevas a agregar (repetible)")
+    parser.add_argument("--stats", action="store_true", help="imprimir en stderr los totales por etapa")
+    parser.add_argument("--stats-log", help="archivo JSON Lines con cada etapa medida")
+    parser.add_argument("--evidence", help=f"todos los testigos/contraejemplos de la consulta ({', '.join(EXPORT_FORMATS)})")
+    args = parser.parse_args(argv)
+
+    queries = list(args.query)
+    if args.queries:
+        queries.extend(read_queries(args.queries))
+    if not queries:
+        parser.error("indica al menos una consulta con --query o --queries")
+    if args.evidence and len(queries) != 1:
+        parser.error("--evidence necesita exactamente una consulta")
+
+    engine = LogicEngine()
+    stats_log = open(args.stats_log, "w", encoding="utf-8") if args.stats_log else None
+    if stats_log is not None:
+        engine.stats.add_listener(lambda record: print(
+            json.dumps(record.as_dict(children=False), ensure_ascii=False, default=str), file=stats_log, flush=True))
+    try:
+        return run(engine, args, queries)
+    finally:
+        if stats_log is not None:
+            stats_log.close()
+        if args.stats:
+            print_stats(engine)
+
+def run(engine, args, queries):
+    """Carga biblioteca y dataset y responde las consultas; devuelve el código de salida."""
+    try:
+        engine.load_library(args.library)
+        usecols = None if args.all_columns else columns_to_load(args.dataset, engine.library_columns(), args.id_column)
+        engine.load_file(args.dataset, args.id_column, usecols=usecols)
+        for filename in args.append:
+            engine.append_rows(read_dataset(filename, usecols=list(engine.data.columns)))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    # Todas juntas: cada predicado se evalúa y se reduce una sola vez
+    results = engine.run_batch(queries)
+    failed = False
+    for row in results.itertuples(index=False):
+        if row.verdadera is None:
+            print(f"Error en {row.consulta!r}: {row.mensaje[len('Error: '):]}", file=sys.stderr)
+            failed = True
+        else:
+            print(row.mensaje)
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if args.evidence and not failed:
+        try:
+            rows = engine.export_evidence(args.evidence, *parse_query(queries[0]))
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        print(f"{rows:,} filas escritas en {args.evidence}", file=sys.stderr)
+    return 1 if failed else 0
+
+def print_stats(engine):
+    """Totales por etapa en stderr."""
+    print(f"{'etapa':<16} {'veces':>6} {'tiempo':>10} {'celdas':>16} {'memoria':>11} {'caché':>9}", file=sys.stderr)
+    for stage, t in engine.stats.summary().items():
+        lookups = t["cache_hits"] + t["cache_misses"]
+        print(f"{STAGE_LABELS.get(stage, stage):<16} {t['count']:>6} {format_seconds(t['seconds']):>10} "
+              f"{t['cells']:>16,} {format_bytes(t['bytes']):>11} {t['cache_hits']:>4}/{lookups:<4}", file=sys.stderr)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2957 @@
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+import pandas as pd
+import numpy as np
+
+from loader import append_frame, choose_id_column, open_dataset
+
+# ----------------------------
+#   Estructuras de predicados
+# ----------------------------
+
+class RelOp:
+    GT = ">"
+    LT = "<"
+    EQ = "="
+    NE = "!="
+    GE = ">="
+    LE = "<="
+    CONTAINS = "contains"
+    STARTS_WITH = "starts_with"
+    ENDS_WITH = "ends_with"
+
+REL_OPS = [
+    RelOp.EQ, RelOp.GT, RelOp.LT, RelOp.GE, RelOp.LE, RelOp.NE,
+    RelOp.CONTAINS, RelOp.STARTS_WITH, RelOp.ENDS_WITH
+]
+
+class LogicOp:
+    NOT = "NOT"
+    AND = "AND"
+    OR = "OR"
+    IMPLIES = "IMPLIES"
+    XOR = "XOR"
+    BICONDITIONAL = "BICONDITIONAL"
+
+LOGIC_OPS = [
+    LogicOp.NOT, LogicOp.AND, LogicOp.OR,
+    LogicOp.IMPLIES, LogicOp.XOR, LogicOp.BICONDITIONAL
+]
+
+class SimplePredicate:
+    """p(x,y) o p(x,const). Estructura serializable en dict."""
+    def __init__(self, name, attr, op, lhs_var, rhs):
+        self.type = "simple"
+        self.name = name          # "p" (minúsculas)
+        self.attr = attr          # columna del df
+        self.op = op              # RelOp
+        self.lhs_var = lhs_var    # "X"
+        self.rhs = rhs            # {"type":"var","var":"Y"} o {"type":"const","value":..}
+
+    def caption(self):
+        # Notación tipo libro: descripción en español de p(x,y) o p(x)
+        if self.rhs["type"] == "var":
+            return f'{self.name}(x,y): "{self._describe_comparison(self.attr, self.op)}"'
+        else:
+            return f'{self.name}(x): "{self._describe_const(self.attr, self.op, self.rhs["value"])}"'
+
+    def _describe_comparison(self, attr, op):
+        attr_text = attr
+        desc_map = {
+            RelOp.GT: f"tiene mayor {attr_text} que y",
+            RelOp.LT: f"tiene menor {attr_text} que y",
+            RelOp.GE: f"tiene {attr_text} mayor o igual que y",
+            RelOp.LE: f"tiene {attr_text} menor o igual que y",
+            RelOp.EQ: f"tiene el mismo {attr_text} que y",
+            RelOp.NE: f"tiene un {attr_text} diferente al de y",
+            RelOp.CONTAINS: f"{attr_text} de x contiene al de y",
+            RelOp.STARTS_WITH: f"{attr_text} de x comienza igual que el de y",
+            RelOp.ENDS_WITH: f"{attr_text} de x termina igual que el de y",
+        }
+        return f"x {desc_map.get(op, f'tiene {attr_text} {op} y.{attr_text}')}."
+
+    def _describe_const(self, attr, op, value):
+        attr_text = attr
+        desc_map = {
+            RelOp.GT: f"tiene {attr_text} mayor que {value}",
+            RelOp.LT: f"tiene {attr_text} menor que {value}",
+            RelOp.GE: f"tiene {attr_text} mayor o igual que {value}",
+            RelOp.LE: f"tiene {attr_text} menor o igual que {value}",
+            RelOp.EQ: f"tiene {attr_text} igual a {value}",
+            RelOp.NE: f"tiene {attr_text} diferente de {value}",
+            RelOp.CONTAINS: f"{attr_text} contiene '{value}'",
+            RelOp.STARTS_WITH: f"{attr_text} comienza con '{value}'",
+            RelOp.ENDS_WITH: f"{attr_text} termina con '{value}'",
+        }
+        return f"x {desc_map.get(op, f'tiene {attr_text} {op} {value}')}."
+
+class CompoundPredicate:
+    """P(x,y) = NOT p(x,y)  |  p(x,y) AND q(x,y)  |  p(x,y) OR q(x,y) ..."""
+    def __init__(self, name, op, args):
+        self.type = "compound"
+        self.name = name          # "P" (mayúsculas)
+        self.op = op              # LogicOp
+        self.args = args          # lista de nombres de predicados
+
+    def caption(self):
+        # Notación tipo libro: P(x,y): p(x,y) AND q(x,y)
+        if self.op == LogicOp.NOT:
+            return f"{self.name}(x,y): NOT({self.args[0]}(x,y))"
+        if self.op == LogicOp.IMPLIES:
+            if len(self.args) == 1:
+                return f"{self.name}(x,y): {self.args[0]}(x,y) IMPLIES {self.args[0]}(x,y)"
+            return f"{self.name}(x,y): {self.args[0]}(x,y) IMPLIES {self.args[1]}(x,y)"
+        if self.op == LogicOp.XOR and len(self.args) == 2:
+            return f"{self.name}(x,y): {self.args[0]}(x,y) XOR {self.args[1]}(x,y)"
+        if self.op == LogicOp.BICONDITIONAL and len(self.args) == 2:
+            return f"{self.name}(x,y): {self.args[0]}(x,y) BICONDITIONAL {self.args[1]}(x,y)"
+        if len(self.args) == 2:
+            return f"{self.name}(x,y): {self.args[0]}(x,y) {self.op} {self.args[1]}(x,y)"
+        elif len(self.args) == 1:
+            return f"{self.name}(x,y): {self.op}({self.args[0]}(x,y))"
+        return f"{self.name}: {self.op}({', '.join(self.args)})"
+
+# ----------------------------
+#     Matrices de verdad
+# ----------------------------
+
+DENSE_MATRIX_MAX_SIZE = 2048      # hasta NxN con N<=2048 se usa np.ndarray bool
+MATRIX_BLOCK_CELLS = 1 << 24      # celdas por bloque de filas al construir matrices grandes
+MATRIX_CACHE_MAX_BYTES = 512 * 1024 * 1024   # presupuesto de la caché de matrices
+PARALLEL_MIN_SIZE = 4096          # desde N>=4096 las matrices se generan con un pool de procesos
+PARALLEL_WORKERS = os.cpu_count() or 1
+# Los procesos no se crean con fork: la GUI los lanza desde un hilo con Tk y locks tomados
+PARALLEL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+SPARSE_MAX_DENSITY = 0.01         # por encima de DENSE_MATRIX_MAX_SIZE, con <1% de V (o de F) se guarda dispersa
+SPARSE_SAMPLE_ROWS = 64           # filas que se evalúan para estimar la densidad
+LIBRARY_FORMAT_VERSION = 2        # 1: sólo predicados; 2: + matrices guardadas (.matrices.npz)
+RESULT_PREVIEW_PAIRS = 200        # pares (x,y) en la tabla del resultado; export_evidence escribe todos
+EXPORT_BLOCK_CELLS = 1 << 20      # celdas leídas por vez al enumerar testigos/contraejemplos
+EXPORT_FORMATS = (".csv.gz", ".csv", ".npy")   # export_evidence: ids en CSV (comprimido o no) o posiciones
+
+# Operadores lógicos sobre np.ndarray bool (admiten broadcasting de vectores filas x 1)
+ARRAY_LOGIC = {
+    LogicOp.AND: np.logical_and,
+    LogicOp.OR: np.logical_or,
+    LogicOp.XOR: np.logical_xor,
+    LogicOp.IMPLIES: lambda a, b: np.logical_or(np.logical_not(a), b),
+    LogicOp.BICONDITIONAL: np.equal,
+}
+
+class BlockedTruthMatrix:
+    """
+    Base de las matrices de verdad que no viven como un np.ndarray bool
+    completo. Recorre la matriz por bloques de filas (o de columnas) y corta
+    en cuanto el resultado queda decidido.
+    """
+    shape = (0, 0)
+
+    def _block(self, rows, cols):
+        """Bloque bool para los slices de filas y columnas dados."""
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        rkey, ckey = key if isinstance(key, tuple) else (key, slice(None))
+        block = self._block(self._as_slice(rkey), self._as_slice(ckey))
+        if isinstance(rkey, (int, np.integer)):
+            block = block[0]
+            return block[0] if isinstance(ckey, (int, np.integer)) else block
+        return block[:, 0] if isinstance(ckey, (int, np.integer)) else block
+
+    @staticmethod
+    def _as_slice(key):
+        if isinstance(key, (int, np.integer)):
+            return slice(int(key), int(key) + 1)
+        return key
+
+    def to_bool(self):
+        return self._block(slice(None), slice(None))
+
+    def row_blocks(self):
+        """Itera (inicio, bloque bool) por bloques de filas."""
+        step = max(1, MATRIX_BLOCK_CELLS // max(1, self.shape[1]))
+        for start in range(0, self.shape[0], step):
+            yield start, self._block(slice(start, start + step), slice(None))
+
+    def col_blocks(self):
+        """Itera (inicio, bloque bool) por bloques de columnas."""
+        step = max(1, MATRIX_BLOCK_CELLS // max(1, self.shape[0]))
+        for start in range(0, self.shape[1], step):
+            yield start, self._block(slice(None), slice(start, start + step))
+
+    def any(self, axis=None):
+        if axis is None:
+            return any(block.any() for _, block in self.row_blocks())
+        if axis == 1:
+            return np.concatenate([b.any(axis=1) for _, b in self.row_blocks()] or [np.zeros(0, dtype=bool)])
+        return np.concatenate([b.any(axis=0) for _, b in self.col_blocks()] or [np.zeros(0, dtype=bool)])
+
+    def all(self, axis=None):
+        if axis is None:
+            return all(block.all() for _, block in self.row_blocks())
+        if axis == 1:
+            return np.concatenate([b.all(axis=1) for _, b in self.row_blocks()] or [np.zeros(0, dtype=bool)])
+        return np.concatenate([b.all(axis=0) for _, b in self.col_blocks()] or [np.zeros(0, dtype=bool)])
+
+    def first_index(self, axis, reduce, value=True):
+        """
+        Primera fila (axis=1) o columna (axis=0) cuyo any/all vale `value`,
+        o None. Se detiene en el primer bloque que la contiene.
+        """
+        blocks = self.row_blocks() if axis == 1 else self.col_blocks()
+        for start, block in blocks:
+            hits = np.flatnonzero(getattr(block, reduce)(axis=axis) == value)
+            if len(hits):
+                return start + int(hits[0])
+        return None
+
+    def coords(self, value=True, limit=None):
+        """Coordenadas (i,j) con el valor pedido en orden por filas, como np.argwhere."""
+        found = []
+        remaining = limit
+        for start, block in self.row_blocks():
+            hits = np.argwhere(block if value else ~block)
+            if remaining is not None:
+                hits = hits[:remaining]
+                remaining -= len(hits)
+            hits[:, 0] += start
+            found.append(hits)
+            if remaining == 0:
+                break
+        if not found:
+            return np.empty((0, 2), dtype=np.intp)
+        return np.concatenate(found)
+
+class PackedTruthMatrix(BlockedTruthMatrix):
+    """
+    Matriz de verdad empaquetada a bits (np.packbits por filas): 8 veces más
+    pequeña que dtype=bool. Los operadores lógicos trabajan directamente sobre
+    los bytes; los bits de relleno de la última columna se mantienen en 0.
+    """
+    def __init__(self, bits, shape, owner=None):
+        self.bits = bits          # uint8 (filas, ceil(columnas/8))
+        self.shape = shape        # forma lógica (filas, columnas)
+        self.owner = owner        # lo que mantiene vivo el buffer de bits (p.ej. memoria compartida)
+
+    def __getstate__(self):
+        return {"bits": self.bits, "shape": self.shape, "owner": None}
+
+    @classmethod
+    def empty(cls, n_rows, n_cols):
+        return cls(np.zeros((n_rows, (n_cols + 7) // 8), dtype=np.uint8), (n_rows, n_cols))
+
+    @classmethod
+    def from_bool(cls, matrix):
+        matrix = np.asarray(matrix, dtype=bool)
+        return cls(np.packbits(matrix, axis=1), matrix.shape)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def set_rows(self, start, block):
+        self.bits[start:start + len(block)] = np.packbits(block, axis=1)
+
+    def _block(self, rows, cols):
+        c0, c1, _ = cols.indices(self.shape[1])
+        byte0 = c0 // 8
+        byte1 = (max(c1, c0) + 7) // 8
+        unpacked = np.unpackbits(self.bits[rows, byte0:byte1], axis=1).astype(bool)
+        return unpacked[:, c0 - byte0 * 8:c1 - byte0 * 8]
+
+    def _row_mask(self):
+        """Bytes de una fila completamente V (sin contar el relleno)."""
+        return np.packbits(np.ones(self.shape[1], dtype=bool))
+
+    def _clear_padding(self, bits):
+        pad = self.bits.shape[1] * 8 - self.shape[1]
+        if pad and bits.shape[1]:
+            bits[:, -1] &= np.uint8((0xFF << pad) & 0xFF)
+        return bits
+
+    def _check(self, other):
+        if self.shape != other.shape:
+            raise ValueError("Las matrices deben tener la misma dimensión")
+
+    def __and__(self, other):
+        self._check(other)
+        return PackedTruthMatrix(self.bits & other.bits, self.shape)
+
+    def __or__(self, other):
+        self._check(other)
+        return PackedTruthMatrix(self.bits | other.bits, self.shape)
+
+    def __xor__(self, other):
+        self._check(other)
+        return PackedTruthMatrix(self.bits ^ other.bits, self.shape)
+
+    def __invert__(self):
+        return PackedTruthMatrix(self._clear_padding(~self.bits), self.shape)
+
+    def any(self, axis=None):
+        if axis is None:
+            return bool(self.bits.any())
+        if axis == 1:
+            return self.bits.any(axis=1)
+        return super().any(axis)
+
+    def all(self, axis=None):
+        if axis is None:
+            return bool((self.bits == self._row_mask()).all())
+        if axis == 1:
+            return (self.bits == self._row_mask()).all(axis=1)
+        return super().all(axis)
+
+    def summary(self):
+        """any/all por fila y por columna en una sola pasada sobre los bytes, sin desempaquetar."""
+        mask = self._row_mask()
+        n_bytes = self.bits.shape[1]
+        row_any, row_all = [], []
+        col_or = np.zeros(n_bytes, dtype=np.uint8)
+        col_and = np.full(n_bytes, 0xFF, dtype=np.uint8)
+        step = max(1, MATRIX_BLOCK_CELLS // max(1, n_bytes))
+        for start in range(0, self.shape[0], step):
+            block = self.bits[start:start + step]
+            row_any.append(block.any(axis=1))
+            row_all.append((block == mask).all(axis=1))
+            col_or |= np.bitwise_or.reduce(block, axis=0)
+            col_and &= np.bitwise_and.reduce(block, axis=0)
+        empty = np.zeros(0, dtype=bool)
+        return {(1, "any"): np.concatenate(row_any or [empty]), (1, "all"): np.concatenate(row_all or [empty]),
+                (0, "any"): np.unpackbits(col_or)[:self.shape[1]].astype(bool),
+                (0, "all"): np.unpackbits(col_and)[:self.shape[1]].astype(bool)}
+
+class SparseTruthMatrix(BlockedTruthMatrix):
+    """
+    Matriz de verdad dispersa: guarda sólo las coordenadas de sus celdas V como
+    índices lineales i*n_cols+j ordenados (COO en orden de filas; indptr()
+    da el inicio de cada fila como en CSR). Con complement=True guarda las
+    celdas F, así que NOT sólo invierte la marca y una matriz casi toda V
+    también es barata. AND/OR/XOR entre dispersas son operaciones de
+    conjuntos: la memoria crece con los pares guardados, no con N².
+    """
+    def __init__(self, keys, shape, complement=False):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.shape = shape
+        self.complement = complement
+        self._indptr = None
+
+    @classmethod
+    def from_bool(cls, matrix, complement=False):
+        matrix = np.asarray(matrix, dtype=bool)
+        return cls(np.flatnonzero(~matrix if complement else matrix), matrix.shape, complement)
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes
+
+    @property
+    def nnz(self):
+        """Cantidad de celdas V."""
+        if self.complement:
+            return self.shape[0] * self.shape[1] - len(self.keys)
+        return len(self.keys)
+
+    def indptr(self):
+        """Posición en keys donde empieza cada fila (n_rows + 1 valores)."""
+        if self._indptr is None:
+            bounds = np.arange(self.shape[0] + 1, dtype=np.int64) * self.shape[1]
+            self._indptr = np.searchsorted(self.keys, bounds)
+        return self._indptr
+
+    def _block(self, rows, cols):
+        row_idx = np.arange(*rows.indices(self.shape[0]))
+        c0, c1, _ = cols.indices(self.shape[1])
+        c1 = max(c1, c0)
+        indptr = self.indptr()
+        starts = indptr[row_idx]
+        lens = indptr[row_idx + 1] - starts
+        positions = np.arange(lens.sum()) + np.repeat(starts - (np.cumsum(lens) - lens), lens)
+        local_rows = np.repeat(np.arange(len(row_idx)), lens)
+        j = self.keys[positions] % max(1, self.shape[1])
+        inside = (j >= c0) & (j < c1)
+        block = np.zeros((len(row_idx), c1 - c0), dtype=bool)
+        block[local_rows[inside], j[inside] - c0] = True
+        return ~block if self.complement else block
+
+    def masked(self, other):
+        """AND con una matriz no dispersa (np.ndarray o empaquetada) sin salir de la forma dispersa."""
+        if self.complement:
+            raise ValueError("masked sólo vale para coordenadas de celdas V")
+        i, j = np.divmod(self.keys, max(1, self.shape[1]))
+        if isinstance(other, PackedTruthMatrix):
+            hits = (other.bits[i, j >> 3] >> (7 - (j & 7))) & 1
+        elif isinstance(other, UnaryTruthMatrix):
+            hits = other.vector[i]
+        elif isinstance(other, BlockedTruthMatrix):
+            hits = other.to_bool()[i, j]
+        else:
+            hits = np.asarray(other, dtype=bool)[i, j]
+        return SparseTruthMatrix(self.keys[hits.astype(bool)], self.shape)
+
+    def extended(self, new_cols, new_rows):
+        """La matriz con columnas nuevas para las filas existentes y filas nuevas al final."""
+        old_rows, old_cols = self.shape
+        n_cols = old_cols + new_cols.shape[1]
+        if self.complement:
+            new_cols, new_rows = ~new_cols, ~new_rows
+        i, j = np.divmod(self.keys, max(1, old_cols))
+        ci, cj = np.nonzero(new_cols)
+        keys = np.concatenate([i * n_cols + j, ci * n_cols + old_cols + cj,
+                               np.flatnonzero(new_rows) + old_rows * n_cols])
+        keys.sort()
+        return SparseTruthMatrix(keys, (old_rows + len(new_rows), n_cols), self.complement)
+
+    def _check(self, other):
+        if self.shape != other.shape:
+            raise ValueError("Las matrices deben tener la misma dimensión")
+
+    def __invert__(self):
+        return SparseTruthMatrix(self.keys, self.shape, not self.complement)
+
+    def __and__(self, other):
+        self._check(other)
+        a, b = self, other
+        if a.complement and b.complement:
+            return SparseTruthMatrix(np.union1d(a.keys, b.keys), self.shape, True)
+        if not a.complement and not b.complement:
+            return SparseTruthMatrix(np.intersect1d(a.keys, b.keys, assume_unique=True), self.shape)
+        if a.complement:
+            a, b = b, a
+        return SparseTruthMatrix(np.setdiff1d(a.keys, b.keys, assume_unique=True), self.shape)
+
+    def __or__(self, other):
+        return ~(~self & ~other)
+
+    def __xor__(self, other):
+        self._check(other)
+        keys = np.setxor1d(self.keys, other.keys, assume_unique=True)
+        return SparseTruthMatrix(keys, self.shape, self.complement != other.complement)
+
+    def summary(self):
+        """any/all por fila y por columna contando las coordenadas guardadas."""
+        n_rows, n_cols = self.shape
+        row_counts = np.diff(self.indptr())
+        col_counts = np.bincount(self.keys % max(1, n_cols), minlength=n_cols)[:n_cols]
+        if self.complement:
+            return {(1, "any"): row_counts < n_cols, (1, "all"): row_counts == 0,
+                    (0, "any"): col_counts < n_rows, (0, "all"): col_counts == 0}
+        return {(1, "any"): row_counts > 0, (1, "all"): row_counts == n_cols,
+                (0, "any"): col_counts > 0, (0, "all"): col_counts == n_rows}
+
+    def any(self, axis=None):
+        if axis is None:
+            return self.nnz > 0
+        return self.summary()[axis, "any"]
+
+    def all(self, axis=None):
+        if axis is None:
+            return self.nnz == self.shape[0] * self.shape[1]
+        return self.summary()[axis, "all"]
+
+class LazyTruthMatrix(BlockedTruthMatrix):
+    """
+    Matriz de verdad que nunca se materializa: cada bloque se evalúa al pedirlo
+    con block_fn(filas, columnas). Las reducciones con corte temprano (any,
+    all, first_index, coords) sólo generan los bloques necesarios.
+    """
+    def __init__(self, block_fn, shape):
+        self.block_fn = block_fn
+        self.shape = shape
+
+    def _block(self, rows, cols):
+        return self.block_fn(rows, cols)
+
+# Operador equivalente al cambiar x por y: x > y  <=>  y < x
+FLIPPED_ORDER_OPS = {
+    RelOp.GT: RelOp.LT, RelOp.LT: RelOp.GT,
+    RelOp.GE: RelOp.LE, RelOp.LE: RelOp.GE,
+    RelOp.EQ: RelOp.EQ, RelOp.NE: RelOp.NE,
+}
+
+def _rank_bounds(values, valid):
+    """
+    Para cada valor, cuántos válidos son menores (left) y menores o iguales
+    (right). Las búsquedas se hacen con las consultas ya ordenadas, que es
+    mucho más rápido que buscar en orden aleatorio.
+    """
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    sorted_valid = sorted_values[valid[order]]
+    left = np.empty(len(values), dtype=np.int64)
+    right = np.empty(len(values), dtype=np.int64)
+    left[order] = np.searchsorted(sorted_valid, sorted_values, side="left")
+    right[order] = np.searchsorted(sorted_valid, sorted_values, side="right")
+    return left, right, len(sorted_valid)
+
+def _rank_counts(left, right, m, valid, op):
+    """Para cada valor v, cuántos y válidos cumplen `v op y` (0 si v no es válido)."""
+    counts = {
+        RelOp.GT: left, RelOp.GE: right,
+        RelOp.LT: m - right, RelOp.LE: m - left,
+        RelOp.EQ: right - left, RelOp.NE: m - (right - left),
+    }[op]
+    return np.where(valid, counts, 0)
+
+class ReducedTruthMatrix(LazyTruthMatrix):
+    """
+    Matriz perezosa que conoce, sin recorrerla, el any/all de cada fila y de
+    cada columna (_reduce). Así los cuantificadores se deciden sin evaluar
+    bloques; sólo las filas de testigos y contraejemplos pasan por block_fn.
+    """
+    def _reduce(self, axis, reduce):
+        """Vector any/all por filas (axis=1) o por columnas (axis=0)."""
+        raise NotImplementedError
+
+    def any(self, axis=None):
+        if axis is None:
+            return bool(self._reduce(1, "any").any())
+        return self._reduce(axis, "any")
+
+    def all(self, axis=None):
+        if axis is None:
+            return bool(self._reduce(1, "all").all())
+        return self._reduce(axis, "all")
+
+    def first_index(self, axis, reduce, value=True):
+        hits = np.flatnonzero(self._reduce(axis, reduce) == value)
+        return int(hits[0]) if len(hits) else None
+
+    def coords(self, value=True, limit=None):
+        if limit is None:
+            return super().coords(value)
+        # Sólo se visitan, en orden, las filas que tienen alguna celda con el valor
+        rows = np.flatnonzero(self._reduce(1, "any") if value else ~self._reduce(1, "all"))
+        found = []
+        remaining = limit
+        for i in rows:
+            if remaining <= 0:
+                break
+            row = self._block(slice(i, i + 1), slice(None))[0]
+            hits = np.flatnonzero(row if value else ~row)[:remaining]
+            found.append(np.column_stack([np.full(len(hits), i), hits]))
+            remaining -= len(hits)
+        if not found:
+            return np.zeros((0, 2), dtype=np.int64)
+        return np.concatenate(found)
+
+class UnaryTruthMatrix(ReducedTruthMatrix):
+    """
+    Matriz de una fórmula que sólo depende de x (predicados con constante):
+    se guarda el vector de N valores y cada fila es ese valor repetido en
+    todas las columnas. Sus any/all salen del vector en O(N) y AND/OR/XOR/NOT
+    entre vectores siguen siendo vectores.
+    """
+    def __init__(self, vector, n_cols=None):
+        self.vector = np.asarray(vector, dtype=bool)
+        n_cols = len(self.vector) if n_cols is None else n_cols
+        super().__init__(None, (len(self.vector), n_cols))
+
+    def _block(self, rows, cols):
+        return np.repeat(self.vector[rows, None], len(range(self.shape[1])[cols]), axis=1)
+
+    @property
+    def nbytes(self):
+        return self.vector.nbytes
+
+    def _reduce(self, axis, reduce):
+        if axis == 1:
+            if self.shape[1] == 0:
+                return np.full(self.shape[0], reduce == "all")
+            return self.vector.copy()
+        return np.full(self.shape[1], bool(getattr(self.vector, reduce)()))
+
+    def _check(self, other):
+        if self.shape != other.shape:
+            raise ValueError("Las matrices deben tener la misma dimensión")
+
+    def __invert__(self):
+        return UnaryTruthMatrix(~self.vector, self.shape[1])
+
+    def __and__(self, other):
+        self._check(other)
+        return UnaryTruthMatrix(self.vector & other.vector, self.shape[1])
+
+    def __or__(self, other):
+        self._check(other)
+        return UnaryTruthMatrix(self.vector | other.vector, self.shape[1])
+
+    def __xor__(self, other):
+        self._check(other)
+        return UnaryTruthMatrix(self.vector ^ other.vector, self.shape[1])
+
+class SortedOrderMatrix(ReducedTruthMatrix):
+    """
+    Matriz de un predicado simple de orden (>, <, >=, <=, =, !=) entre x e y
+    sobre una columna ordenable, sin construirla: con la columna ordenada,
+    cuántas celdas V tiene cada fila (y cada columna) sale de una búsqueda
+    binaria, así que any/all/first_index se responden en O(N log N). Las filas
+    sueltas que piden testigos y contraejemplos se evalúan con block_fn en O(N).
+    """
+    def __init__(self, values, valid, op, block_fn):
+        super().__init__(block_fn, (len(values), len(values)))
+        left, right, m = _rank_bounds(values, valid)
+        self.row_counts = _rank_counts(left, right, m, valid, op)
+        self.col_counts = _rank_counts(left, right, m, valid, FLIPPED_ORDER_OPS[op])
+
+    def _reduce(self, axis, reduce):
+        counts, full = (self.row_counts, self.shape[1]) if axis == 1 else (self.col_counts, self.shape[0])
+        return counts > 0 if reduce == "any" else counts == full
+
+class FactorizedTruthMatrix(ReducedTruthMatrix):
+    """
+    Matriz NxN guardada como núcleo KxK sobre los valores distintos más el
+    código de cada fila: celda (i,j) = core[codes[i], codes[j]]. Los any/all
+    por fila o columna se calculan en el núcleo y se expanden por código.
+    """
+    def __init__(self, core, codes):
+        super().__init__(self._expand, (len(codes), len(codes)))
+        self.core = core
+        self.codes = codes
+        present = np.unique(codes)   # sólo cuentan los códigos que aparecen
+        sub = core[np.ix_(present, present)]
+        self._code_reduce = {}
+        for axis, reduce in ((1, "any"), (1, "all"), (0, "any"), (0, "all")):
+            table = np.zeros(len(core), dtype=bool)
+            table[present] = getattr(sub, reduce)(axis=axis)
+            self._code_reduce[axis, reduce] = table
+
+    def _expand(self, rows, cols):
+        return self.core[self.codes[rows][:, None], self.codes[cols][None, :]]
+
+    def _reduce(self, axis, reduce):
+        return self._code_reduce[axis, reduce][self.codes]
+
+class TruthMatrixBuilder:
+    """
+    Junta en orden los bloques de filas de una matriz que se está recorriendo
+    y la deja en el formato que le daría generate_truth_matrix: np.ndarray
+    hasta DENSE_MATRIX_MAX_SIZE; por encima, dispersa mientras las V (o las F)
+    no pasen de SPARSE_MAX_DENSITY, y si no empaquetada a bits.
+    """
+    def __init__(self, shape):
+        self.shape = shape
+        self.rows = 0                 # filas recibidas
+        self._dense = [] if shape[0] <= DENSE_MATRIX_MAX_SIZE else None
+        self._max_keys = int(SPARSE_MAX_DENSITY * shape[0] * shape[1])
+        self._keys = {False: [], True: []}   # complement -> trozos de claves (de las V, o de las F)
+        self._stored = {False: 0, True: 0}
+        self._packed = None
+
+    @property
+    def complete(self):
+        return self.rows == self.shape[0]
+
+    def add(self, block):
+        """Agrega las filas siguientes (bloque bool de filas x todas las columnas)."""
+        block = np.asarray(block, dtype=bool)
+        start = self.rows
+        self.rows += len(block)
+        if self._dense is not None:
+            self._dense.append(block)
+            return
+        if self._packed is not None:
+            self._packed.set_rows(start, block)
+            return
+        n_true = int(np.count_nonzero(block))
+        for complement in list(self._keys):
+            count = block.size - n_true if complement else n_true
+            if self._stored[complement] + count <= self._max_keys:
+                self._keys[complement].append(np.flatnonzero(~block if complement else block) + start * self.shape[1])
+                self._stored[complement] += count
+                continue
+            parts = self._keys.pop(complement)
+            if not self._keys:
+                # ni V ni F son pocas: lo leído hasta ahora pasa a bits
+                self._packed = PackedTruthMatrix.empty(*self.shape)
+                if start:
+                    keys = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+                    for row, rows in SparseTruthMatrix(keys, (start, self.shape[1]), complement).row_blocks():
+                        self._packed.set_rows(row, rows)
+                self._packed.set_rows(start, block)
+
+    def result(self):
+        """La matriz armada; sólo tiene sentido cuando complete es True."""
+        if self._dense is not None:
+            return np.concatenate(self._dense) if self._dense else np.zeros(self.shape, dtype=bool)
+        if self._packed is not None:
+            return self._packed
+        complement = min(self._keys, key=self._stored.get)   # la forma con menos claves
+        parts = self._keys[complement]
+        keys = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return SparseTruthMatrix(keys, self.shape, complement)
+
+def matrix_summary(matrix, builder=None):
+    """
+    any/all por fila (axis=1) y por columna (axis=0). Las matrices por bloques
+    se recorren una sola vez para los cuatro vectores; las que ya conocen sus
+    reducciones (ordenadas, factorizadas) las dan sin recorrerse. Con builder
+    (TruthMatrixBuilder), los bloques recorridos se guardan además en él.
+    """
+    if isinstance(matrix, SummarizedTruthMatrix):
+        return matrix.summary
+    if isinstance(matrix, (PackedTruthMatrix, SparseTruthMatrix)):
+        return matrix.summary()
+    if isinstance(matrix, BlockedTruthMatrix) and not isinstance(matrix, ReducedTruthMatrix):
+        row_any, row_all = [], []
+        col_any = np.zeros(matrix.shape[1], dtype=bool)
+        col_all = np.ones(matrix.shape[1], dtype=bool)
+        for _, block in matrix.row_blocks():
+            if builder is not None:
+                builder.add(block)
+            row_any.append(block.any(axis=1))
+            row_all.append(block.all(axis=1))
+            col_any |= block.any(axis=0)
+            col_all &= block.all(axis=0)
+        empty = np.zeros(0, dtype=bool)
+        return {(1, "any"): np.concatenate(row_any or [empty]), (1, "all"): np.concatenate(row_all or [empty]),
+                (0, "any"): col_any, (0, "all"): col_all}
+    return {(axis, reduce): np.asarray(getattr(matrix, reduce)(axis=axis), dtype=bool)
+            for axis in (1, 0) for reduce in ("any", "all")}
+
+def summary_cells(matrix):
+    """
+    Cuántas celdas (o bytes, o contadores) lee matrix_summary para esa
+    matriz: N*M sólo las que se recorren enteras; las demás salen de sus
+    bytes, sus coordenadas o sus conteos.
+    """
+    if isinstance(matrix, SummarizedTruthMatrix):
+        return 0
+    if isinstance(matrix, UnaryTruthMatrix):
+        return len(matrix.vector)
+    if isinstance(matrix, PackedTruthMatrix):
+        return matrix.bits.size
+    if isinstance(matrix, SparseTruthMatrix):
+        return len(matrix.keys) + matrix.shape[0]
+    if isinstance(matrix, FactorizedTruthMatrix):
+        return matrix.core.size + 2 * (matrix.shape[0] + matrix.shape[1])
+    if isinstance(matrix, ReducedTruthMatrix):
+        return 2 * (matrix.shape[0] + matrix.shape[1])
+    return matrix.shape[0] * matrix.shape[1]
+
+class SummarizedTruthMatrix(ReducedTruthMatrix):
+    """
+    Matriz ya calculada (densa o empaquetada) junto con sus any/all por fila y
+    por columna, que se mantienen al agregar filas: los cuantificadores se
+    responden con esos vectores en O(N) y sólo los testigos leen la matriz.
+    """
+    def __init__(self, matrix, summary):
+        super().__init__(lambda rows, cols: np.asarray(matrix[rows, cols], dtype=bool), matrix.shape)
+        self.matrix = matrix
+        self.summary = summary
+
+    def _reduce(self, axis, reduce):
+        return self.summary[axis, reduce]
+
+def _first_true(mask):
+    """Posición del primer True del vector, o None."""
+    i = int(np.argmax(mask)) if len(mask) else 0
+    return i if len(mask) and mask[i] else None
+
+class QuantifierKernel:
+    """
+    Núcleo de los cuantificadores: los seis casos ∀/∃ × orden se deciden con
+    los cuatro vectores any/all de filas y columnas, calculados en una sola
+    pasada fusionada (matrix_summary). Para el primer testigo o contraejemplo
+    se ubica la fila/columna con los vectores y sólo se lee esa.
+    """
+    cells_read = 0   # celdas leídas por el kernel después de resumir la matriz (ver LazyQuantifierKernel)
+
+    def __init__(self, matrix, summary=None):
+        self.matrix = matrix
+        summary = summary if summary is not None else matrix_summary(matrix)
+        self.row_any, self.row_all = summary[1, "any"], summary[1, "all"]
+        self.col_any, self.col_all = summary[0, "any"], summary[0, "all"]
+
+    def _vector(self, axis, reduce):
+        if axis == 1:
+            return self.row_any if reduce == "any" else self.row_all
+        return self.col_any if reduce == "any" else self.col_all
+
+    def first_index(self, axis, reduce, value=True):
+        """Primera fila (axis=1) o columna (axis=0) cuyo any/all vale `value`, o None."""
+        return _first_true(self._vector(axis, reduce) == value)
+
+    def indices(self, axis, reduce, value=True):
+        """Todas las filas o columnas cuyo any/all vale `value`."""
+        return np.flatnonzero(self._vector(axis, reduce) == value)
+
+    def row(self, i):
+        return np.asarray(self.matrix[int(i)], dtype=bool)
+
+    def column(self, j):
+        return np.asarray(self.matrix[:, int(j)], dtype=bool)
+
+    def first_cell(self, value=True):
+        """Primera celda (i, j) con ese valor en orden por filas, o None."""
+        i = _first_true(self.row_any if value else ~self.row_all)
+        if i is None:
+            return None
+        return i, _first_true(self.row(i) == value)
+
+    def cells(self, value, limit):
+        """Hasta `limit` celdas (i, j) con ese valor en orden por filas; sólo se leen las filas que las tienen."""
+        found = []
+        remaining = limit
+        for i in np.flatnonzero(self.row_any if value else ~self.row_all):
+            js = np.flatnonzero(self.row(i) == value)[:remaining]
+            found.append(np.column_stack([np.full(len(js), i), js]))
+            remaining -= len(js)
+            if remaining == 0:
+                break
+        if not found:
+            return np.empty((0, 2), dtype=np.intp)
+        return np.concatenate(found)
+
+    def iter_cells(self, value, on_rows=None):
+        """
+        Todas las celdas (i, j) con ese valor en orden por filas, como trozos
+        k x 2. Se leen EXPORT_BLOCK_CELLS celdas por vez y se saltan los bloques
+        de filas que no tienen ninguna; si la matriz es dispersa y guarda
+        justo esas celdas, salen de sus coordenadas sin leer bloques.
+        on_rows(filas recorridas, filas) se llama tras cada trozo.
+        """
+        n_rows, n_cols = self.matrix.shape
+        inner = self.matrix.matrix if isinstance(self.matrix, SummarizedTruthMatrix) else self.matrix
+        if isinstance(inner, SparseTruthMatrix) and inner.complement != value:
+            for start in range(0, len(inner.keys), EXPORT_BLOCK_CELLS):
+                keys = inner.keys[start:start + EXPORT_BLOCK_CELLS]
+                yield np.column_stack(np.divmod(keys, max(1, n_cols)))
+                if on_rows is not None:
+                    on_rows(int(keys[-1]) // max(1, n_cols) + 1, n_rows)
+            return
+        wanted = self.row_any if value else ~self.row_all
+        step = max(1, EXPORT_BLOCK_CELLS // max(1, n_cols))
+        for start in range(0, n_rows, step):
+            stop = min(start + step, n_rows)
+            if wanted[start:stop].any():
+                block = np.asarray(self.matrix[start:stop], dtype=bool)
+                i, j = np.nonzero(block if value else ~block)
+                yield np.column_stack([i + start, j])
+            if on_rows is not None:
+                on_rows(stop, n_rows)
+
+class LazyQuantifierKernel:
+    """
+    Los mismos casos que QuantifierKernel sobre una LazyTruthMatrix que nunca
+    se recorrió: se leen bloques de filas sólo hasta que el caso queda
+    decidido (primera celda V o F, primera fila toda V) y la primera columna
+    toda V se busca por bloques de columnas. Si la lectura llega al final, los
+    cuatro vectores quedan completos, on_complete(resumen, matriz) los recibe
+    (matriz armada con los bloques de filas, o None si se leyó por columnas) y
+    desde ahí responde un QuantifierKernel.
+    """
+    def __init__(self, matrix, on_complete=None, preview=RESULT_PREVIEW_PAIRS):
+        self.matrix = matrix
+        self.on_complete = on_complete
+        self.preview = preview            # celdas V y F que se guardan al leer por filas
+        self.cells_read = 0
+        n_rows, n_cols = matrix.shape
+        self._vectors = {(1, "any"): np.zeros(n_rows, dtype=bool), (1, "all"): np.ones(n_rows, dtype=bool),
+                         (0, "any"): np.zeros(n_cols, dtype=bool), (0, "all"): np.ones(n_cols, dtype=bool)}
+        self._axis = None                 # 1: se lee por filas; 0: por columnas
+        self._blocks = None
+        self._read = 0                    # filas (o columnas) ya leídas
+        self._cells = {True: [], False: []}
+        self._n_cells = {True: 0, False: 0}
+        self._builder = None
+        self._done = None                 # QuantifierKernel cuando ya se leyó todo
+
+    def _start(self, axis):
+        if self._axis is None:
+            self._axis = axis
+            self._blocks = self.matrix.row_blocks() if axis == 1 else self.matrix.col_blocks()
+            if axis == 1:
+                self._builder = TruthMatrixBuilder(self.matrix.shape)
+
+    def _next_block(self):
+        """Lee un bloque más en el sentido elegido; False si ya se leyó todo."""
+        if self._done is not None:
+            return False
+        start, block = next(self._blocks, (None, None))
+        if block is None:
+            self._finish()
+            return False
+        block = np.asarray(block, dtype=bool)
+        self.cells_read += block.size
+        axis, other = self._axis, 1 - self._axis
+        stop = start + block.shape[1 - axis]
+        self._vectors[axis, "any"][start:stop] = block.any(axis=axis)
+        self._vectors[axis, "all"][start:stop] = block.all(axis=axis)
+        self._vectors[other, "any"] |= block.any(axis=other)
+        self._vectors[other, "all"] &= block.all(axis=other)
+        self._read = stop
+        if axis == 1:
+            self._builder.add(block)
+            for value in (True, False):
+                missing = self.preview - self._n_cells[value]
+                if missing > 0:
+                    hits = np.flatnonzero(block if value else ~block)[:missing]
+                    i, j = np.divmod(hits, block.shape[1])
+                    self._cells[value].append(np.column_stack([i + start, j]))
+                    self._n_cells[value] += len(hits)
+        if stop == self.matrix.shape[1 - axis]:
+            self._finish()
+        return True
+
+    def _finish(self):
+        if self._done is not None:
+            return
+        summary = dict(self._vectors)
+        matrix = self._builder.result() if self._axis == 1 else None
+        self._blocks = self._builder = None
+        self._done = QuantifierKernel(SummarizedTruthMatrix(self.matrix if matrix is None else matrix, summary), summary)
+        if self.on_complete is not None:
+            self.on_complete(summary, matrix)
+
+    def _complete(self):
+        self._start(1)
+        while self._next_block():
+            pass
+        return self._done
+
+    def first_index(self, axis, reduce, value=True):
+        """Primera fila (axis=1) o columna (axis=0) cuyo any/all vale `value`, o None."""
+        self._start(axis)
+        # Leyendo por el otro eje, any=V y all=F ya no cambian: sólo el índice 0 queda decidido antes del final
+        settled = (reduce == "any") == value
+        while self._done is None:
+            vector = self._vectors[axis, reduce]
+            if self._axis == axis:
+                hit = _first_true(vector[:self._read] == value)
+                if hit is not None:
+                    return hit
+            elif settled and len(vector) and vector[0] == value:
+                return 0
+            self._next_block()
+        return self._done.first_index(axis, reduce, value)
+
+    def indices(self, axis, reduce, value=True):
+        """Todas las filas o columnas cuyo any/all vale `value` (hace falta leer toda la matriz)."""
+        return self._complete().indices(axis, reduce, value)
+
+    def first_cell(self, value=True):
+        """Primera celda (i, j) con ese valor en orden por filas, o None."""
+        found = self.cells(value, 1)
+        return (int(found[0, 0]), int(found[0, 1])) if len(found) else None
+
+    def cells(self, value, limit):
+        """Hasta `limit` celdas (i, j) con ese valor en orden por filas; se deja de leer al juntarlas."""
+        self._start(1)
+        if self._axis != 1 or limit > self.preview:
+            return self._complete().cells(value, limit)
+        while self._n_cells[value] < limit and self._next_block():
+            pass
+        if not self._cells[value]:
+            return np.empty((0, 2), dtype=np.intp)
+        return np.concatenate(self._cells[value])[:limit]
+
+    def row(self, i):
+        return np.asarray(self.matrix[int(i)], dtype=bool)
+
+    def column(self, j):
+        return np.asarray(self.matrix[:, int(j)], dtype=bool)
+
+def quantifier_kernel(matrix, on_complete=None):
+    """LazyQuantifierKernel para una matriz perezosa sin recorrer; QuantifierKernel para las demás."""
+    if isinstance(matrix, (QuantifierKernel, LazyQuantifierKernel)):
+        return matrix
+    if isinstance(matrix, LazyTruthMatrix) and not isinstance(matrix, ReducedTruthMatrix):
+        return LazyQuantifierKernel(matrix, on_complete)
+    return QuantifierKernel(matrix)
+
+def _csv_field(value):
+    """Valor como campo CSV (vacío si falta; entre comillas si hace falta), como lo escribe to_csv."""
+    if value is None or (np.ndim(value) == 0 and pd.isna(value)):
+        return ""
+    text = str(value)
+    if any(c in text for c in ',"\r\n'):
+        text = '"' + text.replace('"', '""') + '"'
+    return text
+
+def iter_positions(mask, chunk=EXPORT_BLOCK_CELLS):
+    """Posiciones de los True del vector, por trozos de a lo sumo chunk elementos del vector."""
+    for start in range(0, len(mask), chunk):
+        found = np.flatnonzero(mask[start:start + chunk])
+        if len(found):
+            yield found + start
+
+class NpyStreamWriter:
+    """
+    Archivo .npy escrito por trozos sin saber cuántas filas tendrá: la
+    cabecera se reserva con ancho fijo y al cerrar se reescribe con la forma
+    final, así que np.load (también con mmap_mode) lo lee como cualquier .npy.
+    """
+    HEADER_BYTES = 128
+
+    def __init__(self, filename, width, dtype=np.int64):
+        self.file = open(filename, "wb")
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._write_header()
+
+    def _write_header(self):
+        shape = (self.rows,) if self.width == 1 else (self.rows, self.width)
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (self.dtype.str, shape)
+        magic = np.lib.format.magic(1, 0)
+        length = self.HEADER_BYTES - len(magic) - 2
+        self.file.seek(0)
+        self.file.write(magic + struct.pack("<H", length) + (header.ljust(length - 1) + "\n").encode("latin1"))
+
+    def write(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype).reshape(-1, self.width)
+        self.file.write(array.tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        self._write_header()
+        self.file.close()
+
+class TruthMatrixCache:
+    """
+    Caché LRU de matrices de verdad con presupuesto de memoria en bytes.
+    La clave es (estructura del predicado, versión del dataset), así que un
+    predicado editado o un dataset recargado nunca reutilizan una matriz vieja.
+    """
+    def __init__(self, max_bytes=MATRIX_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # clave -> matriz (más reciente al final)
+        self._lock = threading.RLock()  # la usan a la vez la GUI y los trabajos en segundo plano
+        self._local = threading.local() # aciertos/fallos del hilo actual (ver EngineStats)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            matrix = self._entries.get(key)
+            if matrix is None:
+                self.misses += 1
+                self._local.misses = getattr(self._local, "misses", 0) + 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._local.hits = getattr(self._local, "hits", 0) + 1
+            return matrix
+
+    def thread_counts(self):
+        """(aciertos, fallos) acumulados por el hilo que llama."""
+        return getattr(self._local, "hits", 0), getattr(self._local, "misses", 0)
+
+    def put(self, key, matrix):
+        size = matrix.nbytes
+        with self._lock:
+            self.discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = matrix
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.current_bytes -= old.nbytes
+
+    def discard(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+# ----------------------------
+#   Instrumentación
+# ----------------------------
+
+STATS_MAX_RECORDS = 200        # etapas de primer nivel que conserva EngineStats
+STAGE_LABELS = {
+    "dataset_load": "carga",
+    "dataset_append": "filas nuevas",
+    "matrix_build": "matriz",
+    "predicate": "predicado",
+    "logic_op": "op. lógica",
+    "quantifier": "cuantificadores",
+    "query": "consulta",
+    "batch": "lote",
+    "render": "visualización",
+    "export": "exportación",
+    "job": "trabajo",
+}
+
+logger = logging.getLogger(__name__)
+
+def format_seconds(seconds):
+    return f"{seconds * 1000:.1f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+def format_bytes(nbytes):
+    return f"{nbytes / 2**10:.1f} KiB" if nbytes < 2**20 else f"{nbytes / 2**20:.1f} MiB"
+
+class StageRecord:
+    """
+    Una etapa medida: tiempo de reloj, celdas evaluadas o recorridas, bytes
+    del resultado y aciertos/fallos de la caché de matrices en ese hilo. Las
+    etapas abiertas dentro de ella quedan en children (su tiempo está incluido).
+    """
+    def __init__(self, stage, detail="", parent=None):
+        self.stage = stage          # clave de STAGE_LABELS
+        self.detail = detail        # predicado, archivo, consulta...
+        self.parent = parent
+        self.children = []
+        self.started = time.time()
+        self.seconds = 0.0
+        self.cells = 0
+        self.bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.error = None           # nombre de la excepción si la etapa falló
+        self.thread = threading.get_ident()
+        self.seq = 0                # orden de terminación (ver EngineStats.since)
+
+    @property
+    def label(self):
+        return STAGE_LABELS.get(self.stage, self.stage)
+
+    def as_dict(self, children=True):
+        d = {"stage": self.stage, "detail": self.detail, "started": self.started,
+             "seconds": self.seconds, "cells": self.cells, "bytes": self.bytes,
+             "cache_hits": self.cache_hits, "cache_misses": self.cache_misses, "error": self.error,
+             "parent": self.parent.stage if self.parent is not None else None}
+        if children:
+            d["children"] = [child.as_dict() for child in self.children]
+        return d
+
+    def breakdown(self):
+        """'1.23 s (matriz 812.0 ms, cuantificadores 402.1 ms)': el total y sus etapas internas por tipo."""
+        parts = {}
+        for child in self.children:
+            parts[child.label] = parts.get(child.label, 0.0) + child.seconds
+        inner = ", ".join(f"{label} {format_seconds(seconds)}" for label, seconds in parts.items())
+        return format_seconds(self.seconds) + (f" ({inner})" if inner else "")
+
+    def __str__(self):
+        text = f"{self.label} {self.detail}".rstrip() + f": {format_seconds(self.seconds)}"
+        if self.cells:
+            text += f", {self.cells:,} celdas"
+        if self.bytes:
+            text += f", {format_bytes(self.bytes)}"
+        if self.cache_hits or self.cache_misses:
+            text += f", caché {self.cache_hits}/{self.cache_hits + self.cache_misses}"
+        if self.error:
+            text += f", error {self.error}"
+        return text
+
+class EngineStats:
+    """
+    Instrumentación del motor. Cada etapa (with stats.stage(...)) produce un
+    StageRecord que va al historial (las de primer nivel, hasta
+    STATS_MAX_RECORDS), al logger "engine" en nivel DEBUG con el registro en
+    extra["stage"], y a cada listener: fn(record) se llama al terminar cada
+    etapa, también las internas, en el hilo que la ejecutó.
+    """
+    def __init__(self, cache, max_records=STATS_MAX_RECORDS):
+        self.cache = cache
+        self.records = deque(maxlen=max_records)
+        self.listeners = []
+        self._local = threading.local()   # pila de etapas abiertas de cada hilo
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn):
+        self.listeners.remove(fn)
+
+    def current(self):
+        """La etapa abierta más interna de este hilo, o None."""
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def stage(self, stage, detail=""):
+        """
+        Mide el bloque como una etapa. Dentro de otra etapa con el mismo nombre
+        y detalle no se abre una nueva: se devuelve la de afuera.
+        """
+        parent = self.current()
+        if parent is not None and parent.stage == stage and parent.detail == detail:
+            yield parent
+            return
+        record = StageRecord(stage, detail, parent)
+        if parent is None:
+            self._local.stack = []
+        self._local.stack.append(record)
+        hits, misses = self.cache.thread_counts()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.seconds = time.perf_counter() - start
+            self._local.stack.pop()
+            now_hits, now_misses = self.cache.thread_counts()
+            record.cache_hits += now_hits - hits
+            record.cache_misses += now_misses - misses
+            self._finish(record)
+
+    def add(self, stage, detail="", seconds=0.0, cells=0, nbytes=0):
+        """Etapa medida por fuera (p.ej. un paso del plan sumado sobre todos los bloques), dentro de la actual."""
+        record = StageRecord(stage, detail, self.current())
+        record.seconds, record.cells, record.bytes = seconds, cells, nbytes
+        self._finish(record)
+        return record
+
+    def _finish(self, record):
+        with self._lock:
+            self._seq += 1
+            record.seq = self._seq
+            if record.parent is None:
+                self.records.append(record)
+            else:
+                record.parent.children.append(record)
+        logger.debug("%s", record, extra={"stage": record.as_dict(children=False)})
+        for fn in list(self.listeners):
+            try:
+                fn(record)
+            except Exception:
+                logger.exception("Falló un listener de etapas")
+
+    def mark(self):
+        """Marca para since(): las etapas de primer nivel que terminen después."""
+        return self._seq
+
+    def since(self, mark):
+        with self._lock:
+            return [r for r in self.records if r.seq > mark]
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def summary(self):
+        """
+        Totales por etapa del historial: veces, segundos, celdas, bytes y
+        aciertos/fallos de caché. Una etapa dentro de otra del mismo tipo no
+        se cuenta dos veces.
+        """
+        totals = {}
+
+        def visit(record, outer):
+            if record.stage not in outer:
+                t = totals.setdefault(record.stage, {"count": 0, "seconds": 0.0, "cells": 0, "bytes": 0,
+                                                     "cache_hits": 0, "cache_misses": 0})
+                t["count"] += 1
+                t["seconds"] += record.seconds
+                t["cells"] += record.cells
+                t["bytes"] += record.bytes
+                t["cache_hits"] += record.cache_hits
+                t["cache_misses"] += record.cache_misses
+            for child in record.children:
+                visit(child, outer | {record.stage})
+
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            visit(record, frozenset())
+        return totals
+
+# ----------------------------
+#   Columnas comprimidas
+# ----------------------------
+
+FACTORIZE_MAX_DISTINCT_RATIO = 0.25   # se comprime la columna si K <= N/4 valores distintos
+
+class FactorizedColumn:
+    """
+    Columna comprimida por valores distintos (pd.factorize): cada fila guarda
+    el código de su valor y los NaN el código K. Un predicado x op y se evalúa
+    una vez sobre los KxK valores distintos (más una fila y columna toda F
+    para los NaN) y se expande por códigos.
+    """
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series.to_numpy())
+        self.uniques = np.asarray(uniques)
+        self.codes = np.where(codes < 0, len(self.uniques), codes)
+        self.compact = len(self.uniques) <= FACTORIZE_MAX_DISTINCT_RATIO * len(self.codes)
+        self._cores = {}   # op -> núcleo (K+1)x(K+1)
+
+    def core(self, op, compare_arrays):
+        core = self._cores.get(op)
+        if core is None:
+            k = len(self.uniques)
+            core = np.zeros((k + 1, k + 1), dtype=bool)
+            core[:k, :k] = compare_arrays(self.uniques[:, None], self.uniques[None, :], op)
+            self._cores[op] = core
+        return core
+
+    def relation(self, op, compare_arrays, rows=slice(None), cols=slice(None)):
+        return self.core(op, compare_arrays)[self.codes[rows][:, None], self.codes[cols][None, :]]
+
+# ----------------------------
+#     Columnas de texto
+# ----------------------------
+
+TEXT_OPS = (RelOp.CONTAINS, RelOp.STARTS_WITH, RelOp.ENDS_WITH)
+
+def _text_of(value):
+    """
+    Texto en minúsculas de un valor tal como lo escribe _compare: las fechas y
+    duraciones de NumPy se pasan antes a Timestamp/Timedelta, que es lo que
+    devuelve la Serie celda a celda.
+    """
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    elif isinstance(value, np.timedelta64):
+        value = pd.Timedelta(value)
+    return str(value).lower()
+
+def _prefix_core(rows_text, cols_text):
+    """
+    core[a, b] = rows_text[a].startswith(cols_text[b]). Con las filas ordenadas,
+    las que empiezan por b forman un tramo contiguo que se halla por búsqueda binaria.
+    """
+    core = np.zeros((len(rows_text), len(cols_text)), dtype=bool)
+    if len(rows_text) == 0 or len(cols_text) == 0:
+        return core
+    order = np.argsort(rows_text)
+    sorted_rows = rows_text[order]
+    lo = np.searchsorted(sorted_rows, cols_text, side="left")
+    hi = np.searchsorted(sorted_rows, np.char.add(cols_text, "\U0010ffff"), side="right")
+    lens = np.maximum(hi - lo, 0)
+    group_start = np.cumsum(lens) - lens
+    positions = np.arange(lens.sum()) + np.repeat(lo - group_start, lens)
+    core[order[positions], np.repeat(np.arange(len(cols_text)), lens)] = True
+    return core
+
+class TextColumn:
+    """
+    Columna normalizada una sola vez para los operadores de texto: cada valor
+    distinto se guarda una vez ya en minúsculas (igual que _compare) y cada
+    fila sólo lleva el código de su valor. Las comparaciones se hacen entre
+    valores distintos y el resultado se expande a las filas.
+
+    Se construye desde la Serie y no desde to_numpy() para que las fechas se
+    escriban como Timestamp ("2020-01-01 00:00:00"), igual que en _compare.
+    """
+    def __init__(self, series):
+        codes, uniques = pd.factorize(pd.Series([_text_of(v) for v in series.astype(object)], dtype=object))
+        self.codes = codes
+        self.uniques = np.array(uniques, dtype=str)
+        self._reversed = None
+
+    @property
+    def reversed_uniques(self):
+        if self._reversed is None:
+            self._reversed = np.array([s[::-1] for s in self.uniques], dtype=str)
+        return self._reversed
+
+    def _core(self, op, row_codes, col_codes):
+        if op == RelOp.CONTAINS:
+            return np.char.find(self.uniques[row_codes][:, None], self.uniques[col_codes][None, :]) >= 0
+        if op == RelOp.STARTS_WITH:
+            return _prefix_core(self.uniques[row_codes], self.uniques[col_codes])
+        if op == RelOp.ENDS_WITH:
+            return _prefix_core(self.reversed_uniques[row_codes], self.reversed_uniques[col_codes])
+        raise ValueError(f"Operador de texto no válido: {op}")
+
+    def relation(self, op, rows=slice(None), cols=slice(None)):
+        """Bloque filas x columnas de `x op y`, calculado sobre los valores distintos del bloque."""
+        row_uniques, row_inv = np.unique(self.codes[rows], return_inverse=True)
+        col_uniques, col_inv = np.unique(self.codes[cols], return_inverse=True)
+        core = self._core(op, row_uniques, col_uniques)
+        return core[row_inv[:, None], col_inv[None, :]]
+
+    def compare_const(self, op, const, rows=slice(None)):
+        """Vector `x op const` para las filas dadas."""
+        row_uniques, row_inv = np.unique(self.codes[rows], return_inverse=True)
+        text = self.uniques[row_uniques]
+        const = _text_of(const)
+        if op == RelOp.CONTAINS:
+            hits = np.char.find(text, const) >= 0
+        elif op == RelOp.STARTS_WITH:
+            hits = np.char.startswith(text, const)
+        elif op == RelOp.ENDS_WITH:
+            hits = np.char.endswith(text, const)
+        else:
+            raise ValueError(f"Operador de texto no válido: {op}")
+        return np.asarray(hits, dtype=bool)[row_inv]
+
+# ----------------------------
+#   Generación en paralelo
+# ----------------------------
+
+# Estado de cada proceso del pool: un motor mínimo (columnas y predicados del
+# plan) y la vista de la matriz de bits en memoria compartida.
+_tile_worker = {}
+
+def _init_tile_worker(data, predicates, plan, known, shm_name, bits_shape):
+    engine = LogicEngine()
+    engine.data = data
+    engine.predicates = predicates
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _tile_worker.update(
+        engine=engine, plan=plan, known=known, shm=shm,
+        bits=np.ndarray(bits_shape, dtype=np.uint8, buffer=shm.buf),
+    )
+
+def _eval_tile(tile):
+    """Evalúa las filas [inicio, fin) y escribe sus bits directamente en la memoria compartida."""
+    start, stop = tile
+    state = _tile_worker
+    block = state["engine"]._execute_formula_plan(state["plan"], slice(start, stop), known=state["known"])
+    state["bits"][start:stop] = np.packbits(block, axis=1)
+    return tile
+
+# ----------------------------
+#     Motor de evaluación
+# ----------------------------
+
+class JobCancelled(Exception):
+    """Se lanza dentro de una evaluación larga cuando should_cancel() pide detenerla."""
+
+class QueryResult:
+    """Resultado de una consulta cuantificada."""
+    def __init__(self, holds, message, table, example_ids, counter_ids):
+        self.holds = holds              # True si la consulta es verdadera
+        self.message = message          # resumen en notación de libro
+        self.table = table              # DataFrame de testigos/contraejemplos (o None)
+        self.example_ids = example_ids
+        self.counter_ids = counter_ids
+
+QUANTIFIER_ALIASES = {
+    "∀": "∀", "forall": "∀", "a": "∀",
+    "∃": "∃", "exists": "∃", "e": "∃",
+}
+
+QUERY_PATTERN = re.compile(
+    r"^\s*(∀|∃|forall|exists|A|E)\s*([xy])\s+(∀|∃|forall|exists|A|E)\s*([xy])\s+(\w+)\s*(\(\s*x\s*,\s*y\s*\))?\s*$",
+    re.IGNORECASE,
+)
+
+UNARY_QUERY_PATTERN = re.compile(
+    r"^\s*(∀|∃|forall|exists|A|E)\s*x\s+(\w+)\s*(\(\s*x\s*\))?\s*$",
+    re.IGNORECASE,
+)
+
+def parse_query(text):
+    """
+    Convierte "∀x ∃y P(x,y)" en (fórmula, q1, q2, orden). Para fórmulas
+    unarias también vale "∀x P(x)", que da q2=None.
+    """
+    m = UNARY_QUERY_PATTERN.match(text)
+    if m:
+        q1_raw, name, _ = m.groups()
+        return name, QUANTIFIER_ALIASES[q1_raw.lower()], None, "X→Y"
+    m = QUERY_PATTERN.match(text)
+    if not m:
+        raise ValueError(f"Consulta no reconocida: {text!r} (ejemplo: '∀x ∃y P(x,y)')")
+    q1_raw, v1, q2_raw, v2, name, _ = m.groups()
+    if {v1.lower(), v2.lower()} != {"x", "y"}:
+        raise ValueError(f"La consulta debe cuantificar x e y una vez cada una: {text!r}")
+    q1 = QUANTIFIER_ALIASES[q1_raw.lower()]
+    q2 = QUANTIFIER_ALIASES[q2_raw.lower()]
+    order = "X→Y" if v1.lower() == "x" else "Y→X"
+    return name, q1, q2, order
+
+def read_queries(filename):
+    """Una consulta por línea; se ignoran las vacías y las que empiezan con '#'."""
+    with open(filename, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+BATCH_COLUMNS = ["consulta", "formula", "q1", "q2", "orden", "verdadera", "mensaje"]
+
+def predicate_to_dict(pred):
+    if pred.type == "simple":
+        return {"type": "simple", "name": pred.name, "attr": pred.attr, "op": pred.op,
+                "lhs_var": pred.lhs_var, "rhs": dict(pred.rhs)}
+    return {"type": "compound", "name": pred.name, "op": pred.op, "args": list(pred.args)}
+
+def predicate_from_dict(d):
+    if d.get("type") == "simple":
+        if d.get("op") not in REL_OPS:
+            raise ValueError(f"Operador inválido en '{d.get('name')}': {d.get('op')}")
+        return SimplePredicate(d["name"], d["attr"], d["op"], d.get("lhs_var", "X"),
+                               d.get("rhs") or {"type": "var", "var": "Y"})
+    if d.get("type") == "compound":
+        if d.get("op") not in LOGIC_OPS:
+            raise ValueError(f"Operador lógico inválido en '{d.get('name')}': {d.get('op')}")
+        return CompoundPredicate(d["name"], d["op"], list(d["args"]))
+    raise ValueError(f"Tipo de predicado desconocido: {d.get('type')}")
+
+class LogicEngine:
+    """
+    Estado y evaluación de consultas lógicas sin interfaz gráfica: dataset,
+    columna ID, biblioteca de predicados y caché de matrices. Los errores se
+    señalan con ValueError; quien lo use decide cómo mostrarlos.
+    """
+    def __init__(self):
+        self.data = None
+        self.id_column = None       # columna que actúa como ID (p.ej. Fecha)
+        self.id_positions = {}      # id -> posiciones (np.ndarray) de sus filas
+        self.duplicate_ids = 0      # cuántos valores de ID se repiten
+        self.predicates = {}        # nombre -> SimplePredicate | CompoundPredicate
+        self.data_version = 0       # cambia con cada dataset cargado
+        self.matrix_cache = TruthMatrixCache()
+        self.text_columns = {}      # atributo -> TextColumn (se crea al primer uso)
+        self.factorized_columns = {}   # atributo -> FactorizedColumn (ídem)
+        self.stored_matrices = None    # (huella del dataset, archivo .npz, entradas) de la biblioteca cargada
+        self.restored_matrices = 0     # cuántas matrices guardadas se instalaron en la caché
+        self.matrix_summaries = {}     # clave de caché -> any/all por fila y columna (ver append_rows)
+        self.stats = EngineStats(self.matrix_cache)   # tiempos por etapa (ver EngineStats)
+        self._fingerprint = None       # (data_version, huella) calculada la última vez
+
+    # ---------- dataset ----------
+    def set_data(self, data, id_column=None):
+        """Instala un nuevo dataset; las matrices anteriores ya no sirven."""
+        self.data = data
+        self.data_version += 1
+        self.matrix_cache.clear()
+        self.matrix_summaries = {}
+        self.text_columns = {}
+        self.factorized_columns = {}
+        self.set_id_column(id_column if id_column is not None else choose_id_column(data))
+        self._install_stored_matrices()
+
+    def append_rows(self, rows, on_progress=None):
+        """
+        Agrega filas al final del dataset sin recalcular las matrices: cada
+        matriz en caché se extiende sólo con sus M filas y M columnas nuevas
+        (O(N·M) por predicado) y lo mismo sus any/all por fila y columna, así
+        que volver a responder un ∀x∃y guardado cuesta O(N). Devuelve cuántas
+        matrices se actualizaron.
+        """
+        if self.data is None:
+            raise ValueError("Carga un dataset primero.")
+        rows = pd.DataFrame(rows)
+        new_data = append_frame(self.data, rows)
+        if len(rows) == 0:
+            return 0
+
+        cached = {}
+        for name in self.predicates:
+            try:
+                key = self._matrix_cache_key(name)
+            except ValueError:
+                continue
+            matrix = self.matrix_cache.get(key)
+            if matrix is not None and key not in cached:
+                cached[key] = (name, matrix)
+
+        old_n = len(self.data)
+        self.data = new_data
+        self.data_version += 1
+        self.text_columns = {}
+        self.factorized_columns = {}
+        self._extend_id_index(old_n)
+        self.matrix_cache.clear()
+        summaries, self.matrix_summaries = self.matrix_summaries, {}
+
+        with self.stats.stage("dataset_append", f"{len(rows)} filas") as record:
+            for done, (key, (name, matrix)) in enumerate(cached.items(), start=1):
+                summary = summaries.get(key) or matrix_summary(matrix)
+                matrix, summary = self._extend_matrix(name, matrix, summary, old_n)
+                new_key = self._matrix_cache_key(name)
+                self.matrix_cache.put(new_key, matrix)
+                self.matrix_summaries[new_key] = summary
+                record.cells += matrix.shape[0] * matrix.shape[1] - old_n * old_n
+                record.bytes += matrix.nbytes
+                if on_progress is not None:
+                    on_progress(done, len(cached))
+        return len(cached)
+
+    def _extend_matrix(self, name, matrix, summary, old_n):
+        """Matriz de old_n x old_n extendida al dataset actual, evaluando sólo las bandas nuevas."""
+        n = len(self.data)
+        plan = self.compile_formula(name)
+        new_rows = self._execute_formula_plan(plan, slice(old_n, n), slice(None))      # M x n
+        new_cols = self._execute_formula_plan(plan, slice(0, old_n), slice(old_n, n))  # old_n x M
+
+        if isinstance(matrix, UnaryTruthMatrix):
+            new_vector = self._execute_formula_plan(plan, slice(old_n, n), as_vector=True)[:, 0]
+            extended = UnaryTruthMatrix(np.concatenate([matrix.vector, new_vector]))
+        elif n <= DENSE_MATRIX_MAX_SIZE:
+            extended = np.empty((n, n), dtype=bool)
+            extended[:old_n, :old_n] = matrix
+            extended[:old_n, old_n:] = new_cols
+            extended[old_n:] = new_rows
+        elif isinstance(matrix, SparseTruthMatrix):
+            extended = matrix.extended(new_cols, new_rows)
+        else:
+            packed = matrix if isinstance(matrix, PackedTruthMatrix) else PackedTruthMatrix.from_bool(matrix)
+            extended = PackedTruthMatrix.empty(n, n)
+            keep = old_n // 8   # bytes que sólo tienen columnas viejas
+            extended.bits[:old_n, :keep] = packed.bits[:, :keep]
+            tail = np.unpackbits(packed.bits[:, keep:], axis=1)[:, :old_n - keep * 8].astype(bool)
+            extended.bits[:old_n, keep:] = np.packbits(np.hstack([tail, new_cols]), axis=1)
+            extended.set_rows(old_n, new_rows)
+
+        summary = {
+            (1, "any"): np.concatenate([summary[1, "any"] | new_cols.any(axis=1), new_rows.any(axis=1)]),
+            (1, "all"): np.concatenate([summary[1, "all"] & new_cols.all(axis=1), new_rows.all(axis=1)]),
+            (0, "any"): np.concatenate([summary[0, "any"] | new_rows[:, :old_n].any(axis=0),
+                                        new_cols.any(axis=0) | new_rows[:, old_n:].any(axis=0)]),
+            (0, "all"): np.concatenate([summary[0, "all"] & new_rows[:, :old_n].all(axis=0),
+                                        new_cols.all(axis=0) & new_rows[:, old_n:].all(axis=0)]),
+        }
+        return extended, summary
+
+    def dataset_fingerprint(self):
+        """Huella del contenido del dataset (no del archivo): dice para qué datos valen unas matrices guardadas."""
+        if self.data is None:
+            return None
+        if self._fingerprint is None or self._fingerprint[0] != self.data_version:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(json.dumps([str(c) for c in self.data.columns]).encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(self.data, index=False).to_numpy().tobytes())
+            self._fingerprint = (self.data_version, digest.hexdigest())
+        return self._fingerprint[1]
+
+    def load_file(self, filename, id_column=None, usecols=None, on_progress=None, use_snapshot=True):
+        """
+        Carga el archivo (ver loader.open_dataset): usecols limita las columnas
+        leídas y, si el archivo no cambió, se reabre desde su instantánea binaria.
+        """
+        with self.stats.stage("dataset_load", os.path.basename(filename)) as record:
+            data, chosen_id, _ = open_dataset(filename, usecols, id_column, on_progress, use_snapshot)
+            self.set_data(data, chosen_id)
+            record.cells = data.size
+            record.bytes = int(data.memory_usage(deep=False).sum())
+        return self.data
+
+    def set_id_column(self, id_column):
+        """Fija la columna ID y reconstruye el índice id -> posiciones de fila."""
+        if self.data is not None and id_column is not None and id_column not in self.data.columns:
+            raise ValueError(f"La columna ID '{id_column}' no existe en el dataset.")
+        self.id_column = id_column
+        self._rebuild_id_index()
+
+    def _rebuild_id_index(self):
+        if self.data is None or self.id_column not in self.data.columns:
+            self.id_positions = {}
+            self.duplicate_ids = 0
+            return
+        ids = self.data[self.id_column].to_numpy()
+        self.id_positions = pd.Series(np.arange(len(ids))).groupby(ids, sort=False, dropna=False).indices
+        self.duplicate_ids = len(ids) - len(self.id_positions)
+
+    def _extend_id_index(self, old_n):
+        """Agrega al índice id -> posiciones sólo las filas desde old_n."""
+        if self.id_column not in self.data.columns:
+            return
+        new_ids = self.data[self.id_column].to_numpy()[old_n:]
+        if pd.isna(new_ids).any():
+            self._rebuild_id_index()   # NaN no sirve como clave de diccionario
+            return
+        for pos, id_val in enumerate(new_ids, start=old_n):
+            previous = self.id_positions.get(id_val)
+            if previous is None:
+                self.id_positions[id_val] = np.array([pos])
+            else:
+                self.id_positions[id_val] = np.append(previous, pos)
+                self.duplicate_ids += 1
+
+    def positions_of(self, id_val):
+        """Posiciones de las filas con ese ID (vacío si no existe)."""
+        return self.id_positions.get(id_val, ())
+
+    def domain_ids(self):
+        if self.data is None or not self.id_column:
+            return []
+        return list(self.data[self.id_column])
+
+    def attr_values(self, attr):
+        """Valores del atributo en el orden del dominio (por posición de fila)."""
+        if self.data is None or attr not in self.data.columns:
+            return np.array([], dtype=object)
+        return self.data[attr].to_numpy()
+
+    def parse_const_for_series(self, series, raw):
+        if raw is None or raw == "":
+            raise ValueError("Constante vacía.")
+        s = str(raw).strip()
+
+        low = s.lower()
+        if pd.api.types.is_bool_dtype(series):
+            if low in {"true","1","t","sí","si","y"}: return True
+            if low in {"false","0","f","no","n"}: return False
+            raise ValueError("El valor debe ser booleano (true/false)")
+
+        if pd.api.types.is_integer_dtype(series):
+            return int(float(s))
+        if pd.api.types.is_float_dtype(series):
+            return float(s)
+
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # ISO primero (así guardan las fechas las bibliotecas); si no, día/mes/año
+            for kwargs in ({"format": "ISO8601"}, {"dayfirst": True}):
+                try:
+                    return pd.to_datetime(s, errors="raise", **kwargs)
+                except Exception:
+                    pass
+
+        return s
+
+    # ---------- biblioteca de predicados ----------
+    def add_predicate(self, pred):
+        if pred.name in self.predicates:
+            raise ValueError(f"Ya existe un predicado/fórmula '{pred.name}'.")
+        self.predicates[pred.name] = pred
+        return pred
+
+    @staticmethod
+    def validate_library(predicates):
+        """Comprueba que toda fórmula referencia predicados existentes y no tiene ciclos."""
+        probe = LogicEngine()
+        probe.predicates = predicates
+        for name in predicates:
+            probe.compile_formula(name)
+
+    def load_library(self, filename):
+        """
+        Carga una biblioteca de predicados JSON ({"version": 2, "predicates": [...]})
+        y reemplaza la actual. Si trae matrices guardadas para este mismo dataset
+        (o para el próximo que se cargue con ese contenido) van directo a la caché.
+        """
+        with open(filename, encoding="utf-8") as f:
+            payload = json.load(f)
+        version = payload.get("version", 1) if isinstance(payload, dict) else 1
+        if version > LIBRARY_FORMAT_VERSION:
+            raise ValueError(f"La biblioteca usa el formato {version}, más nuevo que el soportado ({LIBRARY_FORMAT_VERSION}).")
+        items = payload["predicates"] if isinstance(payload, dict) else payload
+        predicates = {}
+        for item in items:
+            pred = predicate_from_dict(item)
+            if pred.name in predicates:
+                raise ValueError(f"Predicado repetido en la biblioteca: '{pred.name}'.")
+            predicates[pred.name] = pred
+        self.validate_library(predicates)
+        self.predicates = predicates
+        self.matrix_cache.clear()
+
+        stored = payload.get("matrices") if isinstance(payload, dict) else None
+        self.stored_matrices = None
+        self.restored_matrices = 0
+        if stored:
+            folder = os.path.dirname(os.path.abspath(filename))
+            self.stored_matrices = (stored["dataset"], os.path.join(folder, stored["file"]), stored["items"])
+            self._install_stored_matrices()
+        return predicates
+
+    @staticmethod
+    def matrices_path(filename):
+        """Archivo .npz con las matrices de una biblioteca guardada."""
+        return os.path.splitext(filename)[0] + ".matrices.npz"
+
+    def _install_stored_matrices(self):
+        """Pasa a la caché las matrices guardadas si corresponden al dataset actual."""
+        if self.stored_matrices is None or self.data is None:
+            return
+        fingerprint, path, items = self.stored_matrices
+        if fingerprint != self.dataset_fingerprint():
+            return
+        n = len(self.data)
+        restored = 0
+        try:
+            with np.load(path) as arrays:
+                for item in items:
+                    name = item["name"]
+                    if name not in self.predicates or tuple(item["shape"]) != (n, n):
+                        continue
+                    if item.get("vector"):
+                        if len(arrays[item["array"]]) != n:
+                            continue
+                        matrix = UnaryTruthMatrix(arrays[item["array"]])
+                    elif item.get("sparse"):
+                        matrix = SparseTruthMatrix(arrays[item["array"]], (n, n), bool(item.get("complement")))
+                    else:
+                        matrix = PackedTruthMatrix(arrays[item["array"]], (n, n))
+                        if n <= DENSE_MATRIX_MAX_SIZE:
+                            matrix = matrix.to_bool()
+                    self.matrix_cache.put(self._matrix_cache_key(name), matrix)
+                    restored += 1
+        except (OSError, KeyError, ValueError):
+            return   # las matrices son sólo un atajo: sin ellas se recalculan
+        self.restored_matrices = restored
+
+    def library_columns(self):
+        """Atributos que usan los predicados simples de la biblioteca."""
+        return sorted({p.attr for p in self.predicates.values() if p.type == "simple"}, key=str)
+
+    def save_library(self, filename, include_matrices=False):
+        """
+        Guarda la biblioteca en JSON. Con include_matrices, las matrices que ya
+        están en la caché se guardan empaquetadas a bits (las dispersas, como
+        sus coordenadas; las unarias, como su vector) en un .npz al lado,
+        con la huella del dataset para el que valen. Devuelve cuántas se guardaron.
+        """
+        payload = {"version": LIBRARY_FORMAT_VERSION,
+                   "predicates": [predicate_to_dict(p) for p in self.predicates.values()]}
+        items = []
+        if include_matrices and self.data is not None:
+            arrays = {}
+            for name in self.predicates:
+                try:
+                    matrix = self.matrix_cache.get(self._matrix_cache_key(name))
+                except ValueError:
+                    continue
+                if matrix is None:
+                    continue
+                key = f"m{len(items)}"
+                if isinstance(matrix, UnaryTruthMatrix):
+                    arrays[key] = matrix.vector
+                    items.append({"name": name, "array": key, "shape": list(matrix.shape), "vector": True})
+                    continue
+                if isinstance(matrix, SparseTruthMatrix):
+                    arrays[key] = matrix.keys
+                    items.append({"name": name, "array": key, "shape": list(matrix.shape),
+                                  "sparse": True, "complement": matrix.complement})
+                    continue
+                if not isinstance(matrix, PackedTruthMatrix):
+                    matrix = PackedTruthMatrix.from_bool(matrix)
+                arrays[key] = matrix.bits
+                items.append({"name": name, "array": key, "shape": list(matrix.shape)})
+            if items:
+                path = self.matrices_path(filename)
+                with open(path, "wb") as f:
+                    np.savez_compressed(f, **arrays)
+                payload["matrices"] = {"file": os.path.basename(path),
+                                       "dataset": self.dataset_fingerprint(), "items": items}
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2, default=str)
+        return len(items)
+
+    def resolve_predicate_name(self, name):
+        if not name:
+            return None
+        if name in self.predicates:
+            return name
+        low = name.lower()
+        up = name.upper()
+        if low in self.predicates:
+            return low
+        if up in self.predicates:
+            return up
+        return None
+
+    def rename_predicate(self, old_name, new_name):
+        if old_name == new_name or old_name not in self.predicates:
+            return
+        self.invalidate_predicate(old_name)
+        pred = self.predicates.pop(old_name)
+        pred.name = new_name
+        self.predicates[new_name] = pred
+        for p in self.predicates.values():
+            if getattr(p, "type", None) == "compound":
+                p.args = [new_name if a == old_name else a for a in p.args]
+
+    def invalidate_predicate(self, name):
+        """Descarta de la caché las matrices del predicado y de las fórmulas que lo usan."""
+        for dep in self._dependents(name):
+            try:
+                self.matrix_cache.discard(self._matrix_cache_key(dep))
+            except (ValueError, KeyError):
+                continue
+
+    def _dependents(self, name):
+        """Predicados cuya fórmula usa `name` (incluido él mismo)."""
+        deps = []
+        for other in self.predicates:
+            try:
+                if name in self.compile_formula(other):
+                    deps.append(other)
+            except ValueError:
+                continue
+        return deps
+
+    # ---------- comparaciones ----------
+    def parse_constant(self, attr, raw):
+        """Constante escrita por el usuario, convertida al tipo de la columna (ValueError si no encaja)."""
+        if self.data is None or attr not in self.data.columns:
+            raise ValueError(f"El atributo '{attr}' no está en el dataset.")
+        return self.parse_const_for_series(self.data[attr], raw)
+
+    def _compare(self, a, b, op):
+        try:
+            if pd.isna(a) or pd.isna(b):
+                return False
+        except Exception:
+            pass
+        if op == RelOp.EQ: return a == b
+        if op == RelOp.NE: return a != b
+        if op == RelOp.GT: return a >  b
+        if op == RelOp.LT: return a <  b
+        if op == RelOp.GE: return a >= b
+        if op == RelOp.LE: return a <= b
+        if op == RelOp.CONTAINS:
+            return str(b).lower() in str(a).lower()
+        if op == RelOp.STARTS_WITH:
+            return str(a).lower().startswith(str(b).lower())
+        if op == RelOp.ENDS_WITH:
+            return str(a).lower().endswith(str(b).lower())
+        raise ValueError(f"Operador no válido: {op}")
+
+    def _column_values(self, series):
+        """Valores de la columna como arreglo NumPy + máscara de válidos (no NaN)."""
+        values = series.to_numpy()
+        valid = ~pd.isna(values)
+        if values.dtype == object and not valid.all() and valid.any():
+            # Rellenamos los NaN con un valor de la misma columna para que la
+            # comparación vectorizada no falle por tipos mezclados; la máscara
+            # se encarga después de dejarlos en False.
+            values = values.copy()
+            values[~valid] = values[np.argmax(valid)]
+        return values, valid
+
+    def text_column(self, attr):
+        """Columna normalizada para CONTAINS/STARTS_WITH/ENDS_WITH; se calcula una vez por dataset."""
+        column = self.text_columns.get(attr)
+        if column is None:
+            column = self.text_columns[attr] = TextColumn(self.data[attr])
+        return column
+
+    def factorized_column(self, attr):
+        """Códigos y valores distintos de la columna; se calcula una vez por dataset."""
+        column = self.factorized_columns.get(attr)
+        if column is None:
+            column = self.factorized_columns[attr] = FactorizedColumn(self.data[attr])
+        return column
+
+    def _compare_arrays(self, left, right, op):
+        """Versión vectorizada de _compare: compara arreglos con broadcasting."""
+        if op in (RelOp.CONTAINS, RelOp.STARTS_WITH, RelOp.ENDS_WITH):
+            left = np.array([_text_of(v) for v in np.ravel(left)], dtype=str).reshape(np.shape(left))
+            right = np.array([_text_of(v) for v in np.ravel(right)], dtype=str).reshape(np.shape(right))
+            if op == RelOp.CONTAINS:
+                return np.char.find(left, right) >= 0
+            if op == RelOp.STARTS_WITH:
+                return np.char.startswith(left, right)
+            return np.char.endswith(left, right)
+
+        ops = {
+            RelOp.EQ: np.equal, RelOp.NE: np.not_equal,
+            RelOp.GT: np.greater, RelOp.LT: np.less,
+            RelOp.GE: np.greater_equal, RelOp.LE: np.less_equal,
+        }
+        if op not in ops:
+            raise ValueError(f"Operador no válido: {op}")
+        try:
+            # NaN/NaT dan False y avisan "invalid value"; la máscara de válidos ya los descarta
+            with np.errstate(invalid="ignore"):
+                return np.asarray(ops[op](left, right), dtype=bool)
+        except TypeError:
+            # Tipos no comparables entre sí (p.ej. texto vs número): celda a celda
+            def safe(a, b):
+                try:
+                    return bool(self._compare(a, b, op))
+                except Exception:
+                    return False
+            return np.frompyfunc(safe, 2, 1)(left, right).astype(bool)
+
+    def _simple_predicate_matrix(self, pred, rows=slice(None), cols=slice(None)):
+        """Bloque filas x columnas de la matriz de un predicado simple, en una sola comparación con broadcasting."""
+        if pred.rhs["type"] == "var":
+            column = self.factorized_column(pred.attr)
+            if column.compact:
+                return column.relation(pred.op, self._compare_arrays, rows, cols)
+
+        values, valid = self._column_values(self.data[pred.attr])
+
+        if pred.rhs["type"] == "var":
+            if pred.op in TEXT_OPS:
+                matrix = self.text_column(pred.attr).relation(pred.op, rows, cols)
+            else:
+                matrix = self._compare_arrays(values[rows, None], values[None, cols], pred.op)
+            matrix &= valid[rows, None] & valid[None, cols]
+            return matrix
+
+        # p(x,const): no depende de y; se devuelve como vector columna (filas x 1)
+        # y las fórmulas lo combinan con las matrices por broadcasting
+        const = pred.rhs["value"]
+        if pd.isna(const):
+            return np.zeros((len(values[rows]), 1), dtype=bool)
+        if isinstance(const, str) and pred.op not in TEXT_OPS:
+            # las bibliotecas JSON guardan fechas como texto: se convierten al tipo de la columna
+            const = self.parse_const_for_series(self.data[pred.attr], const)
+        if pred.op in TEXT_OPS:
+            vector = self.text_column(pred.attr).compare_const(pred.op, const, rows) & valid[rows]
+        else:
+            vector = self._compare_arrays(values[rows], np.asarray(const, dtype=object), pred.op) & valid[rows]
+        return vector[:, None]
+
+    def _eval_predicate(self, name, i=None, j=None):
+        """Evalúa una celda (x=fila i, y=fila j); i y j son posiciones, no valores de ID."""
+        pred = self.predicates[name]
+        if pred.type == "simple":
+            series = self.data[pred.attr]
+            if i is None:
+                return False
+            try:
+                lv = series.iloc[i]
+            except Exception:
+                return False
+
+            if pred.rhs["type"] == "var":
+                if j is None:
+                    return False
+                try:
+                    rv = series.iloc[j]
+                except Exception:
+                    return False
+            else:
+                rv = pred.rhs["value"]
+
+            try:
+                return self._compare(lv, rv, pred.op)
+            except Exception:
+                return False
+
+        if pred.type == "compound":
+            if pred.op == LogicOp.NOT:
+                return not self._eval_predicate(pred.args[0], i, j)
+            if pred.op == LogicOp.AND:
+                return self._eval_predicate(pred.args[0], i, j) and self._eval_predicate(pred.args[1], i, j)
+            if pred.op == LogicOp.OR:
+                return self._eval_predicate(pred.args[0], i, j) or self._eval_predicate(pred.args[1], i, j)
+            if pred.op == LogicOp.IMPLIES:
+                return (not self._eval_predicate(pred.args[0], i, j)) or \
+                    self._eval_predicate(pred.args[1] if len(pred.args) > 1 else pred.args[0], i, j)
+            if pred.op == LogicOp.XOR:
+                p_val = self._eval_predicate(pred.args[0], i, j)
+                q_val = self._eval_predicate(pred.args[1], i, j)
+                return (p_val or q_val) and not (p_val and q_val)
+            if pred.op == LogicOp.BICONDITIONAL:
+                p_val = self._eval_predicate(pred.args[0], i, j)
+                q_val = self._eval_predicate(pred.args[1], i, j)
+                return p_val == q_val
+            raise ValueError("Operador lógico no soportado.")
+        return False
+
+    # ---------- MATRICES NxN ----------
+    def generate_truth_matrix(self, predicate_name, on_progress=None, should_cancel=None):
+        """
+        Matriz NxN completa de la fórmula (o de la caché). on_progress(hecho, total)
+        se llama tras cada paso del plan y, si should_cancel() devuelve True, se
+        abandona con JobCancelled. Lanza ValueError si la fórmula no es válida.
+        """
+        if self.data is None or predicate_name not in self.predicates:
+            return None, []
+        with self.stats.stage("matrix_build", predicate_name):
+            return self._build_truth_matrix(predicate_name, on_progress, should_cancel)
+
+    def _build_truth_matrix(self, predicate_name, on_progress, should_cancel):
+        ids = self.domain_ids()
+        n = len(ids)
+
+        key = self._matrix_cache_key(predicate_name)
+        cached = self.matrix_cache.get(key)
+        if cached is not None:
+            return cached, ids
+        if self.is_unary(predicate_name):
+            return self.unary_matrix(predicate_name), ids
+        known = self._cached_submatrices(predicate_name)
+        plan = self.compile_formula(predicate_name, leaves=known)
+        timings = {}
+
+        # Hasta DENSE_MATRIX_MAX_SIZE se devuelve un np.ndarray bool; por encima,
+        # la matriz se construye por bloques de filas y se guarda empaquetada a bits,
+        # o dispersa si la muestra indica menos de SPARSE_MAX_DENSITY de V (o de F).
+        # Desde PARALLEL_MIN_SIZE los bloques se reparten entre varios procesos.
+        sparse_mode = None
+        if n > DENSE_MATRIX_MAX_SIZE:
+            density = self._estimate_density(plan, known, n)
+            if density <= SPARSE_MAX_DENSITY:
+                sparse_mode = "V"
+            elif density >= 1 - SPARSE_MAX_DENSITY:
+                sparse_mode = "F"
+        parallel = n >= PARALLEL_MIN_SIZE and PARALLEL_WORKERS > 1 and sparse_mode is None
+        if n <= DENSE_MATRIX_MAX_SIZE:
+            blocks = [(0, n)]
+        else:
+            step = max(1, MATRIX_BLOCK_CELLS // n)
+            if parallel:
+                step = min(step, -(-n // (PARALLEL_WORKERS * 4)))   # varios bloques por proceso
+            blocks = [(start, min(start + step, n)) for start in range(0, n, step)]
+        total_steps = len(blocks) * len(plan)
+
+        done = 0
+        def check_cancel():
+            if should_cancel is not None and should_cancel():
+                raise JobCancelled()
+
+        def on_step(step):
+            check_cancel()
+            if on_progress is not None:
+                on_progress(done + step, total_steps)
+
+        if n <= DENSE_MATRIX_MAX_SIZE:
+            check_cancel()
+            matrix = self._execute_formula_plan(plan, known=known, on_step=on_step, timings=timings)
+        elif parallel:
+            def on_tile(finished):
+                check_cancel()
+                if on_progress is not None:
+                    on_progress(finished * len(plan), total_steps)
+            matrix = self._generate_tiles_parallel(plan, known, n, blocks, on_tile)
+        elif sparse_mode is not None:
+            matrix = self._generate_sparse(plan, known, n, blocks, sparse_mode == "F", check_cancel, on_step, timings)
+        else:
+            matrix = PackedTruthMatrix.empty(n, n)
+            for start, stop in blocks:
+                check_cancel()
+                matrix.set_rows(start, self._execute_formula_plan(plan, slice(start, stop), known=known,
+                                                                  on_step=on_step, timings=timings))
+                done += len(plan)
+
+        record = self.stats.current()
+        record.cells, record.bytes = n * n, matrix.nbytes
+        self._record_plan_timings(timings)
+        self.matrix_cache.put(key, matrix)
+        return matrix, ids
+
+    def _record_plan_timings(self, timings):
+        """Una etapa por subpredicado evaluado (predicate) o combinado (logic_op), sumada sobre todos los bloques."""
+        for name, (seconds, cells, nbytes) in timings.items():
+            pred = self.predicates[name]
+            if pred.type == "simple":
+                self.stats.add("predicate", f"{name}: {pred.attr} {pred.op}", seconds, cells, nbytes)
+            else:
+                self.stats.add("logic_op", f"{name}: {pred.op}", seconds, cells, nbytes)
+
+    def _estimate_density(self, plan, known, n):
+        """Fracción de V en SPARSE_SAMPLE_ROWS filas repartidas por toda la matriz."""
+        step = max(1, n // SPARSE_SAMPLE_ROWS)
+        sample = self._execute_formula_plan(plan, slice(0, n, step), known=known)
+        return float(sample.mean()) if sample.size else 0.0
+
+    def _generate_sparse(self, plan, known, n, blocks, complement, check_cancel, on_step, timings=None):
+        """
+        Matriz dispersa por bloques de filas (coordenadas de las V, o de las F
+        con complement). Si la estimación falló y ya no ahorra memoria frente a
+        los bits (más de 1/64 de celdas guardadas), sigue empaquetada.
+        """
+        parts = []
+        stored = 0
+        matrix = None
+        for number, (start, stop) in enumerate(blocks):
+            check_cancel()
+            def step(pos, number=number):
+                on_step(number * len(plan) + pos)
+            block = self._execute_formula_plan(plan, slice(start, stop), known=known, on_step=step, timings=timings)
+            if matrix is not None:
+                matrix.set_rows(start, block)
+                continue
+            keys = np.flatnonzero(~block if complement else block) + start * n
+            parts.append(keys)
+            stored += len(keys)
+            if stored > n * n // 64:
+                matrix = self._as_packed(SparseTruthMatrix(np.concatenate(parts), (n, n), complement))
+        if matrix is not None:
+            return matrix
+        return SparseTruthMatrix(np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64), (n, n), complement)
+
+    def _generate_tiles_parallel(self, plan, known, n, tiles, on_tile):
+        """
+        Reparte los bloques de filas entre PARALLEL_WORKERS procesos. Cada uno
+        escribe sus filas empaquetadas en un único buffer de memoria compartida,
+        que pasa a ser la matriz resultante sin copiarlo. on_tile(terminados)
+        se llama por bloque y puede abortar lanzando una excepción.
+        """
+        attrs = {self.predicates[name].attr for name in plan
+                 if name not in known and self.predicates[name].type == "simple"}
+        data = self.data[[c for c in self.data.columns if c in attrs]]
+        predicates = {name: self.predicates[name] for name in plan}
+        bits_shape = (n, (n + 7) // 8)
+
+        shm = shared_memory.SharedMemory(create=True, size=bits_shape[0] * bits_shape[1])
+        try:
+            initargs = (data, predicates, plan, known, shm.name, bits_shape)
+            context = multiprocessing.get_context(PARALLEL_START_METHOD)
+            with context.Pool(min(PARALLEL_WORKERS, len(tiles)), _init_tile_worker, initargs) as pool:
+                for finished, _ in enumerate(pool.imap_unordered(_eval_tile, tiles), start=1):
+                    on_tile(finished)   # si lanza, el with termina el pool
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        # El nombre se libera ya; el segmento vive mientras la matriz lo referencie.
+        shm.unlink()
+        return PackedTruthMatrix(np.ndarray(bits_shape, dtype=np.uint8, buffer=shm.buf), (n, n), owner=shm)
+
+    def lazy_truth_matrix(self, predicate_name, on_progress=None, should_cancel=None, known=None):
+        """
+        Matriz de verdad perezosa: los bloques se evalúan sólo cuando los pide
+        la evaluación de cuantificadores, que se detiene en cuanto queda decidida.
+        on_progress(celdas evaluadas, N*N) y should_cancel() se consultan por bloque.
+        `known` aporta matrices completas de subpredicados (nombre -> matriz)
+        además de las que hay en la caché.
+        """
+        ids = self.domain_ids()
+        key = self._matrix_cache_key(predicate_name)
+        cached = self.matrix_cache.get(key)
+        summary = self.matrix_summaries.get(key)
+        if cached is not None:
+            return (cached if summary is None else SummarizedTruthMatrix(cached, summary)), ids
+        if known and predicate_name in known:
+            return known[predicate_name], ids
+        if self.is_unary(predicate_name):
+            return self.unary_matrix(predicate_name), ids
+        pred = self.predicates[predicate_name]
+        fast_matrix = self._factorized_matrix(pred)
+        if fast_matrix is None:
+            fast_matrix = self._sorted_order_matrix(pred)
+        if fast_matrix is not None:
+            return fast_matrix, ids
+        extra = known or {}
+        known = self._cached_submatrices(predicate_name)
+        known.update((node, extra[node]) for node in self.compile_formula(predicate_name) if node in extra)
+        plan = self.compile_formula(predicate_name, leaves=known)
+        n = len(ids)
+        evaluated = [0]
+
+        def block_fn(rows, cols):
+            if should_cancel is not None and should_cancel():
+                raise JobCancelled()
+            block = self._execute_formula_plan(plan, rows, cols, known)
+            if on_progress is not None:
+                evaluated[0] += block.size
+                on_progress(min(evaluated[0], n * n), n * n)
+            return block
+
+        matrix = LazyTruthMatrix(block_fn, (n, n))
+        if summary is not None:
+            # ya se recorrió entera pero no cupo en la caché: quedan sus any/all
+            return SummarizedTruthMatrix(matrix, summary), ids
+        return matrix, ids
+
+    def is_unary(self, name):
+        """True si la fórmula sólo usa predicados con constante: depende de x y no de y."""
+        return all(self.predicates[node].type == "compound" or self.predicates[node].rhs["type"] == "const"
+                   for node in self.compile_formula(name))
+
+    def unary_matrix(self, name):
+        """
+        UnaryTruthMatrix de una fórmula que sólo depende de x: un vector de N
+        valores en O(N), que queda en la caché como cualquier matriz.
+        """
+        key = self._matrix_cache_key(name)
+        cached = self.matrix_cache.get(key)
+        if isinstance(cached, UnaryTruthMatrix):
+            return cached
+        with self.stats.stage("matrix_build", name) as record:
+            known = {node: m for node, m in self._cached_submatrices(name).items() if isinstance(m, UnaryTruthMatrix)}
+            plan = self.compile_formula(name, leaves=known)
+            timings = {}
+            matrix = UnaryTruthMatrix(self._execute_formula_plan(plan, known=known, as_vector=True,
+                                                                 timings=timings)[:, 0])
+            record.cells = len(matrix.vector)
+            record.bytes = matrix.nbytes
+            self._record_plan_timings(timings)
+        self.matrix_cache.put(key, matrix)
+        return matrix
+
+    def _factorized_matrix(self, pred):
+        """Vía rápida para p(x,y) sobre una columna con pocos valores distintos: FactorizedTruthMatrix o None."""
+        if pred.type != "simple" or pred.rhs["type"] != "var" or pred.attr not in self.data.columns:
+            return None
+        column = self.factorized_column(pred.attr)
+        if not column.compact:
+            return None
+        try:
+            return FactorizedTruthMatrix(column.core(pred.op, self._compare_arrays), column.codes)
+        except Exception:
+            return None   # la vía general dará la matriz toda F, como siempre
+
+    def _sorted_order_matrix(self, pred):
+        """
+        Vía rápida para p(x,y) = x.attr op y.attr con op de orden: SortedOrderMatrix
+        si la columna se puede ordenar (numérica, fecha o sólo texto), o None.
+        """
+        if pred.type != "simple" or pred.rhs["type"] != "var" or pred.op not in FLIPPED_ORDER_OPS:
+            return None
+        if pred.attr not in self.data.columns:
+            return None
+        values, valid = self._column_values(self.data[pred.attr])
+        if values.dtype.kind not in "biufmM":
+            if values.dtype != object or pd.api.types.infer_dtype(values[valid], skipna=False) != "string":
+                return None
+        return SortedOrderMatrix(values, valid, pred.op,
+                                 lambda rows, cols: self._simple_predicate_matrix(pred, rows, cols))
+
+    def _predicate_structure(self, name, _memo=None):
+        """Firma estructural (hashable) de la definición del predicado, sin nombres."""
+        memo = {} if _memo is None else _memo
+        if name in memo:
+            return memo[name]
+        pred = self.predicates[name]
+        if pred.type == "simple":
+            rhs = pred.rhs
+            rhs_key = ("var", rhs.get("var")) if rhs["type"] == "var" else ("const", repr(rhs.get("value")))
+            key = ("simple", pred.attr, pred.op, pred.lhs_var, rhs_key)
+        else:
+            key = ("compound", pred.op, tuple(self._predicate_structure(a, memo) for a in pred.args))
+        memo[name] = key
+        return key
+
+    def _matrix_cache_key(self, name):
+        self.compile_formula(name)  # valida referencias y ciclos
+        return (self._predicate_structure(name), self.data_version)
+
+    def result_key(self, name):
+        """
+        Firma de un resultado calculado con el predicado: deja de coincidir si se
+        edita, renombra o borra, o si cambian los datos (None si ya no se puede evaluar).
+        """
+        try:
+            return self._matrix_cache_key(name)
+        except (KeyError, ValueError):
+            return None
+
+    def _cached_submatrices(self, name):
+        """Subpredicados de la fórmula cuya matriz completa ya está en caché."""
+        known = {}
+        for node in self.compile_formula(name):
+            key = (self._predicate_structure(node), self.data_version)
+            if key in self.matrix_cache:
+                known[node] = self.matrix_cache.get(key)
+        return known
+
+    def compile_formula(self, name, leaves=()):
+        """
+        Compila la fórmula a un DAG: lista de nombres en orden topológico, sin
+        repetidos, de modo que cada subpredicado se evalúa una sola vez. Los
+        nombres en `leaves` (p.ej. matrices ya en caché) no se desarrollan.
+        """
+        plan = []
+        state = {}
+
+        def visit(node):
+            if state.get(node) == "done":
+                return
+            if state.get(node) == "visiting":
+                raise ValueError(f"La fórmula '{name}' tiene una referencia circular en '{node}'.")
+            if node not in self.predicates:
+                raise ValueError(f"El predicado '{node}' no existe en la biblioteca.")
+            state[node] = "visiting"
+            pred = self.predicates[node]
+            if pred.type == "compound" and node not in leaves:
+                for arg in pred.args:
+                    visit(arg)
+            state[node] = "done"
+            plan.append(node)
+
+        visit(name)
+        return plan
+
+    def _execute_formula_plan(self, plan, rows=slice(None), cols=slice(None), known=None, on_step=None,
+                              as_vector=False, timings=None):
+        """
+        Evalúa el DAG sobre el bloque filas x columnas con operaciones de
+        matriz completa; libera los intermedios en cuanto dejan de usarse.
+        `known` aporta matrices completas ya calculadas (se recorta el bloque).
+        Los predicados con constante se evalúan como vectores (filas x 1); si
+        la fórmula entera sólo depende de x y as_vector, se devuelve así.
+        Con timings, suma por subpredicado [segundos, celdas, bytes] del paso.
+        """
+        known = known or {}
+        last_use = {}
+        for pos, name in enumerate(plan):
+            pred = self.predicates[name]
+            if pred.type == "compound" and name not in known:
+                for arg in pred.args:
+                    last_use[arg] = pos
+
+        results = {}
+        for pos, name in enumerate(plan):
+            pred = self.predicates[name]
+            start = time.perf_counter()
+            if name in known:
+                if isinstance(known[name], UnaryTruthMatrix):
+                    results[name] = known[name].vector[rows, None]
+                else:
+                    results[name] = np.asarray(known[name][rows, cols], dtype=bool)
+            elif pred.type == "simple":
+                try:
+                    results[name] = self._simple_predicate_matrix(pred, rows, cols)
+                except Exception:
+                    domain = range(len(self.data))
+                    width = 1 if pred.rhs["type"] == "const" else len(domain[cols])
+                    results[name] = np.zeros((len(domain[rows]), width), dtype=bool)
+            else:
+                results[name] = self._combine_matrices(pred.op, [results[a] for a in pred.args])
+                for arg in set(pred.args):
+                    if last_use.get(arg) == pos:
+                        del results[arg]
+            if timings is not None and name not in known:
+                step = timings.setdefault(name, [0.0, 0, 0])
+                step[0] += time.perf_counter() - start
+                step[1] += results[name].size
+                step[2] += results[name].nbytes
+            if on_step is not None:
+                on_step(pos + 1)
+        result = results[plan[-1]]
+        n_cols = len(range(len(self.data))[cols])
+        if result.shape[1] != n_cols and not as_vector:
+            result = np.repeat(result, n_cols, axis=1)
+        return result
+
+    def _combine_matrices(self, op, matrices):
+        if all(isinstance(m, np.ndarray) for m in matrices):
+            # Bloques de la evaluación: vectores y matrices se combinan por broadcasting
+            if op == LogicOp.NOT:
+                return np.logical_not(matrices[0])
+            if op not in ARRAY_LOGIC or (len(matrices) < 2 and op != LogicOp.IMPLIES):
+                raise ValueError("Operador lógico no soportado.")
+            return ARRAY_LOGIC[op](matrices[0], matrices[1] if len(matrices) > 1 else matrices[0])
+        if op == LogicOp.NOT:
+            return self.matrix_NOT(matrices[0])
+        if op == LogicOp.IMPLIES:
+            return self.matrix_IMPLIES(matrices[0], matrices[1] if len(matrices) > 1 else matrices[0])
+        if op == LogicOp.AND:
+            return self.matrix_AND(matrices[0], matrices[1])
+        if op == LogicOp.OR:
+            return self.matrix_OR(matrices[0], matrices[1])
+        if op == LogicOp.XOR:
+            return self.matrix_XOR(matrices[0], matrices[1])
+        if op == LogicOp.BICONDITIONAL:
+            return self.matrix_BICONDITIONAL(matrices[0], matrices[1])
+        raise ValueError("Operador lógico no soportado.")
+
+    # ---------- OPERADORES MATRICIALES ----------
+    def _operands(self, matrix1, matrix2):
+        """
+        Lleva ambos operandos a una misma representación: dos dispersas se
+        quedan así (se operan como conjuntos); si alguna está empaquetada, se
+        empaquetan las dos; si no, ambas como np.ndarray bool.
+        """
+        if matrix1.shape != matrix2.shape:
+            raise ValueError("Las matrices deben tener la misma dimensión")
+        for kind in (SparseTruthMatrix, UnaryTruthMatrix):
+            if isinstance(matrix1, kind) and isinstance(matrix2, kind):
+                return matrix1, matrix2
+        if isinstance(matrix1, PackedTruthMatrix) or isinstance(matrix2, PackedTruthMatrix):
+            return self._as_packed(matrix1), self._as_packed(matrix2)
+        return self._as_bool(matrix1), self._as_bool(matrix2)
+
+    @staticmethod
+    def _as_packed(matrix):
+        if isinstance(matrix, PackedTruthMatrix):
+            return matrix
+        if isinstance(matrix, BlockedTruthMatrix):
+            packed = PackedTruthMatrix.empty(*matrix.shape)
+            for start, block in matrix.row_blocks():
+                packed.set_rows(start, block)
+            return packed
+        return PackedTruthMatrix.from_bool(matrix)
+
+    @staticmethod
+    def _as_bool(matrix):
+        return matrix.to_bool() if isinstance(matrix, BlockedTruthMatrix) else matrix
+
+    def matrix_AND(self, matrix1, matrix2):
+        # Una dispersa de celdas V sigue dispersa al hacer AND con cualquier otra
+        for sparse, other in ((matrix1, matrix2), (matrix2, matrix1)):
+            if (isinstance(sparse, SparseTruthMatrix) and not sparse.complement
+                    and not isinstance(other, SparseTruthMatrix)):
+                if sparse.shape != other.shape:
+                    raise ValueError("Las matrices deben tener la misma dimensión")
+                return sparse.masked(other)
+        matrix1, matrix2 = self._operands(matrix1, matrix2)
+        if isinstance(matrix1, np.ndarray):
+            return np.logical_and(matrix1, matrix2)
+        return matrix1 & matrix2
+
+    def matrix_OR(self, matrix1, matrix2):
+        matrix1, matrix2 = self._operands(matrix1, matrix2)
+        if isinstance(matrix1, np.ndarray):
+            return np.logical_or(matrix1, matrix2)
+        return matrix1 | matrix2
+
+    def matrix_NOT(self, matrix):
+        if isinstance(matrix, (PackedTruthMatrix, SparseTruthMatrix, UnaryTruthMatrix)):
+            return ~matrix
+        return np.logical_not(matrix)
+
+    def matrix_XOR(self, matrix1, matrix2):
+        matrix1, matrix2 = self._operands(matrix1, matrix2)
+        if isinstance(matrix1, np.ndarray):
+            return np.logical_xor(matrix1, matrix2)
+        return matrix1 ^ matrix2
+
+    def matrix_IMPLIES(self, matrix1, matrix2):
+        matrix1, matrix2 = self._operands(matrix1, matrix2)
+        if isinstance(matrix1, np.ndarray):
+            return np.logical_or(np.logical_not(matrix1), matrix2)
+        return ~matrix1 | matrix2
+
+    def matrix_BICONDITIONAL(self, matrix1, matrix2):
+        matrix1, matrix2 = self._operands(matrix1, matrix2)
+        if isinstance(matrix1, np.ndarray):
+            return np.logical_and(self.matrix_IMPLIES(matrix1, matrix2), self.matrix_IMPLIES(matrix2, matrix1))
+        return ~(matrix1 ^ matrix2)
+
+    # ---------- CUANTIFICADORES ANIDADOS ----------
+    def quantified_notation(self, q1, q2, order, formula_name):
+        """Devuelve la consulta en notación de libro (q2=None: sólo se cuantifica x)."""
+        if q2 is None:
+            return f"{q1}x {formula_name}(x)"
+        if order == "X→Y":
+            return f"{q1}x {q2}y {formula_name}(x,y)"
+        else:
+            return f"{q1}y {q2}x {formula_name}(x,y)"
+
+    def apply_nested_quantifiers(self, matrix, ids, q1, q2, order, formula_name):
+        """
+        Implementa los 6 casos sobre la matriz T (ids está en el mismo orden para X y Y).
+        Todos salen de los cuatro vectores any/all (QuantifierKernel); de la
+        matriz sólo se leen las filas o columnas de los testigos/contraejemplos.
+        Una matriz perezosa sin recorrer se lee sólo hasta decidir el caso
+        (LazyQuantifierKernel). `matrix` también puede ser ya un kernel.
+        Devuelve un QueryResult (verdad, mensaje_resumen, df_resultado, example_ids, counter_ids).
+        """
+        kernel = quantifier_kernel(matrix)
+        ids = np.asarray(ids, dtype=object)
+        example_ids = set()
+        counter_ids = set()
+        df = None
+        qstr = self.quantified_notation(q1, q2, order, formula_name)
+
+        if order not in ("X→Y", "Y→X"):
+            raise ValueError("Orden de cuantificadores no reconocido.")
+
+        # ∃∃ y ∀∀ no dependen del orden salvo en el mensaje
+        if q1 == "∃" and q2 == "∃":
+            cell = kernel.first_cell(True)
+            if cell is not None:
+                x_id, y_id = ids[cell[0]], ids[cell[1]]
+                holds = True
+                if order == "X→Y":
+                    msg = f"✅ {qstr} es VERDADERA. Testigo (x,y)=({x_id}, {y_id})."
+                    df = pd.DataFrame({"x":[x_id], "y":[y_id]})
+                else:
+                    msg = f"✅ {qstr} es VERDADERA. Testigo (y,x)=({y_id}, {x_id})."
+                    df = pd.DataFrame({"y":[y_id], "x":[x_id]})
+                example_ids.update([x_id, y_id])
+            else:
+                holds = False
+                if order == "X→Y":
+                    msg = f"❌ {qstr} es FALSA. (Toda la matriz es F). Contraejemplo: no existe ningún par (x,y) verdadero."
+                    df = pd.DataFrame(columns=["x","y"])
+                else:
+                    msg = f"❌ {qstr} es FALSA. (Toda la matriz es F)."
+                    df = pd.DataFrame(columns=["y","x"])
+            return QueryResult(holds, msg, df, example_ids, counter_ids)
+
+        if q1 == "∀" and q2 == "∀":
+            bad_coords = kernel.cells(False, RESULT_PREVIEW_PAIRS)
+            if len(bad_coords) == 0:
+                holds = True
+                msg = f"✅ {qstr} es VERDADERA (toda la matriz es V)."
+                example_ids.update(ids)
+            else:
+                rows, cols = ids[bad_coords[:, 0]], ids[bad_coords[:, 1]]
+                x_id, y_id = rows[0], cols[0]
+                holds = False
+                if order == "X→Y":
+                    msg = f"❌ {qstr} es FALSA. Contraejemplo: (x={x_id}, y={y_id}) con valor F."
+                    df = pd.DataFrame({"x": rows, "y": cols})
+                else:
+                    msg = f"❌ {qstr} es FALSA. Contraejemplo: (y={y_id}, x={x_id}) con F."
+                    df = pd.DataFrame({"y": cols, "x": rows})
+                counter_ids.update(rows)
+                counter_ids.update(cols)
+            return QueryResult(holds, msg, df, example_ids, counter_ids)
+
+        # Orden X→Y (barrido por filas)
+        if order == "X→Y":
+            if q1 == "∃" and q2 == "∀":
+                i = kernel.first_index(1, "all")
+                if i is not None:
+                    x_id = ids[i]
+                    holds = True
+                    msg = f"✅ {qstr} es VERDADERA. Testigo x={x_id} (fila completa V)."
+                    example_ids.add(x_id); example_ids.update(ids)
+                    df = pd.DataFrame({"x_testigo":[x_id]})
+                else:
+                    # contraejemplo: cualquier fila; elegimos la primera fila con algún F y señalamos un y concreto
+                    i, j = kernel.first_cell(False)
+                    x_id, y_id = ids[i], ids[j]
+                    holds = False
+                    msg = f"❌ {qstr} es FALSA. Contraejemplo: para x={x_id} existe y={y_id} con F (de hecho, toda la fila es F)."
+                    df = pd.DataFrame({"x_sin_todo_V": [x_id]})
+                    counter_ids.add(x_id); counter_ids.add(y_id)
+                return QueryResult(holds, msg, df, example_ids, counter_ids)
+
+            if q1 == "∀" and q2 == "∃":
+                bad_idxs = kernel.indices(1, "any", False)
+                if len(bad_idxs) == 0:
+                    holds = True
+                    msg = f"✅ {qstr} es VERDADERA. Cada fila tiene al menos un V."
+                    example_ids.update(ids)
+                else:
+                    # toda la fila es F; tomamos el primer y de esa fila
+                    x_id, y_id = ids[bad_idxs[0]], ids[0]
+                    holds = False
+                    msg = f"❌ {qstr} es FALSA. Contraejemplo: x={x_id} no tiene ningún y con V (por ejemplo y={y_id})."
+                    bad_ids = ids[bad_idxs]
+                    df = pd.DataFrame({"x_sin_testigo_y": bad_ids})
+                    counter_ids.update(bad_ids)
+                    counter_ids.add(y_id)
+                return QueryResult(holds, msg, df, example_ids, counter_ids)
+
+            raise ValueError("Combinación no soportada para orden X→Y.")
+
+        # Orden Y→X (barrido por columnas)
+        if q1 == "∃" and q2 == "∀":
+            j = kernel.first_index(0, "all")
+            if j is not None:
+                y_id = ids[j]
+                holds = True
+                msg = f"✅ {qstr} es VERDADERA. Testigo y={y_id} (columna completa V)."
+                example_ids.add(y_id); example_ids.update(ids)
+                df = pd.DataFrame({"y_testigo":[y_id]})
+            else:
+                j = kernel.first_index(0, "all", False)
+                i = _first_true(~kernel.column(j))
+                y_id, x_id = ids[j], ids[i]
+                holds = False
+                msg = f"❌ {qstr} es FALSA. Contraejemplo: para y={y_id} existe x={x_id} con F (de hecho, ninguna columna es toda V)."
+                df = pd.DataFrame({"y_sin_todo_V":[y_id]})
+                counter_ids.update([y_id, x_id])
+            return QueryResult(holds, msg, df, example_ids, counter_ids)
+
+        if q1 == "∀" and q2 == "∃":
+            bad_idxs = kernel.indices(0, "any", False)
+            if len(bad_idxs) == 0:
+                holds = True
+                msg = f"✅ {qstr} es VERDADERA. Cada columna tiene al menos un V."
+                example_ids.update(ids)
+            else:
+                # toda la columna es F; tomamos el primer x de esa columna
+                y_id, x_id = ids[bad_idxs[0]], ids[0]
+                holds = False
+                msg = f"❌ {qstr} es FALSA. Contraejemplo: y={y_id} no tiene ningún x con V (por ejemplo x={x_id})."
+                bad_ids = ids[bad_idxs]
+                df = pd.DataFrame({"y_sin_testigo_x": bad_ids})
+                counter_ids.update(bad_ids)
+                counter_ids.add(x_id)
+            return QueryResult(holds, msg, df, example_ids, counter_ids)
+
+        raise ValueError("Combinación no soportada para orden Y→X.")
+
+    def run_query(self, formula_name, q1, q2, order="X→Y", on_progress=None, should_cancel=None):
+        """
+        Consulta cuantificada completa: resuelve el nombre, evalúa en streaming y
+        devuelve un QueryResult. on_progress/should_cancel como en lazy_truth_matrix.
+        Con q2=None se cuantifica sólo x ("∀x P(x)"); la fórmula debe ser unaria.
+        """
+        if self.data is None:
+            raise ValueError("Carga un dataset primero.")
+        name = self.resolve_predicate_name(formula_name)
+        if not name:
+            raise ValueError(f"Predicado/Fórmula '{formula_name}' no encontrado.")
+        with self.stats.stage("query", self.quantified_notation(q1, q2, order, name)):
+            with self.stats.stage("matrix_build", name):
+                matrix, ids = self.lazy_truth_matrix(name, on_progress, should_cancel)
+            if len(ids) == 0:
+                raise ValueError("No hay dominio para X/Y (revisa la columna ID).")
+            return self._answer_query(name, matrix, ids, q1, q2, order)
+
+    def _answer_query(self, name, matrix, ids, q1, q2, order, kernel=None):
+        with self.stats.stage("quantifier", self.quantified_notation(q1, q2, order, name)) as record:
+            if q2 is None:
+                inner = matrix.matrix if isinstance(matrix, SummarizedTruthMatrix) else matrix
+                if not isinstance(inner, UnaryTruthMatrix):
+                    raise ValueError(f"La fórmula '{name}' depende de y: indica también un cuantificador para y.")
+                result = self.apply_unary_quantifier(inner.vector, ids, q1, name)
+                record.cells += len(inner.vector)
+            else:
+                kernel = kernel if kernel is not None else self._quantifier_kernel(name, matrix)
+                read = kernel.cells_read
+                result = self.apply_nested_quantifiers(kernel, ids, q1, q2, order, name)
+                record.cells += kernel.cells_read - read
+            if result.table is not None:
+                record.bytes = int(result.table.memory_usage(deep=False).sum())
+            return result
+
+    def apply_unary_quantifier(self, vector, ids, q, formula_name):
+        """∀x / ∃x sobre el vector de una fórmula unaria, en O(N). Devuelve un QueryResult."""
+        ids = np.asarray(ids, dtype=object)
+        example_ids = set()
+        counter_ids = set()
+        df = None
+        qstr = self.quantified_notation(q, None, "X→Y", formula_name)
+        if q == "∀":
+            bad_idxs = np.flatnonzero(~vector)
+            if len(bad_idxs) == 0:
+                holds = True
+                msg = f"✅ {qstr} es VERDADERA. Todas las filas cumplen {formula_name}(x)."
+                example_ids.update(ids)
+            else:
+                holds = False
+                msg = f"❌ {qstr} es FALSA. Contraejemplo: x={ids[bad_idxs[0]]} ({len(bad_idxs)} filas no cumplen)."
+                df = pd.DataFrame({"x_no_cumple": ids[bad_idxs]})
+                counter_ids.update(ids[bad_idxs])
+        elif q == "∃":
+            hits = np.flatnonzero(vector)
+            if len(hits):
+                holds = True
+                msg = f"✅ {qstr} es VERDADERA. Testigo x={ids[hits[0]]} ({len(hits)} filas cumplen)."
+                df = pd.DataFrame({"x_cumple": ids[hits]})
+                example_ids.update(ids[hits])
+            else:
+                holds = False
+                msg = f"❌ {qstr} es FALSA. Ninguna fila cumple {formula_name}(x)."
+                df = pd.DataFrame(columns=["x_cumple"])
+        else:
+            raise ValueError(f"Cuantificador no reconocido: {q}")
+        return QueryResult(holds, msg, df, example_ids, counter_ids)
+
+    def _quantifier_kernel(self, name, matrix):
+        """
+        Kernel de cuantificadores para la matriz de `name`. Una matriz perezosa
+        sin recorrer se lee sólo lo necesario y, si se termina leyendo entera,
+        queda en la caché con sus any/all como en _summarized_matrix.
+        """
+        if not isinstance(matrix, LazyTruthMatrix) or isinstance(matrix, ReducedTruthMatrix):
+            return QuantifierKernel(self._summarized_matrix(name, matrix))
+        key = self._matrix_cache_key(name)
+
+        def store(summary, built):
+            if built is not None:
+                self.matrix_cache.put(key, built)
+            self.matrix_summaries[key] = summary
+
+        return LazyQuantifierKernel(matrix, store)
+
+    def _summarized_matrix(self, name, matrix):
+        """
+        La matriz con sus cuatro vectores any/all (una pasada). Una matriz
+        perezosa se lee entera, así que en la misma pasada se arma y queda en
+        la caché; los vectores se guardan con la matriz para las próximas consultas.
+        """
+        if isinstance(matrix, SummarizedTruthMatrix):
+            return matrix
+        key = self._matrix_cache_key(name)
+        builder = None
+        if isinstance(matrix, LazyTruthMatrix) and not isinstance(matrix, ReducedTruthMatrix):
+            builder = TruthMatrixBuilder(matrix.shape)
+        summary = matrix_summary(matrix, builder)
+        record = self.stats.current()
+        if record is not None:
+            record.cells += summary_cells(matrix)
+        if builder is not None:
+            matrix = builder.result()
+            self.matrix_cache.put(key, matrix)
+            self.matrix_summaries[key] = summary
+        elif self.matrix_cache.get(key) is not None:
+            self.matrix_summaries[key] = summary
+        return SummarizedTruthMatrix(matrix, summary)
+
+    def run_batch(self, queries, on_progress=None, should_cancel=None):
+        """
+        Muchas consultas sobre el mismo dataset. Cada consulta es una tupla
+        (fórmula, q1, q2, orden) o un texto como "∀x ∃y P(x,y)". Se agrupan
+        por predicado: su matriz se obtiene una sola vez y todas sus consultas
+        comparten un kernel de cuantificadores, así que lo que una lee (o los
+        any/all completos) les sirve a las demás. Los subpredicados que comparten
+        varias fórmulas del lote se calculan una sola vez. Devuelve un DataFrame (BATCH_COLUMNS) con una fila por
+        consulta, en el orden dado; las inválidas quedan con verdadera=None y
+        el error en el mensaje. on_progress(predicados hechos, total).
+        """
+        if self.data is None:
+            raise ValueError("Carga un dataset primero.")
+        with self.stats.stage("batch", f"{len(queries)} consultas"):
+            return self._run_batch(queries, on_progress, should_cancel)
+
+    def _run_batch(self, queries, on_progress, should_cancel):
+        rows = [None] * len(queries)
+        groups = {}   # predicado -> [(posición, texto, q1, q2, orden)]
+        for pos, query in enumerate(queries):
+            text = query if isinstance(query, str) else None
+            try:
+                formula, q1, q2, order = parse_query(query) if text is not None else query
+                name = self.resolve_predicate_name(formula)
+                if not name:
+                    raise ValueError(f"Predicado/Fórmula '{formula}' no encontrado.")
+            except ValueError as e:
+                rows[pos] = {"consulta": text if text is not None else str(query), "verdadera": None,
+                             "mensaje": f"Error: {e}"}
+                continue
+            if text is None:
+                text = self.quantified_notation(q1, q2, order, formula)
+            groups.setdefault(name, []).append((pos, text, q1, q2, order))
+
+        # Los subpredicados que aparecen en varias fórmulas del lote se construyen
+        # una vez (en orden topológico, cada uno sobre los anteriores) y el resto
+        # de los planes los usa como hojas ya calculadas.
+        shared = {}
+        for node in self._shared_subpredicates(groups):
+            if should_cancel is not None and should_cancel():
+                raise JobCancelled()
+            matrix, _ = self.generate_truth_matrix(node, should_cancel=should_cancel)
+            shared[node] = matrix
+
+        for done, (name, group) in enumerate(groups.items(), start=1):
+            if should_cancel is not None and should_cancel():
+                raise JobCancelled()
+            with self.stats.stage("matrix_build", name):
+                matrix, ids = self.lazy_truth_matrix(name, should_cancel=should_cancel, known=shared)
+            # un solo kernel por predicado: lo que lee una consulta les sirve a las siguientes
+            kernel = None
+            for pos, text, q1, q2, order in group:
+                row = {"consulta": text, "formula": name, "q1": q1, "q2": q2, "orden": order}
+                try:
+                    if len(ids) == 0:
+                        raise ValueError("No hay dominio para X/Y (revisa la columna ID).")
+                    if kernel is None and q2 is not None:
+                        kernel = self._quantifier_kernel(name, matrix)
+                    result = self._answer_query(name, matrix, ids, q1, q2, order, kernel)
+                    row.update(verdadera=result.holds, mensaje=result.message)
+                except ValueError as e:
+                    row.update(verdadera=None, mensaje=f"Error: {e}")
+                rows[pos] = row
+            if on_progress is not None:
+                on_progress(done, len(groups))
+        return pd.DataFrame(rows, columns=BATCH_COLUMNS)
+
+    def _shared_subpredicates(self, names):
+        """Subpredicados que están en el plan de más de una de las fórmulas, en orden topológico."""
+        uses = {}   # nodo -> cuántos planes lo usan (el orden de inserción es topológico)
+        for name in names:
+            try:
+                plan = self.compile_formula(name)
+            except ValueError:
+                continue   # el error se informa en la fila de la consulta
+            for node in plan:
+                uses[node] = uses.get(node, 0) + 1
+        return [node for node, count in uses.items() if count > 1]
+
+    # ---------- testigos y contraejemplos completos ----------
+    def evidence(self, formula_name, q1, q2, order="X→Y", on_progress=None, should_cancel=None):
+        """
+        Todos los testigos o contraejemplos de la consulta, sin tope: devuelve
+        (columnas, trozos) con las columnas de la tabla del resultado y un
+        generador de np.ndarray de posiciones de fila en orden de la matriz
+        (k para ids sueltos; k x 2 para pares, en el orden de las columnas).
+        La memoria no depende de cuántos haya. on_progress(filas recorridas,
+        N) y should_cancel() se consultan por trozo.
+        """
+        if self.data is None:
+            raise ValueError("Carga un dataset primero.")
+        name = self.resolve_predicate_name(formula_name)
+        if not name:
+            raise ValueError(f"Predicado/Fórmula '{formula_name}' no encontrado.")
+        if order not in ("X→Y", "Y→X"):
+            raise ValueError("Orden de cuantificadores no reconocido.")
+        if q1 not in ("∀", "∃") or q2 not in ("∀", "∃", None):
+            raise ValueError(f"Cuantificador no reconocido: {q1 if q1 not in ('∀', '∃') else q2}")
+        matrix, ids = self.lazy_truth_matrix(name, should_cancel=should_cancel)
+
+        if q2 is None:
+            inner = matrix.matrix if isinstance(matrix, SummarizedTruthMatrix) else matrix
+            if not isinstance(inner, UnaryTruthMatrix):
+                raise ValueError(f"La fórmula '{name}' depende de y: indica también un cuantificador para y.")
+            columns, source = (["x_no_cumple"], iter_positions(~inner.vector)) if q1 == "∀" \
+                else (["x_cumple"], iter_positions(inner.vector))
+        else:
+            kernel = QuantifierKernel(self._summarized_matrix(name, matrix))
+            columns, source = self._evidence_source(kernel, q1, q2, order, on_progress)
+
+        def chunks():
+            for chunk in source:
+                if should_cancel is not None and should_cancel():
+                    raise JobCancelled()
+                yield chunk
+
+        return columns, chunks()
+
+    @staticmethod
+    def _evidence_source(kernel, q1, q2, order, on_progress):
+        """Columnas y trozos de posiciones de cada caso, como en apply_nested_quantifiers pero completos."""
+        by_rows = order == "X→Y"
+        if q1 == q2:
+            # ∃∃: todas las celdas V; ∀∀: todas las F (vacío si la consulta es verdadera)
+            cells = kernel.iter_cells(q1 == "∃", on_progress)
+            if by_rows:
+                return ["x", "y"], cells
+            return ["y", "x"], (chunk[:, ::-1] for chunk in cells)
+        v, w = ("x", "y") if by_rows else ("y", "x")
+        any_, all_ = (kernel.row_any, kernel.row_all) if by_rows else (kernel.col_any, kernel.col_all)
+        if q1 == "∃":
+            if all_.any():
+                return [f"{v}_testigo"], iter_positions(all_)
+            return [f"{v}_sin_todo_V"], iter_positions(~all_)
+        return [f"{v}_sin_testigo_{w}"], iter_positions(~any_)
+
+    def export_evidence(self, filename, formula_name, q1, q2, order="X→Y", on_progress=None, should_cancel=None):
+        """
+        Escribe en streaming todos los testigos/contraejemplos (ver evidence):
+        .csv o .csv.gz con los ids y las columnas de la tabla del resultado, o
+        .npy con las posiciones de fila (int64, k o k x 2) para leer con
+        np.load(..., mmap_mode="r"). Se escribe a un temporal que reemplaza al
+        archivo sólo al terminar. Devuelve cuántas filas se escribieron.
+        """
+        fmt = next((ext for ext in EXPORT_FORMATS if filename.lower().endswith(ext)), None)
+        if fmt is None:
+            raise ValueError(f"Formato de exportación no soportado (usa {', '.join(EXPORT_FORMATS)}).")
+        with self.stats.stage("export", os.path.basename(filename)) as record:
+            columns, chunks = self.evidence(formula_name, q1, q2, order, on_progress, should_cancel)
+            ids = np.asarray(self.domain_ids(), dtype=object)
+            tmp_path = filename + ".tmp"
+            try:
+                if fmt == ".npy":
+                    writer = NpyStreamWriter(tmp_path, len(columns))
+                    try:
+                        for chunk in chunks:
+                            writer.write(chunk)
+                    finally:
+                        writer.close()
+                    rows = writer.rows
+                else:
+                    # Cada id se formatea una sola vez; las líneas se arman con operaciones de arrays
+                    fields = np.array([_csv_field(v) for v in ids], dtype=object)
+                    rows = 0
+                    if fmt == ".csv.gz":
+                        f = gzip.open(tmp_path, "wt", compresslevel=6, encoding="utf-8", newline="")
+                    else:
+                        f = open(tmp_path, "w", encoding="utf-8", newline="")
+                    with f:
+                        f.write(",".join(_csv_field(c) for c in columns) + "\n")
+                        for chunk in chunks:
+                            chunk = chunk.reshape(len(chunk), -1)
+                            lines = fields[chunk[:, 0]]
+                            for col in range(1, chunk.shape[1]):
+                                lines = lines + "," + fields[chunk[:, col]]
+                            f.write("\n".join(lines.tolist()) + "\n")
+                            rows += len(chunk)
+                os.replace(tmp_path, filename)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            record.cells = rows * len(columns)
+            record.bytes = os.path.getsize(filename)
+        return rows
@@ -0,0 +1,105 @@
+"""
+Trabajos en segundo plano para la interfaz: las evaluaciones largas (matrices,
+consultas) corren en un ThreadPoolExecutor y la GUI recibe el progreso y el
+resultado desde el hilo de Tk, consultando los trabajos con root.after.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import JobCancelled
+
+JOB_POLL_MS = 100       # cada cuánto revisa la GUI los trabajos activos
+
+class Job:
+    """
+    Un trabajo enviado al ejecutor. El hilo del trabajo llama a report() y
+    consulta cancelled; la GUI sólo lee progress y llama a cancel().
+    """
+    def __init__(self, title, fn, on_done=None, on_error=None, on_progress=None, on_cancel=None):
+        self.title = title
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancel = on_cancel
+        self.progress = (0, 0)          # (hecho, total) del último report()
+        self._reported = None           # último progreso entregado a la GUI
+        self._cancel_event = threading.Event()
+        self.future = None
+
+    def report(self, done, total):
+        self.progress = (done, total)
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()        # si aún no empezó, ni siquiera corre
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def _run(self):
+        if self.cancelled:
+            raise JobCancelled()
+        return self.fn(self)
+
+class JobRunner:
+    """
+    Ejecuta trabajos en paralelo (varios a la vez) y entrega los callbacks en el
+    hilo de Tk: on_progress(hecho, total) cuando cambia, y al terminar on_done(resultado),
+    on_error(excepción) u on_cancel().
+    """
+    def __init__(self, root, max_workers=None):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1),
+                                           thread_name_prefix="logic-job")
+        self.active = []
+        self._polling = False
+
+    def submit(self, title, fn, on_done=None, on_error=None, on_progress=None, on_cancel=None):
+        """fn(job) corre en un hilo del ejecutor; devuelve el Job para poder cancelarlo."""
+        job = Job(title, fn, on_done, on_error, on_progress, on_cancel)
+        job.future = self.executor.submit(job._run)
+        self.active.append(job)
+        if not self._polling:
+            self._polling = True
+            self.root.after(JOB_POLL_MS, self._poll)
+        return job
+
+    def cancel_all(self):
+        for job in list(self.active):
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+    def _poll(self):
+        for job in list(self.active):
+            if job.progress != job._reported and job.on_progress is not None:
+                job._reported = job.progress
+                job.on_progress(*job.progress)
+            if not job.future.done():
+                continue
+            self.active.remove(job)
+            self._deliver(job)
+        if self.active:
+            self.root.after(JOB_POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def _deliver(self, job):
+        if job.future.cancelled():
+            error = JobCancelled()
+        else:
+            error = job.future.exception()
+        if isinstance(error, JobCancelled) or (error is None and job.cancelled):
+            if job.on_cancel is not None:
+                job.on_cancel()
+        elif error is not None:
+            if job.on_error is not None:
+                job.on_error(error)
+        elif job.on_done is not None:
+            job.on_done(job.future.result())
@@ -0,0 +1,344 @@
+"""
+Carga de datasets por bloques con tipos compactos. Los CSV se leen en trozos
+de LOAD_CHUNK_ROWS filas, sólo con las columnas pedidas; las fechas se
+convierten mientras se lee y cada trozo se compacta antes de juntarlos:
+enteros al tipo más pequeño, float32 cuando no se pierde precisión y texto
+repetido como categoría.
+
+El dataset ya tipado se guarda además como instantánea binaria en
+.dataset_cache/ junto al archivo: un .npy por columna (sin pickle), que se
+abre con memory map, y se reutiliza mientras el archivo de origen conserve
+fecha de modificación, tamaño y hash.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pandas.tseries.api import guess_datetime_format
+
+SNAPSHOT_FORMAT = "npy"       # un .npy por columna (y por parte: códigos, texto, offsets...)
+LOAD_CHUNK_ROWS = 200_000     # filas por trozo al leer CSV
+CATEGORY_MAX_RATIO = 0.5      # texto con a lo sumo 50% de valores distintos -> category
+SNAPSHOT_DIR = ".dataset_cache"
+SNAPSHOT_VERSION = 2          # cambia si cambia la forma de leer/compactar o de guardar
+HASH_BLOCK_BYTES = 1 << 20
+
+def is_date_column(name):
+    low = str(name).lower()
+    return 'date' in low or 'fecha' in low
+
+def dataset_columns(filename):
+    """Nombres de columna del archivo, sin leer los datos."""
+    if filename.endswith('.xlsx'):
+        return list(pd.read_excel(filename, nrows=0).columns)
+    return list(pd.read_csv(filename, nrows=0).columns)
+
+def columns_to_load(filename, wanted, id_column=None):
+    """
+    Columnas mínimas del archivo para tener `wanted` (p.ej. las de una
+    biblioteca de predicados) y elegir el ID como lo haría la carga completa:
+    la columna ID pedida o, si no, Date/Fecha y la primera columna.
+    """
+    wanted = set(wanted)
+    header = dataset_columns(filename)
+    if id_column is not None:
+        wanted.add(id_column)
+    else:
+        wanted.update(c for c in ("Date", "Fecha") if c in header)
+        if header:
+            wanted.add(header[0])
+    # Los atributos que no están en el archivo no se piden: esos predicados valen F, como siempre
+    columns = [c for c in header if c in wanted]
+    if id_column is not None and id_column not in header:
+        columns.append(id_column)   # read_dataset avisará de que no existe
+    return columns
+
+def _parse_dates(chunk, date_formats):
+    """Convierte a fecha las columnas de date_formats; el formato se deduce del primer valor y se reutiliza."""
+    for col in date_formats:
+        try:
+            if date_formats[col] is None:
+                first = chunk[col].dropna()
+                if len(first) and isinstance(first.iloc[0], str):
+                    date_formats[col] = guess_datetime_format(first.iloc[0]) or ""
+            fmt = date_formats[col] or None
+            chunk[col] = pd.to_datetime(chunk[col], format=fmt, errors='coerce')
+        except Exception:
+            pass
+    return chunk
+
+def compact_dtypes(chunk):
+    """Reduce la memoria del trozo sin cambiar ningún valor."""
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            chunk[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+            as32 = series.astype(np.float32)
+            # float32 sólo si todos los valores vuelven exactos (o eran NaN)
+            if ((as32.astype(np.float64) == series) | series.isna()).all():
+                chunk[col] = as32
+        elif series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+            if series.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(series):
+                chunk[col] = series.astype("category")
+    return chunk
+
+def _concat_column(parts, name):
+    """Une trozos de una columna; si todos son categorías, con union_categoricals."""
+    if len(parts) > 1 and all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+        try:
+            return pd.Series(union_categoricals(parts, ignore_order=True), name=name)
+        except TypeError:
+            pass   # categorías de tipos distintos: se unen como valores sueltos
+    return pd.concat(parts, ignore_index=True)
+
+def _concat_chunks(chunks, columns):
+    """Une los trozos columna a columna; las categorías se unen con union_categoricals."""
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    data = {col: _concat_column([chunk[col] for chunk in chunks], col) for col in columns}
+    return pd.DataFrame(data, columns=columns)
+
+def append_frame(data, rows):
+    """
+    data con rows agregadas al final, con los tipos de data: las fechas nuevas
+    se convierten y las categorías se amplían. ValueError si faltan columnas.
+    """
+    missing = [c for c in data.columns if c not in rows.columns]
+    if missing:
+        raise ValueError(f"A las filas nuevas les faltan columnas: {', '.join(map(str, missing))}")
+    rows = rows[list(data.columns)].reset_index(drop=True)
+    columns = {}
+    for col in data.columns:
+        new = rows[col]
+        if pd.api.types.is_datetime64_any_dtype(data[col]) and not pd.api.types.is_datetime64_any_dtype(new):
+            new = pd.to_datetime(new, errors='coerce')
+        elif isinstance(data[col].dtype, pd.CategoricalDtype):
+            new = new.astype("category")
+        columns[col] = _concat_column([data[col], new], col)
+    return pd.DataFrame(columns, columns=data.columns)
+
+def read_dataset(filename, usecols=None, chunksize=LOAD_CHUNK_ROWS, on_progress=None):
+    """
+    Lee CSV/Excel y convierte a fecha las columnas con 'date'/'fecha' en el nombre.
+    usecols limita las columnas leídas (ValueError si alguna no existe).
+    on_progress(bytes leídos, bytes totales) se llama tras cada trozo.
+    """
+    header = dataset_columns(filename)
+    if usecols is not None:
+        missing = [c for c in usecols if c not in header]
+        if missing:
+            raise ValueError(f"Columnas no encontradas en el dataset: {', '.join(map(str, missing))}")
+        columns = [c for c in header if c in set(usecols)]
+    else:
+        columns = header
+    date_formats = {col: None for col in columns if is_date_column(col)}
+
+    if filename.endswith('.xlsx'):
+        # read_excel no lee por trozos: una sola pasada con las columnas pedidas
+        data = pd.read_excel(filename, usecols=columns)
+        data = compact_dtypes(_parse_dates(data, date_formats))
+        if on_progress is not None:
+            on_progress(1, 1)
+        return data
+
+    total = os.path.getsize(filename)
+    chunks = []
+    with open(filename, "rb") as f:
+        for chunk in pd.read_csv(f, usecols=columns, chunksize=chunksize):
+            chunks.append(compact_dtypes(_parse_dates(chunk[columns], date_formats)))
+            if on_progress is not None:
+                on_progress(min(f.tell(), total), total)
+    return _concat_chunks(chunks, columns)
+
+def choose_id_column(data):
+    """
+    Elección inteligente de ID por defecto: Date/Fecha si identifican filas de
+    forma única; si no, la primera columna única; si no hay, Date/Fecha o la primera.
+    """
+    cols = list(data.columns)
+    unique_cols = [col for col in cols if data[col].is_unique]
+    for preferred in ("Date", "Fecha"):
+        if preferred in unique_cols:
+            return preferred
+    if unique_cols:
+        return unique_cols[0]
+    for preferred in ("Date", "Fecha"):
+        if preferred in cols:
+            return preferred
+    return cols[0] if cols else None
+
+# ---------- instantáneas binarias ----------
+def source_fingerprint(filename):
+    """Fecha de modificación, tamaño y hash (BLAKE2b) del archivo de origen."""
+    stat = os.stat(filename)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest.hexdigest()}
+
+def snapshot_paths(filename, usecols=None):
+    """(carpeta de datos, metadatos) de la instantánea de ese archivo con esas columnas."""
+    folder = os.path.join(os.path.dirname(os.path.abspath(filename)), SNAPSHOT_DIR)
+    cols_key = "all" if usecols is None else hashlib.blake2b(
+        json.dumps(sorted(map(str, usecols))).encode("utf-8"), digest_size=4).hexdigest()
+    base = os.path.join(folder, f"{os.path.basename(filename)}-{cols_key}")
+    return f"{base}.{SNAPSHOT_FORMAT}", f"{base}.json"
+
+def _text_parts(values):
+    """
+    Texto sin objetos de Python: todos los valores unidos en UTF-8, dónde
+    empieza cada uno (en caracteres) y cuáles no son NA. ValueError si hay
+    valores que no son texto.
+    """
+    valid = ~pd.isna(values)
+    texts = [v for v in values[valid]]
+    if not all(isinstance(v, str) for v in texts):
+        raise ValueError("columna con valores que no son texto")
+    lengths = np.zeros(len(values) + 1, dtype=np.int64)
+    lengths[1:][valid] = [len(v) for v in texts]
+    return {"text": np.frombuffer("".join(texts).encode("utf-8"), dtype=np.uint8),
+            "offsets": np.cumsum(lengths), "valid": valid}
+
+def _text_values(parts):
+    """Inversa de _text_parts: arreglo object con los textos y NaN donde faltaban."""
+    text = parts["text"].tobytes().decode("utf-8")
+    offsets = parts["offsets"].tolist()
+    values = np.full(len(offsets) - 1, np.nan, dtype=object)
+    for i in np.flatnonzero(parts["valid"]).tolist():
+        values[i] = text[offsets[i]:offsets[i + 1]]
+    return values
+
+def _column_parts(series):
+    """
+    (descripción, arreglos) con que se guarda una columna: los tipos de NumPy
+    tal cual; fechas con zona horaria en UTC; categorías como códigos más sus
+    categorías; texto con _text_parts. ValueError si el tipo no se puede guardar.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        spec, parts = _column_parts(pd.Series(dtype.categories))
+        parts = {f"categories.{k}": v for k, v in parts.items()}
+        parts["codes"] = series.cat.codes.to_numpy()
+        return {"kind": "category", "ordered": bool(dtype.ordered), "categories": spec}, parts
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return ({"kind": "datetimetz", "tz": str(dtype.tz)},
+                {"values": series.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()})
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        return {"kind": "array"}, {"values": series.to_numpy()}
+    if dtype == object or isinstance(dtype, pd.StringDtype):
+        return {"kind": "text", "dtype": str(dtype)}, _text_parts(series.to_numpy(dtype=object))
+    raise ValueError(f"tipo de columna no soportado en la instantánea: {dtype}")
+
+def _column_from_parts(spec, parts):
+    """Inversa de _column_parts; los arreglos numéricos quedan sobre el memory map."""
+    kind = spec["kind"]
+    if kind == "category":
+        sub = {k[len("categories."):]: v for k, v in parts.items() if k.startswith("categories.")}
+        categories = _column_from_parts(spec["categories"], sub)
+        return pd.Series(pd.Categorical.from_codes(parts["codes"], categories=categories,
+                                                   ordered=spec["ordered"]))
+    if kind == "datetimetz":
+        return pd.Series(parts["values"], copy=False).dt.tz_localize("UTC").dt.tz_convert(spec["tz"])
+    if kind == "array":
+        return pd.Series(parts["values"], copy=False)
+    return pd.Series(_text_values(parts), dtype=spec["dtype"])
+
+def _write_snapshot_data(folder, data):
+    """Escribe los .npy de cada columna y schema.json en folder."""
+    schema = []
+    for number, name in enumerate(data.columns):
+        spec, parts = _column_parts(data[name])
+        for part, array in parts.items():
+            np.save(os.path.join(folder, f"{number}.{part}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+        schema.append({"name": name, "spec": spec, "parts": sorted(parts)})
+    with open(os.path.join(folder, "schema.json"), "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False)
+
+def _read_snapshot_data(folder):
+    """DataFrame de una carpeta escrita por _write_snapshot_data, abriendo cada .npy con memory map."""
+    with open(os.path.join(folder, "schema.json"), encoding="utf-8") as f:
+        schema = json.load(f)
+    columns = {}
+    for number, column in enumerate(schema):
+        # np.asarray: vista ndarray común sobre el memory map (no np.memmap)
+        parts = {part: np.asarray(np.load(os.path.join(folder, f"{number}.{part}.npy"), mmap_mode="r",
+                                          allow_pickle=False))
+                 for part in column["parts"]}
+        columns[column["name"]] = _column_from_parts(column["spec"], parts)
+    return pd.DataFrame(columns, columns=[c["name"] for c in schema], copy=False)
+
+def load_snapshot(filename, usecols=None):
+    """(datos, metadatos) si hay una instantánea válida para el archivo tal como está ahora; si no, None."""
+    data_path, meta_path = snapshot_paths(filename, usecols)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        stat = os.stat(filename)
+    except (OSError, ValueError):
+        return None
+    source = meta.get("source", {})
+    if (meta.get("version") != SNAPSHOT_VERSION or meta.get("format") != SNAPSHOT_FORMAT
+            or meta.get("pandas") != pd.__version__
+            or source.get("mtime_ns") != stat.st_mtime_ns or source.get("size") != stat.st_size):
+        return None
+    if source.get("hash") != source_fingerprint(filename)["hash"]:
+        return None
+    try:
+        data = _read_snapshot_data(data_path)
+    except Exception:
+        return None
+    return data, meta
+
+def save_snapshot(filename, data, id_column, usecols=None, fingerprint=None):
+    """Guarda la instantánea; si no se puede escribir (carpeta de sólo lectura...), no pasa nada."""
+    data_path, meta_path = snapshot_paths(filename, usecols)
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "format": SNAPSHOT_FORMAT,
+        "pandas": pd.__version__,
+        "source": fingerprint or source_fingerprint(filename),
+        "id_column": id_column,
+        "columns": [str(c) for c in data.columns],
+    }
+    tmp_path = data_path + ".tmp"
+    try:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        _write_snapshot_data(tmp_path, data.reset_index(drop=True))
+        # La carpeta vieja se borra antes: os.replace no reemplaza carpetas con contenido
+        shutil.rmtree(data_path, ignore_errors=True)
+        os.replace(tmp_path, data_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        os.replace(meta_path + ".tmp", meta_path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def open_dataset(filename, usecols=None, id_column=None, on_progress=None, use_snapshot=True):
+    """
+    Dataset listo para usar: de la instantánea si sigue siendo válida o, si
+    no, leyendo el archivo (y guardando la instantánea). Devuelve
+    (datos, columna ID, desde_instantánea); la columna ID pedida tiene prioridad.
+    """
+    if use_snapshot:
+        cached = load_snapshot(filename, usecols)
+        if cached is not None:
+            data, meta = cached
+            if on_progress is not None:
+                on_progress(1, 1)
+            return data, id_column or meta.get("id_column"), True
+
+    fingerprint = source_fingerprint(filename) if use_snapshot else None
+    data = read_dataset(filename, usecols=usecols, on_progress=on_progress)
+    auto_id = choose_id_column(data)
+    if use_snapshot:
+        save_snapshot(filename, data, auto_id, usecols, fingerprint)
+    return data, id_column or auto_id, False